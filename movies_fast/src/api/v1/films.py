@@ -1,9 +1,14 @@
 from http import HTTPStatus
 from uuid import UUID
 
+from api.v1.http_cache import cached_response, conditional_response, save_response
+from api.v1.pagination import cursor_response
 from api.v1.schemas import Film, SquareBracketsParams
-from fastapi import APIRouter, Depends, HTTPException, Query
+from core.config import settings
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from services.film import FilmService, get_film_service
+from services.genre import GenreService, get_genre_service
+from services.response_cache import ResponseCacheService, get_response_cache_service
 
 router = APIRouter()
 
@@ -14,45 +19,13 @@ def get_sq_params(
         page_num: int | None = Query(0, alias="page[number]", ge=0),
         page_size: int | None = Query(10, alias="page[size]", ge=1),
         filter_genre: str | None = Query(None, alias="filter[genre]"),
+        cursor: str | None = Query(None, alias="page[cursor]",
+                                   description="Курсор страницы: * - первая, далее - из заголовка X-Next-Cursor"),
+        genre_service: GenreService = Depends(get_genre_service),
 ) -> SquareBracketsParams:
-    return SquareBracketsParams(page_num=page_num, page_size=page_size, filter_genre=filter_genre)
-
-
-async def prepare_film_result(film) -> Film:
-    genres = []
-    for item in film.genres:
-        genres.append(item.dict(exclude={'description', 'created', 'modified'}))
-
-    persons = {
-        'actor': [],
-        'writer': [],
-        'director': []
-    }
-    writes_names = []
-    actors_names = []
-    directors_names = []
-    for item in film.persons:
-        persons[item.role].append({'id': item.id, 'name': item.full_name})
-        if item.role == 'actor':
-            actors_names.append(item.full_name)
-        if item.role == 'writer':
-            writes_names.append(item.full_name)
-        if item.role == 'director':
-            directors_names.append(item.full_name)
-
-    return Film(
-        id=film.id,
-        imdb_rating=film.imdb_rating,
-        genre=genres,
-        title=film.title,
-        description=film.description,
-        director=directors_names,
-        actors_names=actors_names,
-        writers_names=writes_names,
-        actors=persons['actor'],
-        writers=persons['writer'],
-        directors=persons['director']
-    )
+    # жанр в фильтре можно задать и id, и названием (по каталогу жанров)
+    return SquareBracketsParams(page_num=page_num, page_size=page_size, cursor=cursor,
+                                filter_genre=genre_service.resolve_genre(filter_genre))
 
 
 @router.get("/search",
@@ -63,19 +36,31 @@ async def prepare_film_result(film) -> Film:
                                  'сценаристами и режиссерами',
             tags=['Полнотекстовый поиск'])
 async def list_films_query(query: str | None,
-                     film_service: FilmService = Depends(get_film_service),
-                     qp: SquareBracketsParams = Depends(get_sq_params),
-                     sort: str = "-imdb_rating") -> list[Film]:
-    films = await film_service.get_by_query(page=qp.page_num, page_size=qp.page_size, filter_genre=qp.filter_genre,
-                                            sort=sort, query=query)
+                           request: Request,
+                           response: Response,
+                           film_service: FilmService = Depends(get_film_service),
+                           qp: SquareBracketsParams = Depends(get_sq_params),
+                           response_cache: ResponseCacheService = Depends(get_response_cache_service),
+                           sort: str = "-imdb_rating") -> list[Film] | Response:
+    if qp.cursor:
+        page = film_service.get_raw_by_cursor(qp.cursor, page_size=qp.page_size,
+                                              filter_genre=qp.filter_genre, sort=sort, query=query)
+        return await cursor_response(request, qp.cursor, page, Film.from_doc,
+                                     settings.film_list_http_max_age, FILMS_404)
+    cached = await cached_response(request, response_cache, settings.film_list_http_max_age)
+    if cached:
+        return cached
+    films = await film_service.get_raw_by_query(page=qp.page_num, page_size=qp.page_size,
+                                                filter_genre=qp.filter_genre, sort=sort, query=query)
     if not films:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=FILMS_404)
+    not_modified = conditional_response(request, response, films, settings.film_list_http_max_age)
+    if not_modified:
+        return not_modified
 
-    result = []
-    for item in films:
-        result.append(await prepare_film_result(item))
+    result = [Film.from_doc(item) for item in films]
 
-    return result
+    return await save_response(request, response, response_cache, result)
 
 
 @router.get("/{film_id}",
@@ -85,12 +70,24 @@ async def list_films_query(query: str | None,
             response_description='Кинопроизведение с названием, рейтингом, жанрами, актерами, '
                                  'сценаристами и режиссерами',
             tags=['Полнотекстовый поиск'])
-async def film_details(film_id: UUID, film_service: FilmService = Depends(get_film_service), ) -> Film:
-    film = await film_service.get_by_id(film_id)
+async def film_details(film_id: UUID,
+                       request: Request,
+                       response: Response,
+                       film_service: FilmService = Depends(get_film_service),
+                       response_cache: ResponseCacheService = Depends(get_response_cache_service),
+                       ) -> Film | Response:
+    cached = await cached_response(request, response_cache, settings.film_http_max_age)
+    if cached:
+        return cached
+    film = await film_service.get_raw_by_id(film_id)
     if not film:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=FILMS_404)
+    not_modified = conditional_response(request, response, film, settings.film_http_max_age)
+    if not_modified:
+        return not_modified
 
-    return await prepare_film_result(film)
+    result = Film.from_doc(film)
+    return await save_response(request, response, response_cache, result)
 
 
 @router.get("",
@@ -100,16 +97,28 @@ async def film_details(film_id: UUID, film_service: FilmService = Depends(get_fi
             response_description='Кинопроизведение с названием, рейтингом, жанрами, актерами, '
                                  'сценаристами и режиссерами',
             tags=['Полнотекстовый поиск'])
-async def list_films(film_service: FilmService = Depends(get_film_service),
+async def list_films(request: Request,
+                     response: Response,
+                     film_service: FilmService = Depends(get_film_service),
                      qp: SquareBracketsParams = Depends(get_sq_params),
-                     sort: str = "-imdb_rating") -> list[Film]:
-    films = await film_service.get_by_query(page=qp.page_num, page_size=qp.page_size, filter_genre=qp.filter_genre,
-                                            sort=sort, query=None)
+                     response_cache: ResponseCacheService = Depends(get_response_cache_service),
+                     sort: str = "-imdb_rating") -> list[Film] | Response:
+    if qp.cursor:
+        page = film_service.get_raw_by_cursor(qp.cursor, page_size=qp.page_size,
+                                              filter_genre=qp.filter_genre, sort=sort, query=None)
+        return await cursor_response(request, qp.cursor, page, Film.from_doc,
+                                     settings.film_list_http_max_age, FILMS_404)
+    cached = await cached_response(request, response_cache, settings.film_list_http_max_age)
+    if cached:
+        return cached
+    films = await film_service.get_raw_by_query(page=qp.page_num, page_size=qp.page_size,
+                                                filter_genre=qp.filter_genre, sort=sort, query=None)
     if not films:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=FILMS_404)
+    not_modified = conditional_response(request, response, films, settings.film_list_http_max_age)
+    if not_modified:
+        return not_modified
 
-    result = []
-    for item in films:
-        result.append(await prepare_film_result(item))
+    result = [Film.from_doc(item) for item in films]
 
-    return result
+    return await save_response(request, response, response_cache, result)
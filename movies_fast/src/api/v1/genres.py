@@ -1,9 +1,12 @@
 from http import HTTPStatus
 from uuid import UUID
 
+from api.v1.http_cache import cached_response, conditional_response, save_response
 from api.v1.schemas import Genre, PageParams
-from fastapi import APIRouter, Depends, HTTPException, Query
+from core.config import settings
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from services.genre import GenreService, get_genre_service
+from services.response_cache import ResponseCacheService, get_response_cache_service
 
 router = APIRouter()
 
@@ -31,12 +34,22 @@ def get_pg_params(
 )
 async def genre_details(
     genre_id: UUID,
+    request: Request,
+    response: Response,
     genre_service: GenreService = Depends(get_genre_service),
-) -> Genre:
-    genre = await genre_service.get_by_id(genre_id)
+    response_cache: ResponseCacheService = Depends(get_response_cache_service),
+) -> Genre | Response:
+    cached = await cached_response(request, response_cache, settings.genre_http_max_age)
+    if cached:
+        return cached
+    genre = await genre_service.get_raw_by_id(genre_id)
     if not genre:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=GENRES_404)
-    return Genre(id=genre.id, name=genre.name)
+    not_modified = conditional_response(request, response, genre, settings.genre_http_max_age)
+    if not_modified:
+        return not_modified
+    result = Genre(id=genre["id"], name=genre["name"])
+    return await save_response(request, response, response_cache, result)
 
 
 @router.get(
@@ -48,15 +61,24 @@ async def genre_details(
     tags=["genres"],
 )
 async def genre_list(
+    request: Request,
+    response: Response,
     genre_service: GenreService = Depends(get_genre_service),
     qp: PageParams = Depends(get_pg_params),
-) -> list[Genre]:
-    genres = await genre_service.get_genre_list(qp.page_num, qp.page_size)
+    response_cache: ResponseCacheService = Depends(get_response_cache_service),
+) -> list[Genre] | Response:
+    cached = await cached_response(request, response_cache, settings.genre_list_http_max_age)
+    if cached:
+        return cached
+    genres = await genre_service.get_raw_genre_list(qp.page_num, qp.page_size)
     if not genres:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=GENRES_404)
+    not_modified = conditional_response(request, response, genres, settings.genre_list_http_max_age)
+    if not_modified:
+        return not_modified
     # преобразовывает ответ сервиса, состоящий из списка моделей бизнес-логики
     # в список моделей апи
     genre_models = []
     for genre in genres:
-        genre_models.append(Genre(id=genre.id, name=genre.name))
-    return genre_models
+        genre_models.append(Genre(id=genre["id"], name=genre["name"]))
+    return await save_response(request, response, response_cache, genre_models)
@@ -0,0 +1,126 @@
+"""Условные HTTP-запросы (ETag, Cache-Control и ответы 304) и кэш готовых ответов.
+
+ETag считается по данным из кэша сервиса (словарям, из которых собирается
+ответ), а не по телу ответа: так при совпадении If-None-Match ручка
+отвечает 304, не собирая модели ответа и не сериализуя их. Одинаковые
+данные дают одинаковый ETag во всех воркерах, поэтому клиенты и CDN могут
+перепроверять ответы у любого из них.
+"""
+
+import hashlib
+from http import HTTPStatus
+from typing import Any
+
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from services.response_cache import ResponseCacheService
+
+JSON_MEDIA_TYPE = "application/json"
+# увеличивается при изменении формата ответов, чтобы клиенты не получили
+# 304 на копию в старом формате
+ETAG_VERSION = 1
+
+
+def make_etag(payload: Any) -> str:
+    """Слабый ETag данных ответа: ответ собирается из них однозначно."""
+    digest = hashlib.blake2b(orjson.dumps([ETAG_VERSION, payload]), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Сравнивает ETag с заголовком If-None-Match (слабое сравнение)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def cache_headers(etag: str, max_age: int) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+
+
+def not_modified_response(request: Request, headers: dict[str, str]) -> Response | None:
+    """Ответ 304, если у клиента копия с тем же ETag."""
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return None
+
+
+def conditional_response(
+    request: Request, response: Response, payload: Any, max_age: int,
+) -> Response | None:
+    """Проставляет валидаторы ответа и возвращает ответ 304, если у клиента актуальная копия.
+
+    Если вернулся None, ручка собирает тело ответа как обычно: заголовки
+    уже записаны в response.
+    """
+    headers = cache_headers(make_etag(payload), max_age)
+    not_modified = not_modified_response(request, headers)
+    if not_modified is None:
+        response.headers.update(headers)
+    return not_modified
+
+
+async def cached_response(
+    request: Request, response_cache: ResponseCacheService, max_age: int,
+) -> Response | None:
+    """Готовый ответ из кэша ответов (или 304), None - если его там нет."""
+    cached = await response_cache.get(*_response_key(request))
+    if cached is None:
+        return None
+    etag, body = cached
+    headers = cache_headers(etag, max_age)
+    return not_modified_response(request, headers) or Response(
+        content=body, media_type=JSON_MEDIA_TYPE, headers=headers,
+    )
+
+
+async def save_response(
+    request: Request,
+    response: Response,
+    response_cache: ResponseCacheService,
+    result: Any,
+) -> Response:
+    """Сериализует результат ручки и сохраняет его в кэш ответов.
+
+    Заголовки берутся из response, куда их записал conditional_response.
+    """
+    body = dumps_response(result)
+    etag = response.headers["ETag"]
+    await response_cache.save(*_response_key(request), etag, body)
+    return Response(
+        content=body,
+        media_type=JSON_MEDIA_TYPE,
+        headers={"ETag": etag, "Cache-Control": response.headers["Cache-Control"]},
+    )
+
+
+def dumps_response(result: Any) -> bytes:
+    """Сериализует модели ответа в JSON.
+
+    Результат совпадает с jsonable_encoder + ORJSONResponse, которые
+    использует FastAPI, для моделей без дат: UUID orjson пишет сам,
+    а вложенные модели превращает в словари dict().
+    """
+    return orjson.dumps(result, default=_encode_model)
+
+
+def _encode_model(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.dict(by_alias=True)
+    raise TypeError
+
+
+def _response_key(request: Request) -> tuple[str, dict]:
+    """Шаблон маршрута и нормализованные параметры запроса."""
+    query = sorted(
+        (name, value) for name, value in request.query_params.multi_items() if value
+    )
+    return request.scope["route"].path, {"path": request.path_params, "query": query}
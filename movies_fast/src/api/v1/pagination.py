@@ -0,0 +1,49 @@
+"""Ответы страниц, запрошенных по курсору (page[cursor]).
+
+Первую страницу клиент запрашивает с page[cursor]=*, курсор следующей
+страницы приходит в заголовке X-Next-Cursor; на последней странице
+заголовка нет. Параметр page[number] при этом не используется. Пустая
+страница после курсора - обычный конец выдачи (если последняя страница
+была полной), а не ошибка 404.
+"""
+
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException, Request, Response
+
+from api.v1.http_cache import JSON_MEDIA_TYPE, cache_headers, dumps_response, make_etag, not_modified_response
+from db.cursor import CURSOR_START, InvalidCursorError
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+INVALID_CURSOR = "Invalid page cursor"
+
+
+async def cursor_response(
+    request: Request,
+    cursor: str,
+    page: Awaitable[tuple[list[dict], str | None] | None],
+    build: Callable[[dict], Any],
+    max_age: int,
+    not_found: str,
+) -> Response:
+    """Собирает ответ страницы по курсору.
+
+    Такие ответы не попадают в кэш ответов: в нём хранится только тело,
+    а курсор следующей страницы передаётся заголовком.
+    """
+    try:
+        result = await page
+    except InvalidCursorError:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=INVALID_CURSOR)
+    if not result or (not result[0] and cursor == CURSOR_START):
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=not_found)
+    items, next_cursor = result
+    headers = cache_headers(make_etag([items, next_cursor]), max_age)
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    return not_modified_response(request, headers) or Response(
+        content=dumps_response([build(item) for item in items]),
+        media_type=JSON_MEDIA_TYPE,
+        headers=headers,
+    )
@@ -1,9 +1,13 @@
 from http import HTTPStatus
 from uuid import UUID
 
+from api.v1.http_cache import cached_response, conditional_response, save_response
+from api.v1.pagination import cursor_response
 from api.v1.schemas import MovieShortInfo, PageParams, PersonInfo
-from fastapi import APIRouter, Depends, HTTPException, Query
+from core.config import settings
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from services.person import PersonService, get_person_service
+from services.response_cache import ResponseCacheService, get_response_cache_service
 
 router = APIRouter()
 
@@ -21,6 +25,19 @@ def get_pg_params(
     )
 
 
+def get_cursor_pg_params(
+    qp: PageParams = Depends(get_pg_params),
+    cursor: str | None = Query(
+        None,
+        alias="page[cursor]",
+        description="Курсор страницы: * - первая, далее - из заголовка X-Next-Cursor",
+    ),
+) -> PageParams:
+    """Параметры страницы с выдачей по курсору (см. api.v1.pagination)."""
+    qp.cursor = cursor
+    return qp
+
+
 @router.get(
     "/search",
     response_model=list[PersonInfo],
@@ -30,18 +47,30 @@ def get_pg_params(
     tags=["persons"],
 )
 async def person_search(
+    request: Request,
+    response: Response,
     person_service: PersonService = Depends(get_person_service),
     qp: PageParams = Depends(get_pg_params),
     query: str = Query(""),
-) -> list[PersonInfo]:
+    response_cache: ResponseCacheService = Depends(get_response_cache_service),
+) -> list[PersonInfo] | Response:
+    cached = await cached_response(request, response_cache, settings.person_search_http_max_age)
+    if cached:
+        return cached
     persons = await person_service.search_person(query, qp.page_num, qp.page_size)
     if not persons:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail=PERSON_404,
         )
+    not_modified = conditional_response(
+        request, response, persons, settings.person_search_http_max_age,
+    )
+    if not_modified:
+        return not_modified
     # преобразовывает ответ сервиса, состоящий из списка моделей бизнес-логики
     # в список моделей апи
-    return [PersonInfo(**person) for person in persons]
+    result = [PersonInfo(**person) for person in persons]
+    return await save_response(request, response, response_cache, result)
 
 
 @router.get(
@@ -54,15 +83,37 @@ async def person_search(
 )
 async def person_films(
     person_id: UUID,
+    request: Request,
+    response: Response,
     person_service: PersonService = Depends(get_person_service),
-    qp: PageParams = Depends(get_pg_params),
-) -> list[MovieShortInfo]:
+    qp: PageParams = Depends(get_cursor_pg_params),
+    response_cache: ResponseCacheService = Depends(get_response_cache_service),
+) -> list[MovieShortInfo] | Response:
+    if qp.cursor:
+        page = person_service.get_pers_films_by_cursor(person_id, qp.cursor, qp.page_size)
+        return await cursor_response(
+            request,
+            qp.cursor,
+            page,
+            lambda film: MovieShortInfo(**film),
+            settings.person_films_http_max_age,
+            PERSON_FILMS_404,
+        )
+    cached = await cached_response(request, response_cache, settings.person_films_http_max_age)
+    if cached:
+        return cached
     films = await person_service.get_pers_films(person_id, qp.page_num, qp.page_size)
     if not films:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail=PERSON_FILMS_404,
         )
-    return [MovieShortInfo(**film) for film in films]
+    not_modified = conditional_response(
+        request, response, films, settings.person_films_http_max_age,
+    )
+    if not_modified:
+        return not_modified
+    result = [MovieShortInfo(**film) for film in films]
+    return await save_response(request, response, response_cache, result)
 
 
 @router.get(
@@ -75,9 +126,18 @@ async def person_films(
 )
 async def person_details(
     person_id: UUID,
+    request: Request,
+    response: Response,
     person_service: PersonService = Depends(get_person_service),
-) -> PersonInfo:
+    response_cache: ResponseCacheService = Depends(get_response_cache_service),
+) -> PersonInfo | Response:
+    cached = await cached_response(request, response_cache, settings.person_http_max_age)
+    if cached:
+        return cached
     person = await person_service.get_by_id(person_id)
     if not person:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=PERSON_404)
-    return PersonInfo(**person)
+    not_modified = conditional_response(request, response, person, settings.person_http_max_age)
+    if not_modified:
+        return not_modified
+    return await save_response(request, response, response_cache, PersonInfo(**person))
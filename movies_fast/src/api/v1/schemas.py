@@ -8,6 +8,8 @@ class PageParams(BaseModel):
 
     page_num: int | None
     page_size: int | None
+    # курсор страницы (см. api.v1.pagination), если задан - page_num не используется
+    cursor: str | None = None
 
 
 class SquareBracketsParams(PageParams):
@@ -57,3 +59,29 @@ class Film(BaseModel):
     actors: list[Person] | None
     writers: list[Person] | None
     directors: list[Person] | None
+
+    @classmethod
+    def from_doc(cls, film: dict) -> "Film":
+        """Собирает ответ за один проход по документу фильма из индекса.
+
+        Документы попадают в кэш только из нашего индекса Elasticsearch
+        и уже соответствуют схеме, поэтому модели создаются через
+        construct(), без повторной проверки полей.
+        """
+        actors = [Person.construct(id=item["id"], name=item["name"]) for item in film["actors"]]
+        writers = [Person.construct(id=item["id"], name=item["name"]) for item in film["writers"]]
+        directors = [Person.construct(id=item["id"], name=item["name"]) for item in film["directors"]]
+        return cls.construct(
+            id=film["id"],
+            # без проверки целый рейтинг из документа не стал бы float
+            imdb_rating=None if film["imdb_rating"] is None else float(film["imdb_rating"]),
+            genre=[Genre.construct(id=item["id"], name=item["name"]) for item in film["genre"]],
+            title=film["title"],
+            description=film["description"],
+            director=[person.name for person in directors],
+            actors_names=[person.name for person in actors],
+            writers_names=[person.name for person in writers],
+            actors=actors,
+            writers=writers,
+            directors=directors,
+        )
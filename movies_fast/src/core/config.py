@@ -17,6 +17,102 @@ class Settings(BaseSettings):
     # Настройки Elasticsearch
     elastic_host: str = "127.0.0.1"
     elastic_port: int = 9200
+    # Время жизни point in time для выдачи по курсору (например, "1m"),
+    # None - курсоры без PIT
+    es_pit_keep_alive: str | None = None
+    # Бюджет времени на обработку запроса в секундах (None - без ограничения)
+    # и бюджеты ручек по префиксу пути, например {"/api/v1/films/search": 1}
+    # (см. core.deadline). Команда Redis ждёт не больше доли deadline_redis_share
+    # оставшегося бюджета, чтобы при промахе кэша осталось время на запрос
+    # к базе, а запись в кэш пропускается, если бюджета меньше reserve секунд
+    request_deadline: float | None = None
+    request_deadlines: dict[str, float] = {}
+    deadline_redis_share: float = 0.5
+    deadline_cache_write_reserve: float = 0.05
+    # Предохранители Redis и Elasticsearch: сколько сбоев подряд его размыкают
+    # и через сколько секунд (удваивая до max) пропускается пробный запрос
+    circuit_breaker_enabled: bool = True
+    circuit_breaker_failure_threshold: int = 5
+    circuit_breaker_recovery_timeout: float = 1
+    circuit_breaker_max_recovery_timeout: float = 30
+    # Повторы временно неудачных запросов к Elasticsearch с экспоненциальной задержкой
+    es_retries: int = 2
+    es_retry_base_delay: float = 0.05
+    es_retry_max_delay: float = 1
+    # Дублирование медленных запросов на чтение к Elasticsearch (db.hedging):
+    # дубль отправляется, если ответа нет дольше процентиля percentile времени
+    # ответа этого типа запроса (но не меньше min_delay секунд), max_rate -
+    # наибольшая доля дублируемых запросов, min_samples - сколько замеров
+    # нужно, прежде чем дублировать запросы этого типа
+    es_hedging_enabled: bool = False
+    es_hedge_percentile: float = 0.95
+    es_hedge_min_delay: float = 0.01
+    es_hedge_max_rate: float = 0.05
+    es_hedge_min_samples: int = 100
+    # Объединение одновременных поисков воркера в _msearch (db.msearch):
+    # сколько секунд копить поиски и сколько поисков не больше в одной пачке
+    es_msearch_enabled: bool = False
+    es_msearch_window: float = 0.002
+    es_msearch_max_batch: int = 50
+    # Объединение запросов объектов по id в _mget с кэшем на время HTTP-запроса (db.mget)
+    es_mget_batching_enabled: bool = False
+    # Настройки in-process кэша (L1) каждого воркера
+    local_cache_max_size: int = 1024
+    local_cache_ttl: int = 30
+    # Формат значений кэша в Redis: orjson или msgpack, сжатие: zstd, lz4 или нет
+    cache_codec: str = "orjson"
+    cache_compression: str | None = None
+    cache_compress_min_size: int = 1024
+    # Сколько секунд воркер помнит поколение ключей кэша, не перечитывая его
+    cache_generation_ttl: float = 5
+    # Досрочное обновление кэша (коэффициент beta алгоритма XFetch, 0 - выключено),
+    # случайный разброс времени жизни ключей (доля от срока) и мягкий срок
+    # записей в секундах, после которого они обновляются в фоне, по сервисам
+    film_cache_refresh_beta: float = 1.0
+    film_cache_expire_jitter: float = 0.1
+    film_cache_soft_expire: int = 60 * 60
+    genre_cache_refresh_beta: float = 1.0
+    genre_cache_expire_jitter: float = 0.1
+    genre_cache_soft_expire: int = 60 * 60
+    person_cache_refresh_beta: float = 1.0
+    person_cache_expire_jitter: float = 0.1
+    person_cache_soft_expire: int = 60 * 60
+    # Фильтры существующих id для ответов 404 без запросов в базу: ожидаемое
+    # число объектов в индексе, доля ложных срабатываний, как часто воркер
+    # перечитывает фильтры из Redis и как часто они строятся заново (секунды).
+    # Включать, только если ETL публикует изменения каталога (services.invalidation),
+    # иначе новые объекты будут ненайденными до пересборки фильтров
+    existence_filter_enabled: bool = False
+    existence_filter_capacity: int = 100_000
+    existence_filter_error_rate: float = 0.01
+    existence_filter_refresh_interval: float = 60
+    existence_filter_rebuild_interval: float = 60 * 60 * 24
+    # Cache-Control: max-age ответов ручек в секундах
+    film_http_max_age: int = 60
+    film_list_http_max_age: int = 60
+    genre_http_max_age: int = 60 * 10
+    genre_list_http_max_age: int = 60 * 10
+    person_http_max_age: int = 60
+    person_search_http_max_age: int = 60
+    person_films_http_max_age: int = 60
+    # Кэш готовых ответов ручек: время жизни в секундах и его случайный разброс
+    response_cache_enabled: bool = False
+    response_cache_ttl: int = 60
+    response_cache_expire_jitter: float = 0.1
+    # Индекс ролей персон (services.person_roles) и как часто он строится заново (секунды).
+    # Включать, только если ETL публикует изменения каталога (services.invalidation),
+    # иначе роли персон будут отставать от фильмов до пересборки индекса
+    person_roles_enabled: bool = False
+    person_roles_rebuild_interval: float = 60 * 60 * 24
+    # Каталог жанров в памяти воркера и период его перечитывания в секундах.
+    # Включать, только если ETL публикует изменения каталога (services.invalidation),
+    # иначе новые и удалённые жанры попадут в списки только после перечитывания
+    genre_catalog_enabled: bool = False
+    genre_catalog_refresh_interval: float = 60
+    # Прогрев кэша: при старте (не дольше timeout секунд) и затем каждые interval секунд
+    cache_warmup_enabled: bool = True
+    cache_warmup_timeout: float = 30
+    cache_warmup_interval: float = 60 * 10
 
     class Config:
         """Настройки настроек."""
@@ -0,0 +1,128 @@
+"""Бюджет времени (deadline) на обработку HTTP-запроса.
+
+Без общего ограничения запрос может потратить всё время на ожидание
+Redis и после этого ещё начать поиск в Elasticsearch. DeadlineMiddleware
+задаёт каждому запросу момент, к которому ответ должен быть готов
+(по префиксу пути, см. Settings.request_deadlines), и кладёт его в
+контекстную переменную. Хранилища берут таймауты своих вызовов из
+оставшегося бюджета и пропускают необязательную работу (запись в кэш),
+когда времени мало. Если бюджет исчерпан до ответа базы, запрос
+завершается DeadlineExceededError (ответ 504).
+
+Фоновые задачи (обновление кэша, пачки _mget) не должны наследовать
+бюджет запроса, который их запустил: они выполняются через without_deadline.
+"""
+
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, TypeVar
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from core.metrics import DEADLINE_EXCEEDED
+
+T = TypeVar("T")
+
+# момент (time.monotonic), к которому должен быть готов ответ, None - без ограничения
+request_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """Бюджет времени запроса исчерпан до ответа хранилища."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded waiting for {stage}")
+        self.stage = stage
+
+
+def remaining() -> float | None:
+    """Сколько секунд осталось от бюджета запроса, None - бюджета нет."""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def has_time(reserve: float) -> bool:
+    """Осталось ли от бюджета больше reserve секунд (без бюджета - всегда да)."""
+    left = remaining()
+    return left is None or left > reserve
+
+
+async def wait(awaitable: Awaitable[T], stage: str, share: float = 1, cancel: bool = True) -> T:
+    """Ждёт результат не дольше доли share оставшегося бюджета.
+
+    stage - хранилище или этап для метрики и текста ошибки. cancel=False -
+    вызов не отменяется, а доделывается в фоне: так отказываются от
+    ожидания команд aioredis, отмена которых может вернуть в пул соединение
+    с непрочитанным ответом.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        # бюджет уже исчерпан: вызов не начинается
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        DEADLINE_EXCEEDED.labels(stage).inc()
+        raise DeadlineExceededError(stage)
+    task = asyncio.ensure_future(awaitable)
+    try:
+        await asyncio.wait({task}, timeout=left * share)
+    except asyncio.CancelledError:
+        if cancel:
+            task.cancel()
+        raise
+    if task.done():
+        return task.result()
+    if cancel:
+        task.cancel()
+    else:
+        # исключение доделанного в фоне вызова никто не заберёт
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    DEADLINE_EXCEEDED.labels(stage).inc()
+    raise DeadlineExceededError(stage)
+
+
+async def without_deadline(func: Callable[[], Awaitable[T]]) -> T:
+    """Выполняет func без бюджета запроса (для задач, переживающих запрос).
+
+    Задача получает копию контекста, поэтому бюджет сбрасывается только в ней.
+    """
+    request_deadline.set(None)
+    return await func()
+
+
+class DeadlineMiddleware:
+    """ASGI middleware: бюджет времени каждого HTTP-запроса.
+
+    default - бюджет в секундах, routes - бюджеты по префиксам пути
+    (выбирается самый длинный подходящий префикс), None - без ограничения.
+    """
+
+    def __init__(self, app: ASGIApp, default: float | None = None, routes: dict[str, float] | None = None):
+        self.app = app
+        self.default = default
+        # длинные префиксы проверяются первыми
+        self.routes = sorted((routes or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def budget(self, path: str) -> float | None:
+        for prefix, seconds in self.routes:
+            if path.startswith(prefix):
+                return seconds
+        return self.default
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        budget = self.budget(scope["path"])
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+        token = request_deadline.set(time.monotonic() + budget)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
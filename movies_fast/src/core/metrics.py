@@ -0,0 +1,192 @@
+"""Метрики Prometheus.
+
+Gunicorn запускает несколько воркеров, поэтому метрики собираются
+в multiprocess-режиме prometheus_client: каждый воркер пишет значения
+в файлы каталога PROMETHEUS_MULTIPROC_DIR (см. run.sh и gunicorn.conf.py),
+а ручка /metrics любого воркера суммирует файлы всех воркеров. Без этой
+переменной окружения (локальный запуск uvicorn) метрики отдаются из
+реестра процесса.
+"""
+
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# размеры тел ответов и значений кэша, байт
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"],
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Размер тела HTTP-ответа",
+    ["method", "route"],
+    buckets=SIZE_BUCKETS,
+)
+
+# layer: local - in-process кэш воркера, redis - общий кэш
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Обращения к кэшу по результату: hit, miss, error",
+    ["layer", "namespace", "result"],
+)
+# layer: local - L1, local_ttl - сроки записей L2, известные L1, stale - копии
+# для stale-if-error, memory - MemoryCacheStorage (см. db.local_cache.LRUCache)
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total",
+    "Записи, вытесненные из кэша в памяти воркера при переполнении",
+    ["layer"],
+)
+CACHE_SIZE = Gauge(
+    "cache_size",
+    "Число записей в кэшах в памяти, сумма по живым воркерам",
+    ["layer"],
+    multiprocess_mode="livesum",
+)
+CACHE_PAYLOAD_SIZE = Histogram(
+    "cache_payload_size_bytes",
+    "Размер значений кэша в Redis",
+    ["namespace", "operation"],
+    buckets=SIZE_BUCKETS,
+)
+CACHE_REFRESHES = Counter(
+    "cache_refreshes_total",
+    "Загрузки в кэш: miss - при промахе, early - досрочные, stale - устаревших записей, "
+    "error - неудачные фоновые, stale_if_error - отдана копия после ошибки загрузки",
+    ["namespace", "kind"],
+)
+
+ES_REQUEST_DURATION = Histogram(
+    "elasticsearch_request_duration_seconds",
+    "Время запроса к Elasticsearch со стороны клиента",
+    ["query"],
+)
+ES_TOOK = Histogram(
+    "elasticsearch_took_seconds",
+    "Время выполнения запроса самим Elasticsearch (поле took)",
+    ["query"],
+)
+ES_HITS = Histogram(
+    "elasticsearch_hits",
+    "Число документов в ответе Elasticsearch",
+    ["query"],
+    buckets=(0, 1, 5, 10, 20, 50, 100, 500, 1000),
+)
+ES_ERRORS = Counter(
+    "elasticsearch_errors_total",
+    "Ошибки запросов к Elasticsearch",
+    ["query", "error"],
+)
+ES_BATCH_SIZE = Histogram(
+    "elasticsearch_batch_size",
+    "Число запросов, объединённых в один _msearch или _mget",
+    ["operation"],
+    buckets=(1, 2, 5, 10, 20, 50, 100),
+)
+# result: sent - отправлен дубль, won - дубль ответил первым,
+# capped - дубль не отправлен из-за ограничения их доли
+ES_HEDGED_REQUESTS = Counter(
+    "elasticsearch_hedged_requests_total",
+    "Дубли медленных запросов на чтение к Elasticsearch",
+    ["query", "result"],
+)
+
+# name - хранилище: redis или elasticsearch
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Состояние предохранителя: 0 - замкнут, 1 - пробный запрос, 2 - разомкнут",
+    ["name"],
+    multiprocess_mode="livemax",
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total",
+    "Переходы предохранителя в состояние state",
+    ["name", "state"],
+)
+CIRCUIT_BREAKER_REJECTED = Counter(
+    "circuit_breaker_rejected_total",
+    "Запросы, не отправленные в хранилище из-за разомкнутого предохранителя",
+    ["name"],
+)
+# stage: redis, elasticsearch или cache_write - пропущенная запись в кэш
+DEADLINE_EXCEEDED = Counter(
+    "deadline_exceeded_total",
+    "Вызовы хранилищ, прерванные или пропущенные из-за исчерпанного бюджета времени запроса",
+    ["stage"],
+)
+
+EXISTENCE_FILTER_CHECKS = Counter(
+    "existence_filter_checks_total",
+    "Проверки фильтров существующих id: rejected - id точно нет, "
+    "false_positive - пропущенный фильтром id не нашёлся в базе",
+    ["namespace", "result"],
+)
+
+
+def generate_metrics() -> tuple[bytes, str]:
+    """Возвращает метрики всех воркеров в текстовом формате Prometheus."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def cache_namespace(key: str) -> str:
+    """Пространство имён ключа кэша (см. db.cache_keys) для меток метрик."""
+    return key.split(":", 1)[0]
+
+
+class MetricsMiddleware:
+    """ASGI middleware: время обработки и размер ответа по маршрутам.
+
+    Метка route - шаблон пути маршрута (/api/v1/films/{film_id}), а не сам
+    путь, иначе число временных рядов росло бы с числом id. Запросы, не
+    попавшие ни в один маршрут, учитываются под меткой unmatched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # маршрут в scope записывает роутер FastAPI
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.labels(method, path, status).observe(
+                time.perf_counter() - started,
+            )
+            HTTP_RESPONSE_SIZE.labels(method, path).observe(size)
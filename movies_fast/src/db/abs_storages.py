@@ -1,20 +1,65 @@
 """Модуль определяет абстрактные классы для работы с хранилищами."""
 
 from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Awaitable, Callable
 from uuid import UUID
 
 
 class BaseCacheStorage(ABC):
+    """Кэш объектов. Ключи строятся вызывающим кодом (см. db.cache_keys)."""
+
     @abstractmethod
-    async def get_object(self, object_id: UUID) -> dict | None:
-        """Возвращает словарь с данными объекта по id в кэше."""
+    async def get_object(self, key: str) -> dict | None:
+        """Возвращает словарь с данными объекта по ключу в кэше."""
+        pass
+
+    @abstractmethod
+    async def get_with_ttl(self, key: str) -> tuple[Any | None, float | None]:
+        """Возвращает значение (объект или список) и оставшееся время его жизни.
+
+        Время жизни в секундах, None - если значения нет или срок неизвестен.
+        """
         pass
 
     @abstractmethod
-    async def save_object(self, object_id: UUID, body: dict) -> None:
+    async def save_object(self, key: str, body: dict) -> None:
         """Сохраняет объект в кэш."""
         pass
 
+    @abstractmethod
+    async def get_objects(self, keys: list[str]) -> list[dict | None]:
+        """Возвращает объекты по списку ключей одним запросом.
+
+        Порядок результата совпадает с порядком ключей, ненайденные - None.
+        """
+        pass
+
+    @abstractmethod
+    async def save_objects(
+        self, objs: dict[str, dict], expire: dict[str, int] | None = None,
+    ) -> None:
+        """Сохраняет в кэш несколько объектов (ключ -> объект) одним запросом.
+
+        В expire можно передать время жизни (в секундах) отдельных ключей,
+        для остальных используется время жизни хранилища.
+        """
+        pass
+
+    @abstractmethod
+    async def delete_objects(self, keys: list[str]) -> None:
+        """Удаляет объекты из кэша."""
+        pass
+
+    @abstractmethod
+    async def get_id_list(self, key: str) -> list[str] | None:
+        """Возвращает упорядоченный список id объектов по ключу."""
+        pass
+
+    @abstractmethod
+    async def save_id_list(self, key: str, ids: list[str]) -> None:
+        """Сохраняет упорядоченный список id объектов по ключу в кэш."""
+        pass
+
     @abstractmethod
     async def get_list_objects(self, key: str) -> list[dict] | None:
         """Возвращает список объектов (словарей) по ключу."""
@@ -25,6 +70,32 @@ class BaseCacheStorage(ABC):
         """Сохраняет список объектов (словарей) по ключу в кэш."""
         pass
 
+    @abstractmethod
+    async def get_bytes(self, key: str) -> bytes | None:
+        """Возвращает значение по ключу как есть, без разбора."""
+        pass
+
+    @abstractmethod
+    async def save_bytes(self, key: str, data: bytes) -> None:
+        """Сохраняет в кэш уже сериализованное значение."""
+        pass
+
+    @abstractmethod
+    async def get_generation(self, namespace: str) -> int | None:
+        """Возвращает текущее поколение ключей пространства имён.
+
+        None - кэш недоступен и поколение неизвестно.
+        """
+        pass
+
+    @abstractmethod
+    async def incr_generation(self, namespace: str) -> int | None:
+        """Увеличивает поколение ключей пространства имён и возвращает новое.
+
+        None - кэш недоступен и поколение не увеличено.
+        """
+        pass
+
 
 class BaseDbStorage(ABC):
     @abstractmethod
@@ -32,6 +103,11 @@ class BaseDbStorage(ABC):
         """Возвращает жанр по id."""
         pass
 
+    @abstractmethod
+    async def get_genres(self, genre_ids: list[UUID]) -> list[dict]:
+        """Возвращает найденные жанры по списку id."""
+        pass
+
     @abstractmethod
     async def get_list_genre(
         self, offset: int = 0, limit: int = 10
@@ -44,16 +120,76 @@ class BaseDbStorage(ABC):
         """Возвращает персону по id."""
         pass
 
+    @abstractmethod
+    async def get_persons(self, person_ids: list[UUID]) -> list[dict]:
+        """Возвращает найденных персон по списку id."""
+        pass
+
     @abstractmethod
     async def get_film(self, film_id: UUID) -> dict | None:
         """Получить фильм по id."""
         pass
 
+    @abstractmethod
+    async def get_films(self, film_ids: list[UUID]) -> list[dict]:
+        """Возвращает найденные фильмы по списку id."""
+        pass
+
+    @abstractmethod
+    async def get_all_genres(self) -> list[dict]:
+        """Возвращает все жанры."""
+        pass
+
+    @abstractmethod
+    def get_genre_ids(self) -> AsyncIterator[str]:
+        """Перебирает id всех жанров."""
+        pass
+
+    @abstractmethod
+    def get_person_ids(self) -> AsyncIterator[str]:
+        """Перебирает id всех персон."""
+        pass
+
+    @abstractmethod
+    def get_film_ids(self) -> AsyncIterator[str]:
+        """Перебирает id всех фильмов."""
+        pass
+
     @abstractmethod
     async def get_person_details(self, person_id: UUID) -> dict | None:
         """Получить детали персоны (фильмы, роли) по id."""
         pass
 
+    @abstractmethod
+    async def get_person_roles(self, person_ids: list[UUID]) -> dict[str, dict]:
+        """Возвращает готовые роли и фильмы персон (id персоны -> детали).
+
+        Персон, которых ещё нет в индексе ролей, в результате нет.
+        """
+        pass
+
+    @abstractmethod
+    async def update_person_roles(self, person_ids: list[UUID], index_name: str | None = None) -> int:
+        """Пересчитывает роли и фильмы персон в индексе ролей."""
+        pass
+
+    @abstractmethod
+    async def build_person_roles(self, updated_ids: Callable[[], Awaitable[list[str]]] | None = None) -> int:
+        """Строит индекс ролей всех персон заново.
+
+        updated_ids возвращает персон, пересчитанных во время сборки: перед
+        подключением нового индекса они пересчитываются и в нём.
+        """
+        pass
+
+    @abstractmethod
+    async def get_persons_details(self, person_ids: list[UUID]) -> dict[str, dict]:
+        """Получить детали (фильмы, роли) сразу нескольких персон.
+
+        Возвращает словарь: строковый id персоны -> детали.
+        """
+        pass
+
     @abstractmethod
     async def search_person(
         self, query: str, offset: int = 0, limit: int = 10
@@ -72,6 +208,20 @@ class BaseDbStorage(ABC):
         """Поиск фильмов с пагинацией и фильтрацией."""
         pass
 
+    @abstractmethod
+    async def search_film_page(self,
+                               cursor: str,
+                               query: str | None = None,
+                               filter_genre: UUID | None = None,
+                               limit: int = 10,
+                               sort: str = '-imdb_rating',
+                               ) -> tuple[list[dict], str | None] | None:
+        """Поиск фильмов постранично по курсору (см. db.cursor).
+
+        Возвращает страницу и курсор следующей страницы, None - если страница последняя.
+        """
+        pass
+
     @abstractmethod
     async def get_pers_films(
         self,
@@ -81,3 +231,10 @@ class BaseDbStorage(ABC):
     ) -> list[dict] | None:
         """Возвращает список фильмов заданной персоны."""
         pass
+
+    @abstractmethod
+    async def get_pers_films_page(
+        self, person_id: UUID, cursor: str, limit: int = 10,
+    ) -> tuple[list[dict], str | None] | None:
+        """Фильмы персоны постранично по курсору и курсор следующей страницы."""
+        pass
@@ -0,0 +1,73 @@
+"""Фильтр Блума - компактное множество с вероятностной проверкой вхождения.
+
+Фильтр может ошибиться только в одну сторону: сказать, что элемент есть,
+когда его нет (ложное срабатывание). Если фильтр говорит, что элемента нет,
+его точно нет. Биты хранятся в том же порядке, что и в строках Redis
+(бит 0 - старший бит первого байта), поэтому фильтр можно сохранить
+в Redis командой SET и дополнять командой SETBIT.
+"""
+
+import hashlib
+import math
+from typing import Iterable
+
+
+class BloomFilter:
+    """Фильтр Блума на size битах с hash_count хэш-функциями."""
+
+    def __init__(self, size: int, hash_count: int, bits: bytes | None = None):
+        self.size = size
+        self.hash_count = hash_count
+        length = (size + 7) // 8
+        # строка Redis, дополненная SETBIT, может быть короче фильтра
+        self.bits = bytearray(bits or b"")[:length].ljust(length, b"\0")
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        """Создаёт фильтр на capacity элементов с заданной долей ложных срабатываний."""
+        size, hash_count = cls.optimal_params(capacity, error_rate)
+        return cls(size, hash_count)
+
+    @staticmethod
+    def optimal_params(capacity: int, error_rate: float) -> tuple[int, int]:
+        """Возвращает размер фильтра в битах и число хэш-функций."""
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hash_count = max(1, round(size / capacity * math.log(2)))
+        return size, hash_count
+
+    def positions(self, item: str) -> list[int]:
+        return bit_positions(item, self.size, self.hash_count)
+
+    def add(self, item: str) -> list[int]:
+        """Добавляет элемент и возвращает номера его битов."""
+        positions = self.positions(item)
+        for pos in positions:
+            self.bits[pos >> 3] |= 0x80 >> (pos & 7)
+        return positions
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (0x80 >> (pos & 7)) for pos in self.positions(item))
+
+    def fill_ratio(self) -> float:
+        """Доля установленных битов."""
+        return sum(bin(byte).count("1") for byte in self.bits) / self.size
+
+    def estimated_error_rate(self) -> float:
+        """Ожидаемая доля ложных срабатываний при текущем заполнении."""
+        return self.fill_ratio() ** self.hash_count
+
+
+def bit_positions(item: str, size: int, hash_count: int) -> list[int]:
+    """Номера битов элемента в фильтре из size битов (двойное хэширование одним blake2b).
+
+    Не требует самого фильтра: по ним можно дополнить копию фильтра в Redis,
+    пока локальная копия не загружена.
+    """
+    digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:], "big") | 1
+    return [(h1 + i * h2) % size for i in range(hash_count)]
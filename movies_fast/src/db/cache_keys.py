@@ -0,0 +1,104 @@
+"""Построение ключей кэша.
+
+Ключ имеет вид "{namespace}:v{generation}:{suffix}". У каждого вида данных
+(фильм, страница поиска фильмов, персона и т.д.) своё пространство имён,
+поэтому одинаковые id разных сущностей не пересекаются. Параметры запросов
+(в том числе произвольные поисковые строки) в ключ попадают только в виде
+хэша. Увеличение поколения пространства имён делает недоступными сразу все
+его ключи - без SCAN/DEL, старые записи просто доживают свой срок в Redis.
+
+Если поколение прочитать не удалось (Redis недоступен), используется
+последнее известное. Если его нет, ключи получают поколение
+UNKNOWN_GENERATION, и общий кэш для них не используется: поколение 0
+могло бы вернуть записи, сброшенные до этого.
+"""
+
+import hashlib
+import time
+from typing import Any
+from uuid import UUID
+
+import orjson
+
+from db.abs_storages import BaseCacheStorage
+
+UNKNOWN_GENERATION = "v?"
+
+
+def has_generation(key: str) -> bool:
+    """Известно ли поколение, с которым построен ключ."""
+    parts = key.split(":", 2)
+    return len(parts) < 2 or parts[1] != UNKNOWN_GENERATION
+
+
+class CacheKeys:
+    """Ключи кэша одного пространства имён.
+
+    Текущее поколение хранится в кэше (Redis) и запоминается в процессе на
+    generation_ttl секунд, чтобы не делать лишний запрос при каждом
+    построении ключа. Поэтому другие воркеры увидят новое поколение
+    не позже, чем через generation_ttl секунд.
+    """
+
+    def __init__(self, cache_stor: BaseCacheStorage, namespace: str, generation_ttl: float = 5):
+        self.cache_stor = cache_stor
+        self.namespace = namespace
+        self.generation_ttl = generation_ttl
+        # None - поколение ещё ни разу не удалось прочитать
+        self._generation: int | None = None
+        self._checked_at: float | None = None
+
+    async def entity(self, obj_id: UUID | str) -> str:
+        """Ключ отдельного объекта."""
+        return f"{await self._prefix()}:{obj_id}"
+
+    async def entities(self, obj_ids: list[UUID | str]) -> list[str]:
+        """Ключи нескольких объектов, порядок сохраняется."""
+        prefix = await self._prefix()
+        return [f"{prefix}:{obj_id}" for obj_id in obj_ids]
+
+    async def query(self, **params: Any) -> str:
+        """Ключ результата запроса с заданными параметрами."""
+        return f"{await self._prefix()}:{self.hash_params(params)}"
+
+    async def invalidate(self) -> int | None:
+        """Делает недоступными все ключи пространства имён.
+
+        Возвращает новое поколение, None - если увеличить его не удалось.
+        """
+        generation = await self.cache_stor.incr_generation(self.namespace)
+        if generation is None:
+            # поколение перечитается при следующем построении ключа
+            self._checked_at = None
+            return None
+        self._generation = generation
+        self._checked_at = time.monotonic()
+        return generation
+
+    def forget_generation(self) -> None:
+        """Заставляет перечитать поколение при следующем построении ключа."""
+        self._checked_at = None
+
+    def set_generation(self, generation: int) -> None:
+        """Запоминает поколение, увеличенное другим воркером (старое не возвращается)."""
+        if self._generation is None or generation > self._generation:
+            self._generation = generation
+            self._checked_at = time.monotonic()
+
+    @staticmethod
+    def hash_params(params: dict) -> str:
+        data = orjson.dumps(params, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    async def _prefix(self) -> str:
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.generation_ttl:
+            generation = await self.cache_stor.get_generation(self.namespace)
+            # при сбое остаётся последнее известное поколение, а чтение
+            # повторяется при следующем построении ключа
+            if generation is not None:
+                self._generation = generation
+                self._checked_at = now
+        if self._generation is None:
+            return f"{self.namespace}:{UNKNOWN_GENERATION}"
+        return f"{self.namespace}:v{self._generation}"
@@ -0,0 +1,125 @@
+"""Предохранитель (circuit breaker) и экспоненциальная задержка повторов.
+
+Когда Redis или Elasticsearch лежит или отвечает слишком медленно, каждый
+запрос ждёт полный таймаут клиента, а цикл событий воркера забивается
+зависшими корутинами. Предохранитель считает сбои подряд и после
+failure_threshold из них размыкается: запросы к хранилищу не делаются
+вовсе (кэш пропускается, запрос к базе сразу завершается ошибкой). Через
+время восстановления предохранитель пропускает один пробный запрос
+(half-open): удачный замыкает его, неудачный снова размыкает на вдвое
+больший срок (не дольше max_recovery_timeout). Сроки и задержки повторов
+случайно сокращаются, чтобы воркеры не обращались к хранилищу одновременно.
+"""
+
+import random
+import time
+
+from core.metrics import CIRCUIT_BREAKER_REJECTED, CIRCUIT_BREAKER_STATE, CIRCUIT_BREAKER_TRANSITIONS
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# значения метрики состояния
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Хранилище недоступно: предохранитель разомкнут, запрос не выполнялся."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.1f} s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Задержка перед повтором номер attempt (с 0): экспонента со случайным разбросом (full jitter)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class Backoff:
+    """Повторы временно неудачных запросов с экспоненциальной задержкой."""
+
+    def __init__(self, retries: int, base_delay: float, max_delay: float):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+
+class CircuitBreaker:
+    """Предохранитель одного хранилища в одном воркере."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        recovery_timeout: float,
+        max_recovery_timeout: float,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.state = CLOSED
+        self.failures = 0
+        # сколько раз подряд предохранитель размыкался без успешного запроса
+        self.opened = 0
+        self.open_until = 0.0
+        self.probe_started: float | None = None
+        CIRCUIT_BREAKER_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    def allow(self) -> bool:
+        """Можно ли сейчас обращаться к хранилищу."""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == OPEN and now >= self.open_until:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # пробный запрос один; если он завис или его отменили, через
+            # recovery_timeout пропускается следующий
+            if self.probe_started is None or now - self.probe_started >= self.recovery_timeout:
+                self.probe_started = now
+                return True
+        CIRCUIT_BREAKER_REJECTED.labels(self.name).inc()
+        return False
+
+    def retry_after(self) -> float:
+        """Через сколько секунд предохранитель пропустит пробный запрос."""
+        return max(0.0, self.open_until - time.monotonic())
+
+    def check(self) -> None:
+        """Вызывает CircuitOpenError, если обращаться к хранилищу нельзя."""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def success(self) -> None:
+        self.failures = 0
+        if self.state != CLOSED:
+            self.opened = 0
+            self.probe_started = None
+            self._set_state(CLOSED)
+
+    def failure(self) -> None:
+        self.failures += 1
+        # сбои запросов, начатых до размыкания, срок не продлевают
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self._open()
+
+    def _open(self) -> None:
+        self.opened += 1
+        timeout = min(self.max_recovery_timeout, self.recovery_timeout * 2 ** (self.opened - 1))
+        # разброс в пределах половины срока, чтобы воркеры пробовали в разное время
+        self.open_until = time.monotonic() + timeout * random.uniform(0.5, 1)
+        self.probe_started = None
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str) -> None:
+        if state == self.state:
+            return
+        self.state = state
+        CIRCUIT_BREAKER_STATE.labels(self.name).set(STATE_VALUES[state])
+        CIRCUIT_BREAKER_TRANSITIONS.labels(self.name, state).inc()
@@ -0,0 +1,212 @@
+"""Сериализация значений кэша.
+
+Каждое значение в кэше начинается с байта-заголовка, в котором записаны
+формат (orjson, msgpack) и алгоритм сжатия (zstd, lz4 или без сжатия).
+Так значения, записанные с другими настройками, остаются читаемыми.
+Значения без заголовка - старые записи в JSON - читаются как JSON.
+
+msgpack, zstandard и lz4 - необязательные зависимости: если библиотека не
+установлена, соответствующий формат нельзя выбрать для записи, а записи
+в нём при чтении считаются промахом кэша.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# JSON-документ (старый формат записей) всегда начинается с печатного символа,
+# поэтому байты заголовка берутся из диапазона управляющих символов
+MAX_HEADER = 0x1F
+
+
+class CodecError(Exception):
+    """Значение кэша не удалось разобрать."""
+
+
+class BaseCodec(ABC):
+    """Формат сериализации объектов в байты."""
+
+    id: int
+    name: str
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Any:
+        pass
+
+
+class OrjsonCodec(BaseCodec):
+    id = 1
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(BaseCodec):
+    id = 2
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise CodecError("msgpack is not installed")
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+class BaseCompressor(ABC):
+    """Алгоритм сжатия сериализованного значения."""
+
+    id: int
+    name: str
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        pass
+
+
+class ZstdCompressor(BaseCompressor):
+    id = 1
+    name = "zstd"
+
+    def __init__(self, level: int = 3):
+        if zstandard is None:
+            raise CodecError("zstandard is not installed")
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+
+class Lz4Compressor(BaseCompressor):
+    id = 2
+    name = "lz4"
+
+    def __init__(self):
+        if lz4_frame is None:
+            raise CodecError("lz4 is not installed")
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4_frame.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lz4_frame.decompress(data)
+
+
+CODECS = {codec.name: codec for codec in (OrjsonCodec, MsgpackCodec)}
+COMPRESSORS = {comp.name: comp for comp in (ZstdCompressor, Lz4Compressor)}
+
+
+def _header(codec_id: int, compressor_id: int) -> int:
+    return compressor_id << 2 | codec_id
+
+
+class CacheSerializer:
+    """Переводит значения кэша в байты с заголовком и обратно.
+
+    Пишет выбранным форматом, а сжимает только значения не меньше
+    compress_min_size байт - маленькие документы сжатие лишь увеличивает.
+    Читает любой известный формат.
+    """
+
+    def __init__(
+        self,
+        codec: str = "orjson",
+        compression: str | None = None,
+        compress_min_size: int = 1024,
+    ):
+        if codec not in CODECS:
+            raise CodecError(f"Unknown cache codec: {codec}")
+        if compression and compression not in COMPRESSORS:
+            raise CodecError(f"Unknown cache compression: {compression}")
+        self.codec = CODECS[codec]()
+        self.compressor = COMPRESSORS[compression]() if compression else None
+        self.compress_min_size = compress_min_size
+        # форматы и алгоритмы для чтения создаются по мере необходимости
+        self._codecs: dict[int, BaseCodec] = {self.codec.id: self.codec}
+        self._compressors: dict[int, BaseCompressor] = {}
+        if self.compressor:
+            self._compressors[self.compressor.id] = self.compressor
+
+    def dumps(self, obj: Any) -> bytes:
+        data = self.codec.dumps(obj)
+        compressor_id = 0
+        if self.compressor and len(data) >= self.compress_min_size:
+            data = self.compressor.compress(data)
+            compressor_id = self.compressor.id
+        return bytes((_header(self.codec.id, compressor_id),)) + data
+
+    def loads(self, data: bytes | str) -> Any:
+        if isinstance(data, str):
+            data = data.encode()
+        if not data:
+            raise CodecError("Empty cache value")
+        header = data[0]
+        try:
+            if header > MAX_HEADER:
+                # старая запись без заголовка - обычный JSON
+                return orjson.loads(data)
+            codec = self._get_codec(header & 0b11)
+            compressor_id = header >> 2
+            payload = memoryview(data)[1:]
+            if compressor_id:
+                payload = self._get_compressor(compressor_id).decompress(payload)
+            return codec.loads(payload)
+        except CodecError:
+            raise
+        except Exception as e:
+            raise CodecError(f"Broken cache value: {e}") from e
+
+    def _get_codec(self, codec_id: int) -> BaseCodec:
+        if codec_id not in self._codecs:
+            for codec_cls in CODECS.values():
+                if codec_cls.id == codec_id:
+                    self._codecs[codec_id] = codec_cls()
+                    break
+            else:
+                raise CodecError(f"Unknown cache codec id: {codec_id}")
+        return self._codecs[codec_id]
+
+    def _get_compressor(self, compressor_id: int) -> BaseCompressor:
+        if compressor_id not in self._compressors:
+            for comp_cls in COMPRESSORS.values():
+                if comp_cls.id == compressor_id:
+                    self._compressors[compressor_id] = comp_cls()
+                    break
+            else:
+                raise CodecError(f"Unknown cache compression id: {compressor_id}")
+        return self._compressors[compressor_id]
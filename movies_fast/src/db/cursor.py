@@ -0,0 +1,50 @@
+"""Курсоры постраничной выдачи по ключу (search_after).
+
+Страница from/size заставляет Elasticsearch перебрать все предыдущие
+документы, а дальше index.max_result_window (10 000) запрос не выполняется
+вовсе. Курсор хранит значения сортировки последнего документа страницы,
+и следующая страница начинается сразу после него. Если поиск идёт в
+point in time (PIT), курсор хранит и его id, чтобы все страницы читались
+из одного снимка индекса.
+
+Для клиента курсор - непрозрачная строка (base64url от JSON).
+"""
+
+import base64
+import binascii
+from typing import Any
+
+import orjson
+
+# курсор первой страницы
+CURSOR_START = "*"
+
+
+class InvalidCursorError(ValueError):
+    """Курсор не выдан сервисом или повреждён."""
+
+
+def encode_cursor(search_after: list[Any], pit_id: str | None = None) -> str:
+    data = orjson.dumps({"after": search_after, "pit": pit_id})
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, sort_size: int) -> tuple[list[Any] | None, str | None]:
+    """Значения сортировки и id PIT из курсора, для первой страницы - (None, None).
+
+    sort_size - число полей сортировки запроса: курсор другого запроса
+    с другой сортировкой не подходит. В поиске с PIT Elasticsearch добавляет
+    в сортировку поле _shard_doc, и значений может быть на одно больше.
+    """
+    if cursor == CURSOR_START:
+        return None, None
+    try:
+        data = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        search_after, pit_id = data["after"], data["pit"]
+    except (binascii.Error, orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+        raise InvalidCursorError(cursor)
+    if not isinstance(search_after, list) or not (pit_id is None or isinstance(pit_id, str)):
+        raise InvalidCursorError(cursor)
+    if not (len(search_after) == sort_size or pit_id and len(search_after) == sort_size + 1):
+        raise InvalidCursorError(cursor)
+    return search_after, pit_id
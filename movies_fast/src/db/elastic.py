@@ -1,29 +1,117 @@
+import asyncio
 import json
+import time
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable
 from uuid import UUID
 
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch import (
+    AsyncElasticsearch,
+    ConnectionError as ESConnectionError,
+    NotFoundError,
+    RequestError,
+    TransportError,
+)
+from elasticsearch.helpers import async_bulk, async_scan
 
+from core import deadline
+from core.deadline import DeadlineExceededError
+from core.metrics import ES_ERRORS, ES_HITS, ES_REQUEST_DURATION, ES_TOOK
 from db.abs_storages import BaseDbStorage
+from db.circuit_breaker import Backoff, CircuitBreaker
+from db.cursor import InvalidCursorError, decode_cursor, encode_cursor
+from db.hedging import Hedger
+from db.mget import MgetLoader
+from db.msearch import SearchBatcher
 from db.el_queries import GET_PERSON_FILMS, PERSON_SEARCH_FUZZY
 
 MOVIES_INDEX = "movies"
 GENRES_INDEX = "genres"
 PERSONS_INDEX = "persons"
+# псевдоним индекса ролей персон: при полной пересборке он переключается
+# на новый индекс PERSON_ROLES_INDEX_<время>
+PERSON_ROLES_INDEX = "person_roles"
+PERSON_ROLES_INDEX_BODY = {
+    "mappings": {
+        "dynamic": "strict",
+        "properties": {
+            "id": {"type": "keyword"},
+            "role": {"type": "keyword"},
+            "film_ids": {"type": "keyword", "index": False},
+        },
+    },
+}
+ROLE_TYPES = ("actors", "writers", "directors")
+# сколько id забирать за одну страницу scroll
+SCAN_PAGE_SIZE = 1000
+# больше документов одним поиском from/size не получить (index.max_result_window)
+MAX_RESULT_WINDOW = 10_000
+# ответы, после которых запрос стоит повторить: Elasticsearch перегружен
+# или временно недоступен за балансировщиком
+RETRY_STATUSES = (429, 502, 503, 504)
+# время жизни point in time между страницами, если курсор выдан с PIT,
+# а в настройках PIT уже выключен
+PIT_KEEP_ALIVE = "1m"
+
+# Поля _source, которые запрашивает каждый метод: Elasticsearch не читает
+# и не передаёт остальное, а клиент не разбирает лишний JSON.
+# Фильм целиком - без списков имён (director, actors_names, writers_names):
+# ответ API собирает их из списков персон
+FILM_SOURCE = ["id", "imdb_rating", "genre", "title", "description", "actors", "writers", "directors"]
+# жанры и персоны хранятся как id и имя
+ID_NAME_SOURCE = ["id", "name"]
+# для ролей персоны достаточно id участников фильма, id фильма - это _id
+PERSON_ROLES_SOURCE = ["actors.id", "writers.id", "directors.id"]
+# краткая информация о фильме в списке фильмов персоны, id фильма - это _id
+PERSON_FILMS_SOURCE = ["title", "imdb_rating"]
+INDEX_SOURCE = {
+    MOVIES_INDEX: FILM_SOURCE,
+    GENRES_INDEX: ID_NAME_SOURCE,
+    PERSONS_INDEX: ID_NAME_SOURCE,
+}
 
 es: AsyncElasticsearch | None = None
+# предохранитель и повторы запросов воркера (см. db.circuit_breaker),
+# None - без них
+breaker: CircuitBreaker | None = None
+backoff: Backoff | None = None
+# None - медленные запросы на чтение не дублируются (см. db.hedging)
+hedger: Hedger | None = None
+# None - поиски отправляются по одному (см. db.msearch)
+search_batcher: SearchBatcher | None = None
+# None - объекты по id запрашиваются по одному (см. db.mget)
+mget_loader: MgetLoader | None = None
 
 
 async def get_elastic() -> AsyncElasticsearch:
     return es
 
 
+async def get_search_batcher() -> SearchBatcher | None:
+    return search_batcher
+
+
+async def get_mget_loader() -> MgetLoader | None:
+    return mget_loader
+
+
 class ElasticStorage(BaseDbStorage):
     """Класс реализует хранилище объектов приложения Фильмы на ElasticSearch."""
 
     elastic: AsyncElasticsearch
 
-    def __init__(self, elastic_conn: AsyncElasticsearch):
+    def __init__(
+        self,
+        elastic_conn: AsyncElasticsearch,
+        pit_keep_alive: str | None = None,
+        search_batcher: SearchBatcher | None = None,
+        mget_loader: MgetLoader | None = None,
+    ):
         self.elastic = elastic_conn
+        # None - курсоры без point in time
+        self.pit_keep_alive = pit_keep_alive
+        self.search_batcher = search_batcher
+        self.mget_loader = mget_loader
 
     async def get_genre(self, genre_id: UUID) -> dict | None:
         """Получить жанр по id."""
@@ -40,23 +128,201 @@ class ElasticStorage(BaseDbStorage):
         film = await self._get_obj_by_id(film_id, MOVIES_INDEX)
         return film
 
+    async def get_genres(self, genre_ids: list[UUID]) -> list[dict]:
+        """Получить найденные жанры по списку id."""
+        return await self._get_objs_by_ids(genre_ids, GENRES_INDEX)
+
+    async def get_persons(self, person_ids: list[UUID]) -> list[dict]:
+        """Получить найденных персон по списку id."""
+        return await self._get_objs_by_ids(person_ids, PERSONS_INDEX)
+
+    async def get_films(self, film_ids: list[UUID]) -> list[dict]:
+        """Получить найденные фильмы по списку id."""
+        return await self._get_objs_by_ids(film_ids, MOVIES_INDEX)
+
+    async def get_all_genres(self) -> list[dict]:
+        """Получить все жанры в том же порядке, что и страницы get_list_genre.
+
+        Поле name - текстовое, сортировать по нему Elasticsearch не может, поэтому
+        каталог жанров хранит порядок базы. Жанров мало, и они читаются одним
+        поиском: порядок scroll может отличаться от порядка поиска.
+        """
+        return await self.get_list_genre(0, MAX_RESULT_WINDOW) or []
+
+    def get_genre_ids(self) -> AsyncIterator[str]:
+        """Перебрать id всех жанров."""
+        return self._scan_ids(GENRES_INDEX)
+
+    def get_person_ids(self) -> AsyncIterator[str]:
+        """Перебрать id всех персон."""
+        return self._scan_ids(PERSONS_INDEX)
+
+    def get_film_ids(self) -> AsyncIterator[str]:
+        """Перебрать id всех фильмов."""
+        return self._scan_ids(MOVIES_INDEX)
+
     async def get_person_details(self, person_id: UUID) -> dict | None:
         """Получить детали персоны (фильмы, роли) по id."""
         el_query = json.loads(GET_PERSON_FILMS.replace("%pers_id%", str(person_id)))
+        el_query["_source"] = PERSON_ROLES_SOURCE
         try:
-            doc = await self.elastic.search(index=MOVIES_INDEX,
-                                            body=el_query,
-                                            size=100
-                                            )
+            doc = await self._request("person_details",
+                                      self._search,
+                                      hedge=True,
+                                      index=MOVIES_INDEX,
+                                      body=el_query,
+                                      size=100,
+                                      )
         except NotFoundError:
             return None
+        return self._parse_person_details(doc, person_id)
+
+    async def get_person_roles(self, person_ids: list[UUID]) -> dict[str, dict]:
+        """Получить готовые роли и фильмы персон из индекса ролей одним _mget."""
+        if not person_ids:
+            return {}
+        try:
+            doc = await self._request(
+                "mget_person_roles",
+                self.elastic.mget,
+                hedge=True,
+                index=PERSON_ROLES_INDEX,
+                body={"ids": [str(person_id) for person_id in person_ids]},
+            )
+        except NotFoundError:
+            return {}
+        return {
+            item["_id"]: {"role": item["_source"]["role"], "film_ids": item["_source"]["film_ids"]}
+            for item in doc["docs"]
+            if item.get("found")
+        }
+
+    async def update_person_roles(self, person_ids: list[UUID], index_name: str | None = None) -> int:
+        """Пересчитать роли и фильмы персон по индексу фильмов и сохранить их.
+
+        Фильмы всех персон перебираются одним scroll по запросу terms,
+        поэтому учитываются все, сколько бы их ни было. index_name - индекс
+        ролей, который строится и ещё не подключён к псевдониму, по умолчанию
+        пишется в псевдоним. Возвращает число сохранённых документов.
+        """
+        if not person_ids:
+            return 0
+        if index_name is None:
+            if not await self.elastic.indices.exists_alias(name=PERSON_ROLES_INDEX):
+                # индекс ещё не построен: запись создала бы обычный индекс
+                # с именем псевдонима
+                return 0
+            index_name = PERSON_ROLES_INDEX
+        roles = {str(person_id): {"role": [], "film_ids": []} for person_id in person_ids}
+        el_query = {"query": self._get_persons_films_query(list(roles)), "_source": PERSON_ROLES_SOURCE}
+        try:
+            async for hit in self._scan(MOVIES_INDEX, el_query):
+                self._add_film_roles(roles, hit, only_known=True)
+        except NotFoundError:
+            pass
+        return await self._index_person_roles(index_name, roles)
+
+    async def build_person_roles(self, updated_ids: Callable[[], Awaitable[list[str]]] | None = None) -> int:
+        """Построить индекс ролей всех персон за один проход по индексу фильмов.
+
+        Документы пишутся в новый индекс, затем псевдоним PERSON_ROLES_INDEX
+        одним запросом переключается на него, а старый индекс удаляется.
+        Персоны, роли которых пересчитывались в старом индексе во время
+        прохода, перед переключением пересчитываются и в новом: updated_ids
+        возвращает их id. Если сборка не удалась, новый индекс удаляется.
+        Возвращает число персон.
+        """
+        roles: dict[str, dict] = {}
+        async for hit in self._scan(MOVIES_INDEX, {"_source": PERSON_ROLES_SOURCE}):
+            self._add_film_roles(roles, hit)
+        index_name = f"{PERSON_ROLES_INDEX}_{time.time_ns()}"
+        await self.elastic.indices.create(index=index_name, body=PERSON_ROLES_INDEX_BODY)
+        try:
+            await self._index_person_roles(index_name, roles)
+            if updated_ids is not None:
+                await self.update_person_roles(await updated_ids(), index_name)
+            try:
+                old_indices = list(await self.elastic.indices.get_alias(name=PERSON_ROLES_INDEX))
+            except NotFoundError:
+                old_indices = []
+            actions = [{"add": {"index": index_name, "alias": PERSON_ROLES_INDEX}}]
+            actions += [{"remove_index": {"index": old_index}} for old_index in old_indices]
+            await self.elastic.indices.update_aliases(body={"actions": actions})
+        except BaseException:
+            # недостроенный индекс не нужен: следующая сборка создаст новый
+            await self.elastic.indices.delete(index=index_name, ignore=[404])
+            raise
+        return len(roles)
+
+    @staticmethod
+    def _add_film_roles(roles: dict[str, dict], hit: dict, only_known: bool = False) -> None:
+        """Добавляет фильм в роли и фильмы его участников.
+
+        only_known=True - только тех участников, которые уже есть в roles.
+        """
+        for role_type in ROLE_TYPES:
+            for pers in hit["_source"].get(role_type, []):
+                if only_known:
+                    person = roles.get(pers["id"])
+                    if person is None:
+                        continue
+                else:
+                    person = roles.setdefault(pers["id"], {"role": [], "film_ids": []})
+                if role_type[:-1] not in person["role"]:
+                    person["role"].append(role_type[:-1])
+                # персона может участвовать в фильме в нескольких ролях
+                if not person["film_ids"] or person["film_ids"][-1] != hit["_id"]:
+                    person["film_ids"].append(hit["_id"])
+
+    async def _index_person_roles(self, index_name: str, roles: dict[str, dict]) -> int:
+        """Сохраняет документы ролей персон пачками (_bulk)."""
+        saved, _ = await async_bulk(
+            self.elastic,
+            (
+                {"_index": index_name, "_id": person_id, "_source": {"id": person_id} | person}
+                for person_id, person in roles.items()
+            ),
+            chunk_size=SCAN_PAGE_SIZE,
+            refresh=True,
+        )
+        return saved
+
+    async def get_persons_details(self, person_ids: list[UUID]) -> dict[str, dict]:
+        """Получить детали нескольких персон одним запросом _msearch."""
+        if not person_ids:
+            return {}
+        body = []
+        for person_id in person_ids:
+            el_query = json.loads(GET_PERSON_FILMS.replace("%pers_id%", str(person_id)))
+            el_query["size"] = 100
+            el_query["_source"] = PERSON_ROLES_SOURCE
+            body.extend([{"index": MOVIES_INDEX}, el_query])
+        try:
+            docs = await self._request("persons_details", self.elastic.msearch, body=body)
+        except NotFoundError:
+            return {}
+        result = {}
+        for person_id, doc in zip(person_ids, docs["responses"]):
+            if "error" in doc:
+                continue
+            result[str(person_id)] = self._parse_person_details(doc, person_id)
+        return result
+
+    @classmethod
+    def _parse_person_details(cls, doc: dict, person_id: UUID) -> dict:
+        """Собирает роли и фильмы персоны из ответа поиска по индексу фильмов."""
+        return cls._person_roles(doc["hits"]["hits"], person_id)
+
+    @staticmethod
+    def _person_roles(hits: list[dict], person_id: UUID) -> dict:
+        """Роли и фильмы персоны по найденным фильмам с ней."""
         film_ids = set()
         roles = set()
-        for item in doc["hits"]["hits"]:
+        for item in hits:
             film_ids.add(item["_id"])
-            role_types = ("actors", "writers", "directors")
-            for role_type in role_types:
-                persons = item["_source"][role_type]
+            for role_type in ROLE_TYPES:
+                # пустой список проекция может убрать из _source совсем
+                persons = item["_source"].get(role_type, [])
                 for pers in persons:
                     if pers["id"] == str(person_id):
                         roles.add(role_type[:-1])  # без "s" в конце
@@ -70,8 +336,12 @@ class ElasticStorage(BaseDbStorage):
     ) -> list[dict] | None:
         """Получить список жанров - нужное кол-во с нужной позиции."""
         try:
-            doc = await self.elastic.search(
+            doc = await self._request(
+                "genre_list",
+                self._search,
+                hedge=True,
                 index=GENRES_INDEX,
+                _source=ID_NAME_SOURCE,
                 from_=offset,
                 size=limit,
             )
@@ -88,9 +358,13 @@ class ElasticStorage(BaseDbStorage):
         """Fuzzy search. Возвращает список персон - нужное кол-во с нужной позиции."""
         el_query = json.loads(PERSON_SEARCH_FUZZY.replace("%search_query%", query))
         try:
-            doc = await self.elastic.search(
+            doc = await self._request(
+                "person_search",
+                self._search,
+                hedge=True,
                 index=PERSONS_INDEX,
                 body=el_query,
+                _source=ID_NAME_SOURCE,
                 from_=offset,
                 size=limit,
             )
@@ -105,23 +379,37 @@ class ElasticStorage(BaseDbStorage):
         limit: int = 10,
     ) -> list[dict] | None:
         """Возвращает список фильмов заданной персоны."""
-        # строка запроса к индексу фильмов
-        el_query = json.loads(GET_PERSON_FILMS.replace("%pers_id%", str(person_id)))
+        el_query = self._get_pers_films_query(person_id, limit)
         try:
-            doc = await self.elastic.search(
-                index=MOVIES_INDEX, body=el_query, from_=offset, size=limit,
+            doc = await self._request(
+                "person_films",
+                self._search,
+                hedge=True,
+                index=MOVIES_INDEX, body=el_query, from_=offset,
             )
         except NotFoundError:
             return None
-        films = []
-        for item in doc["hits"]["hits"]:
-            film = {
-                "id": item["_id"],
-                "title": item["_source"]["title"],
-                "imdb_rating": item["_source"]["imdb_rating"],
-            }
-            films.append(film)
-        return films
+        return [self._pers_film(item) for item in doc["hits"]["hits"]]
+
+    async def get_pers_films_page(
+        self, person_id: UUID, cursor: str, limit: int = 10,
+    ) -> tuple[list[dict], str | None] | None:
+        """Страница фильмов персоны после курсора и курсор следующей страницы."""
+        el_query = self._get_pers_films_query(person_id, limit)
+        try:
+            hits, next_cursor = await self._search_after("person_films", MOVIES_INDEX, el_query, cursor)
+        except NotFoundError:
+            return None
+        return [self._pers_film(item) for item in hits], next_cursor
+
+    @staticmethod
+    def _pers_film(item: dict) -> dict:
+        """Краткая информация о фильме персоны из найденного документа."""
+        return {
+            "id": item["_id"],
+            "title": item["_source"]["title"],
+            "imdb_rating": item["_source"]["imdb_rating"],
+        }
 
     async def search_film(self,
                           query: str | None = None,
@@ -138,19 +426,253 @@ class ElasticStorage(BaseDbStorage):
                                         query=query,
                                         )
         try:
-            doc = await self.elastic.search(index=MOVIES_INDEX, body=query_el)
+            doc = await self._request("film_search",
+                                      self._search,
+                                      hedge=True,
+                                      index=MOVIES_INDEX,
+                                      body=query_el,
+                                      )
         except NotFoundError:
             return None
         return [item["_source"] for item in doc["hits"]["hits"]]
 
+    async def search_film_page(self,
+                               cursor: str,
+                               query: str | None = None,
+                               filter_genre: UUID | None = None,
+                               limit: int = 10,
+                               sort: str = '-imdb_rating',
+                               ) -> tuple[list[dict], str | None] | None:
+        """Страница поиска фильмов после курсора и курсор следующей страницы."""
+        query_el = self._get_film_query(filter_genre=filter_genre, limit=limit, sort=sort, query=query)
+        try:
+            hits, next_cursor = await self._search_after("film_search", MOVIES_INDEX, query_el, cursor)
+        except NotFoundError:
+            return None
+        return [item["_source"] for item in hits], next_cursor
+
+    async def _search_after(
+        self, query: str, index_name: str, body: dict, cursor: str,
+    ) -> tuple[list[dict], str | None]:
+        """Выполняет поиск страницы после курсора (search_after).
+
+        Сортировка запроса должна однозначно упорядочивать документы (с id
+        в конце). Курсор первой страницы открывает point in time, если он
+        включён; на последней странице PIT закрывается и следующего курсора нет.
+        """
+        search_after, pit_id = decode_cursor(cursor, len(body["sort"]))
+        if search_after is None and self.pit_keep_alive:
+            pit = await self._request(
+                "open_pit",
+                self.elastic.open_point_in_time,
+                index=index_name,
+                keep_alive=self.pit_keep_alive,
+            )
+            pit_id = pit["id"]
+        body.pop("from", None)
+        if search_after is not None:
+            body["search_after"] = search_after
+        try:
+            if pit_id:
+                # в запросе с PIT индекс задаёт сам PIT
+                body["pit"] = {"id": pit_id, "keep_alive": self.pit_keep_alive or PIT_KEEP_ALIVE}
+                doc = await self._request(query, self._search, body=body)
+                pit_id = doc.get("pit_id", pit_id)
+            else:
+                doc = await self._request(query, self._search, index=index_name, body=body)
+        except (RequestError, NotFoundError) as e:
+            if search_after is None or isinstance(e, NotFoundError) and not pit_id:
+                raise
+            # значения курсора не подошли к сортировке (400) или PIT из курсора
+            # истёк (404): клиенту нужно начать выдачу заново
+            raise InvalidCursorError(cursor) from e
+        hits = doc["hits"]["hits"]
+        if len(hits) < body["size"]:
+            if pit_id:
+                await self._close_pit(pit_id)
+            return hits, None
+        # с PIT Elasticsearch добавляет в сортировку _shard_doc, поэтому
+        # значения берутся из ответа, а не из документа
+        return hits, encode_cursor(hits[-1]["sort"], pit_id)
+
+    async def _close_pit(self, pit_id: str) -> None:
+        """Закрывает point in time; если не вышло, он истечёт сам."""
+        try:
+            await self._request("close_pit", self.elastic.close_point_in_time, body={"id": pit_id})
+        except Exception:
+            pass
+
     async def _get_obj_by_id(self, obj_id: UUID, index_name: str) -> dict | None:
         """Возвращает элемент указанного индекса по id."""
+        if self.mget_loader is not None:
+            return await self.mget_loader.load(index_name, str(obj_id), INDEX_SOURCE[index_name])
         try:
-            doc = await self.elastic.get(index=index_name, id=str(obj_id))
+            doc = await self._request(f"get_{index_name}",
+                                      self.elastic.get,
+                                      hedge=True,
+                                      index=index_name,
+                                      id=str(obj_id),
+                                      _source=INDEX_SOURCE[index_name],
+                                      )
         except NotFoundError:
             return None
         return doc["_source"]
 
+    async def _get_objs_by_ids(self, obj_ids: list[UUID], index_name: str) -> list[dict]:
+        """Возвращает найденные элементы указанного индекса по списку id (_mget)."""
+        if not obj_ids:
+            return []
+        if self.mget_loader is not None:
+            docs = await self.mget_loader.load_many(
+                index_name, [str(obj_id) for obj_id in obj_ids], INDEX_SOURCE[index_name],
+            )
+            return [doc for doc in docs if doc]
+        try:
+            doc = await self._request(
+                f"mget_{index_name}",
+                self.elastic.mget,
+                hedge=True,
+                index=index_name,
+                body={"ids": [str(obj_id) for obj_id in obj_ids]},
+                _source=INDEX_SOURCE[index_name],
+            )
+        except NotFoundError:
+            return []
+        return [item["_source"] for item in doc["docs"] if item.get("found")]
+
+    async def _search(self, **kwargs) -> dict:
+        """Поиск отдельным запросом или в пачке _msearch, если она включена.
+
+        Параметры from_, size и _source переносятся в тело запроса: в _msearch
+        у каждого поиска есть только заголовок с индексом и тело. Поиски
+        в point in time (без индекса) и с другими параметрами идут отдельно.
+        """
+        if self.search_batcher is None or "index" not in kwargs:
+            return await self.elastic.search(**kwargs)
+        params = dict(kwargs)
+        index_name = params.pop("index")
+        body = dict(params.pop("body", None) or {})
+        for param, field in (("from_", "from"), ("size", "size"), ("_source", "_source")):
+            if param in params:
+                body[field] = params.pop(param)
+        if params:
+            return await self.elastic.search(**kwargs)
+        return await self.search_batcher.search(index_name, body)
+
+    @staticmethod
+    async def _request(
+        query: str, method: Callable[..., Awaitable[dict]], hedge: bool = False, **kwargs,
+    ) -> dict:
+        """Выполняет запрос к Elasticsearch и записывает его метрики.
+
+        query - тип запроса для меток метрик. Время выполнения на стороне
+        Elasticsearch (took) сравнивается со временем, которое видит клиент:
+        разница - это сеть, очереди и разбор ответа.
+
+        Временные сбои (нет соединения, таймаут, 429 и 5xx балансировщика)
+        повторяются с экспоненциальной задержкой и считаются предохранителем;
+        при разомкнутом предохранителе запрос сразу завершается CircuitOpenError.
+        Запрос и повторы не выходят за бюджет времени HTTP-запроса (см. core.deadline):
+        по его исчерпании запрос отменяется с DeadlineExceededError.
+
+        hedge - запрос только читает данные, и его можно продублировать
+        с другим preference, если он выполняется дольше обычного (см. db.hedging).
+        """
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.check()
+            started = time.perf_counter()
+            try:
+                if hedge and hedger is not None:
+                    call = hedger.run(query, partial(ElasticStorage._with_preference, method, kwargs))
+                else:
+                    call = method(**kwargs)
+                doc = await deadline.wait(call, "elasticsearch")
+            except DeadlineExceededError:
+                raise
+            except NotFoundError:
+                # отсутствие индекса или документа - обычный ответ, а не сбой
+                if breaker is not None:
+                    breaker.success()
+                raise
+            except Exception as e:
+                ES_ERRORS.labels(query, type(e).__name__).inc()
+                if not ElasticStorage._is_transient(e):
+                    # Elasticsearch ответил, ошибка в самом запросе (например, 400)
+                    if breaker is not None and isinstance(e, TransportError):
+                        breaker.success()
+                    raise
+                if breaker is not None:
+                    breaker.failure()
+                if backoff is None or attempt >= backoff.retries:
+                    raise
+                delay = backoff.delay(attempt)
+                # повтор, который не успеет до конца бюджета, бесполезен
+                if not deadline.has_time(delay):
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            finally:
+                ES_REQUEST_DURATION.labels(query).observe(time.perf_counter() - started)
+            if breaker is not None:
+                breaker.success()
+            break
+        if "took" in doc:
+            ES_TOOK.labels(query).observe(doc["took"] / 1000)
+        if "responses" in doc:
+            ES_HITS.labels(query).observe(
+                sum(len(item.get("hits", {}).get("hits", [])) for item in doc["responses"]),
+            )
+        elif "hits" in doc:
+            ES_HITS.labels(query).observe(len(doc["hits"]["hits"]))
+        elif "docs" in doc:
+            ES_HITS.labels(query).observe(sum(1 for item in doc["docs"] if item.get("found")))
+        return doc
+
+    @staticmethod
+    def _with_preference(
+        method: Callable[..., Awaitable[dict]], kwargs: dict, preference: str | None,
+    ) -> Awaitable[dict]:
+        if preference is None:
+            return method(**kwargs)
+        return method(preference=preference, **kwargs)
+
+    @staticmethod
+    def _is_transient(e: Exception) -> bool:
+        """Сбой, который может пройти сам: его стоит повторить."""
+        if isinstance(e, (ESConnectionError, asyncio.TimeoutError)):
+            return True
+        return isinstance(e, TransportError) and e.status_code in RETRY_STATUSES
+
+    async def _scan_ids(self, index_name: str) -> AsyncIterator[str]:
+        """Перебирает id всех документов индекса (scroll без _source)."""
+        async for hit in self._scan(index_name, {"_source": False}):
+            yield hit["_id"]
+
+    def _scan(self, index_name: str, query: dict | None = None) -> AsyncIterator[dict]:
+        """Перебирает все документы индекса через scroll."""
+        return async_scan(self.elastic, index=index_name, query=query, size=SCAN_PAGE_SIZE)
+
+    @staticmethod
+    def _get_pers_films_query(person_id: UUID, limit: int = 10) -> dict:
+        """Запрос фильмов персоны к индексу фильмов."""
+        el_query = json.loads(GET_PERSON_FILMS.replace("%pers_id%", str(person_id)))
+        el_query["_source"] = PERSON_FILMS_SOURCE
+        el_query["size"] = limit
+        # id фильма делает порядок однозначным для постраничной выдачи по курсору
+        el_query["sort"] = [{"_score": {"order": "desc"}}, {"id": {"order": "asc"}}]
+        return el_query
+
+    @staticmethod
+    def _get_persons_films_query(person_ids: list[str]) -> dict:
+        """Запрос всех фильмов, в которых участвует хоть одна из персон."""
+        return {"bool": {"should": [
+            {"nested": {"path": role_type, "query": {"terms": {f"{role_type}.id": person_ids}}}}
+            for role_type in ROLE_TYPES
+        ]}}
+
     @staticmethod
     def _get_film_query(filter_genre: UUID | None = None,
                         offset: int = 0,
@@ -159,6 +681,7 @@ class ElasticStorage(BaseDbStorage):
                         sort: str = '-imdb_rating',
                         ) -> dict:
         query_result = {
+            "_source": FILM_SOURCE,
             "size": limit,
             "from": offset,
             "sort": [
@@ -166,6 +689,13 @@ class ElasticStorage(BaseDbStorage):
                     "imdb_rating": {
                         "order": "desc"
                     }
+                },
+                # id делает порядок однозначным: фильмы с одинаковым рейтингом
+                # не переходят со страницы на страницу
+                {
+                    "id": {
+                        "order": "asc"
+                    }
                 }
             ]
         }
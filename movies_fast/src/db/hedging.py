@@ -0,0 +1,128 @@
+"""Дублирование медленных запросов к Elasticsearch (hedged requests).
+
+Хвост времени ответа (p99) определяют не средние запросы, а редкие
+медленные: шард на перегруженном узле, пауза сборщика мусора. Hedger
+отправляет запрос как обычно и, если ответа нет дольше порога (процентиль
+времени ответа этого типа запроса за последние WINDOW_SIZE запросов),
+отправляет тот же запрос ещё раз с другим preference - Elasticsearch
+выберет для него, скорее всего, другие копии шардов. Берётся первый
+успешный ответ, второй запрос отменяется.
+
+Дублировать можно только чтение. Чтобы дубли не удвоили нагрузку на
+медленный кластер, их доля ограничена: каждый запрос добавляет max_rate
+токена (не больше HEDGE_BURST), а каждый дубль тратит один.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from core.metrics import ES_HEDGED_REQUESTS
+
+T = TypeVar("T")
+
+# сколько последних времён ответа хранится по каждому типу запроса
+WINDOW_SIZE = 1000
+# порог пересчитывается через столько новых замеров
+RECOMPUTE_EVERY = 50
+# сколько дублей подряд можно отправить после затишья
+HEDGE_BURST = 10
+
+
+class LatencyWindow:
+    """Времена ответа последних запросов одного типа и их процентиль."""
+
+    def __init__(self, percentile: float, min_samples: int):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.samples: deque[float] = deque(maxlen=WINDOW_SIZE)
+        self.threshold: float | None = None
+        self._since_recompute = 0
+
+    def add(self, elapsed: float) -> None:
+        self.samples.append(elapsed)
+        self._since_recompute += 1
+        if len(self.samples) < self.min_samples:
+            return
+        # сортировка окна на каждый запрос дороже самого порога
+        if self.threshold is None or self._since_recompute >= RECOMPUTE_EVERY:
+            ordered = sorted(self.samples)
+            self.threshold = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+            self._since_recompute = 0
+
+
+class Hedger:
+    """Отправляет дубль запроса, если основной отвечает дольше порога.
+
+    percentile - процентиль времени ответа, после которого отправляется дубль,
+    min_delay - порог не меньше этого числа секунд, max_rate - доля запросов,
+    которые можно дублировать, min_samples - сколько замеров нужно, чтобы
+    начать дублировать запросы этого типа.
+    """
+
+    def __init__(self, percentile: float, min_delay: float, max_rate: float, min_samples: int):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self._windows: dict[str, LatencyWindow] = {}
+        self._tokens = 0.0
+
+    def delay(self, query: str) -> float | None:
+        """Через сколько секунд дублировать запрос, None - замеров пока мало."""
+        window = self._windows.get(query)
+        if window is None or window.threshold is None:
+            return None
+        return max(self.min_delay, window.threshold)
+
+    async def run(self, query: str, call: Callable[[str | None], Awaitable[T]]) -> T:
+        """Выполняет call(None), при задержке - ещё и call(preference) и возвращает первый ответ.
+
+        query - тип запроса: порог считается для каждого типа отдельно.
+        """
+        self._tokens = min(HEDGE_BURST, self._tokens + self.max_rate)
+        started = time.monotonic()
+        delay = self.delay(query)
+        primary = asyncio.ensure_future(call(None))
+        tasks = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        ES_HEDGED_REQUESTS.labels(query, "sent").inc()
+                        # произвольная строка preference (не с "_") выбирает копии
+                        # шардов по своему хэшу, а не как основной запрос
+                        tasks.add(asyncio.ensure_future(call(f"hedge-{random.getrandbits(32)}")))
+                    else:
+                        ES_HEDGED_REQUESTS.labels(query, "capped").inc()
+            winner = await self._first_success(tasks, primary)
+        finally:
+            for task in tasks:
+                task.cancel()
+        result = winner.result()
+        if winner is not primary:
+            ES_HEDGED_REQUESTS.labels(query, "won").inc()
+        self._window(query).add(time.monotonic() - started)
+        return result
+
+    @staticmethod
+    async def _first_success(tasks: set[asyncio.Future], primary: asyncio.Future) -> asyncio.Future:
+        """Первый запрос, завершившийся без ошибки; если ошибка у всех - основной."""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # исключения забираются у всех завершившихся, иначе asyncio о них предупредит
+            succeeded = [task for task in done if task.exception() is None]
+            if succeeded:
+                return succeeded[0]
+        return primary
+
+    def _window(self, query: str) -> LatencyWindow:
+        window = self._windows.get(query)
+        if window is None:
+            window = self._windows[query] = LatencyWindow(self.percentile, self.min_samples)
+        return window
@@ -0,0 +1,190 @@
+"""In-process кэш (L1), который работает перед общим кэшем в Redis (L2)."""
+
+import time
+from collections import OrderedDict
+from typing import Any
+
+from core.metrics import CACHE_EVICTIONS, CACHE_REQUESTS, CACHE_SIZE, cache_namespace
+from db.abs_storages import BaseCacheStorage
+
+
+class LRUCache:
+    """Ограниченный по размеру и времени жизни записей словарь.
+
+    При переполнении вытесняется запись, к которой дольше всего не обращались.
+    Число записей и вытеснений попадает в метрики cache_size и
+    cache_evictions_total с меткой layer: по ним подбирается размер кэша
+    под отдельный воркер gunicorn.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 30, layer: str = "local"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._size = CACHE_SIZE.labels(layer)
+        self._evictions = CACHE_EVICTIONS.labels(layer)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any | None:
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key: str) -> tuple[Any | None, float | None]:
+        """Возвращает значение и оставшееся время его жизни в секундах."""
+        item = self._data.get(key)
+        if item is None:
+            return None, None
+        expire_at, value = item
+        ttl = expire_at - time.monotonic()
+        if ttl <= 0:
+            del self._data[key]
+            self._size.dec()
+            return None, None
+        self._data.move_to_end(key)
+        return value, ttl
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        if ttl is None:
+            ttl = self.ttl
+        if key not in self._data:
+            self._size.inc()
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self._size.dec()
+            self._evictions.inc()
+
+    def delete(self, key: str) -> None:
+        if self._data.pop(key, None) is not None:
+            self._size.dec()
+
+    def clear(self) -> None:
+        self._size.dec(len(self._data))
+        self._data.clear()
+
+
+class LocalCacheStorage(BaseCacheStorage):
+    """Двухуровневый кэш: память процесса (L1) поверх другого кэша (L2).
+
+    Чтение сначала идёт в L1 и только при промахе - в L2, найденное в L2
+    кладётся в L1. Запись идёт в оба уровня. Время жизни записей в L1
+    должно быть не больше, чем в L2, иначе воркеры будут отдавать данные,
+    которые уже устарели в общем кэше.
+
+    Объекты из L1 отдаются без копирования, поэтому изменять их нельзя.
+    """
+
+    backend: BaseCacheStorage
+    local: LRUCache
+    deadlines: LRUCache
+
+    def __init__(self, backend: BaseCacheStorage, max_size: int = 1024, ttl: float = 30):
+        self.backend = backend
+        self.local = LRUCache(max_size, ttl, layer="local")
+        # моменты истечения записей в L2, известные по get_with_ttl
+        self.deadlines = LRUCache(max_size, ttl, layer="local_ttl")
+
+    async def get_object(self, key: str) -> dict | None:
+        data = self._get_local(key)
+        if data is None:
+            data = await self.backend.get_object(key)
+            if data is not None:
+                self.local.set(key, data)
+        return data
+
+    async def get_with_ttl(self, key: str) -> tuple[Any | None, float | None]:
+        data = self._get_local(key)
+        if data is not None:
+            deadline = self.deadlines.get(key)
+            return data, deadline - time.monotonic() if deadline else None
+        data, ttl = await self.backend.get_with_ttl(key)
+        if data is not None:
+            self.local.set(key, data)
+            if ttl is not None:
+                self.deadlines.set(key, time.monotonic() + ttl)
+        return data, ttl
+
+    async def save_object(self, key: str, body: dict) -> None:
+        self.local.set(key, body)
+        self.deadlines.delete(key)
+        await self.backend.save_object(key, body)
+
+    async def get_objects(self, keys: list[str]) -> list[dict | None]:
+        result = [self._get_local(key) for key in keys]
+        missed = [key for key, data in zip(keys, result) if data is None]
+        if not missed:
+            return result
+        found = dict(zip(missed, await self.backend.get_objects(missed)))
+        for pos, key in enumerate(keys):
+            data = found.get(key)
+            if data is not None:
+                self.local.set(key, data)
+                result[pos] = data
+        return result
+
+    async def save_objects(
+        self, objs: dict[str, dict], expire: dict[str, int] | None = None,
+    ) -> None:
+        for key, body in objs.items():
+            self.local.set(key, body)
+            self.deadlines.delete(key)
+        await self.backend.save_objects(objs, expire)
+
+    async def delete_objects(self, keys: list[str]) -> None:
+        for key in keys:
+            self.local.delete(key)
+            self.deadlines.delete(key)
+        await self.backend.delete_objects(keys)
+
+    async def get_id_list(self, key: str) -> list[str] | None:
+        data = self._get_local(key)
+        if data is None:
+            data = await self.backend.get_id_list(key)
+            if data is not None:
+                self.local.set(key, data)
+        return data
+
+    async def save_id_list(self, key: str, ids: list[str]) -> None:
+        self.local.set(key, ids)
+        self.deadlines.delete(key)
+        await self.backend.save_id_list(key, ids)
+
+    async def get_list_objects(self, key: str) -> list[dict] | None:
+        data = self._get_local(key)
+        if data is None:
+            data = await self.backend.get_list_objects(key)
+            if data is not None:
+                self.local.set(key, data)
+        return data
+
+    async def save_list_objects(self, key: str, objs: list[dict]) -> None:
+        self.local.set(key, objs)
+        self.deadlines.delete(key)
+        await self.backend.save_list_objects(key, objs)
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        data = self._get_local(key)
+        if data is None:
+            data = await self.backend.get_bytes(key)
+            if data is not None:
+                self.local.set(key, data)
+        return data
+
+    async def save_bytes(self, key: str, data: bytes) -> None:
+        self.local.set(key, data)
+        self.deadlines.delete(key)
+        await self.backend.save_bytes(key, data)
+
+    async def get_generation(self, namespace: str) -> int | None:
+        return await self.backend.get_generation(namespace)
+
+    async def incr_generation(self, namespace: str) -> int | None:
+        return await self.backend.incr_generation(namespace)
+
+    def _get_local(self, key: str) -> Any | None:
+        data = self.local.get(key)
+        result = "miss" if data is None else "hit"
+        CACHE_REQUESTS.labels("local", cache_namespace(key), result).inc()
+        return data
@@ -0,0 +1,84 @@
+"""Хранилище кэша в памяти процесса.
+
+Повторяет поведение RedisCacheStorage (время жизни ключей, сериализация
+в JSON), но не требует Redis. Подходит для тестов и локального запуска.
+"""
+
+import json
+from typing import Any
+
+from db.abs_storages import BaseCacheStorage
+from db.local_cache import LRUCache
+
+
+class MemoryCacheStorage(BaseCacheStorage):
+    """Реализация кэша объектов приложения Фильмы в памяти процесса."""
+
+    expire_timeout: int
+
+    def __init__(self, expire_timeout: int = 300, max_size: int = 100_000):
+        self.expire_timeout = expire_timeout
+        self.data = LRUCache(max_size, expire_timeout, layer="memory")
+        self.generations: dict[str, int] = {}
+
+    async def get_object(self, key: str) -> dict | None:
+        return self._get(key)
+
+    async def get_with_ttl(self, key: str) -> tuple[Any | None, float | None]:
+        data, ttl = self.data.get_with_ttl(key)
+        if data is None:
+            return None, None
+        return json.loads(data), ttl
+
+    async def save_object(self, key: str, body: dict) -> None:
+        self.data.set(key, json.dumps(body))
+
+    async def get_objects(self, keys: list[str]) -> list[dict | None]:
+        return [self._get(key) for key in keys]
+
+    async def save_objects(
+        self, objs: dict[str, dict], expire: dict[str, int] | None = None,
+    ) -> None:
+        expire = expire or {}
+        for key, body in objs.items():
+            self.data.set(key, json.dumps(body), expire.get(key))
+
+    async def delete_objects(self, keys: list[str]) -> None:
+        for key in keys:
+            self.data.delete(key)
+
+    async def get_id_list(self, key: str) -> list[str] | None:
+        return await self.get_list_objects(key)
+
+    async def save_id_list(self, key: str, ids: list[str]) -> None:
+        await self.save_list_objects(key, ids)
+
+    async def get_list_objects(self, key: str) -> list[dict] | None:
+        data = self._get(key)
+        if not data:
+            return None
+        return list(data)
+
+    async def save_list_objects(self, key: str, objs: list[dict]) -> None:
+        self.data.set(key, json.dumps(objs))
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        return self.data.get(key)
+
+    async def save_bytes(self, key: str, data: bytes) -> None:
+        self.data.set(key, data)
+
+    async def get_generation(self, namespace: str) -> int:
+        return self.generations.get(namespace, 0)
+
+    async def incr_generation(self, namespace: str) -> int:
+        self.generations[namespace] = self.generations.get(namespace, 0) + 1
+        return self.generations[namespace]
+
+    def _get(self, key: str):
+        # данные хранятся сериализованными, как в Redis, поэтому вызывающий
+        # код получает копию и не может испортить запись в кэше
+        data = self.data.get(key)
+        if data is None:
+            return None
+        return json.loads(data)
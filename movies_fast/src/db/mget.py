@@ -0,0 +1,136 @@
+"""Объединение запросов объектов по id в _mget (по образцу DataLoader).
+
+Каждый запрос фильма, жанра или персоны по id - отдельный GET к
+Elasticsearch, а одновременные запросы разных ручек и списков id дают
+много мелких запросов. MgetLoader копит id, запрошенные корутинами воркера
+за один проход цикла событий, и загружает их одним _mget на индекс.
+Одинаковые id загружаются один раз, а в пределах одного HTTP-запроса
+(см. RequestCacheMiddleware) загруженный объект больше не запрашивается.
+"""
+
+import asyncio
+from contextvars import ContextVar
+from functools import partial
+from typing import Awaitable, Callable
+
+from elasticsearch import AsyncElasticsearch, NotFoundError
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from core import deadline
+from core.metrics import ES_BATCH_SIZE
+
+# объекты, загруженные в текущем HTTP-запросе: (индекс, id) -> объект или None
+request_docs: ContextVar[dict[tuple[str, str], dict | None] | None] = ContextVar(
+    "request_docs", default=None,
+)
+
+
+class RequestCacheMiddleware:
+    """ASGI middleware: у каждого HTTP-запроса свой кэш объектов MgetLoader."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = request_docs.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_docs.reset(token)
+
+
+class MgetLoader:
+    """Загружает объекты по id пачками через _mget.
+
+    request - обёртка запросов к Elasticsearch с метриками
+    (ElasticStorage._request).
+    """
+
+    def __init__(self, elastic: AsyncElasticsearch, request: Callable[..., Awaitable[dict]]):
+        self.elastic = elastic
+        self.request = request
+        # (индекс, поля _source) -> id -> ожидающий объекта future
+        self._pending: dict[tuple[str, tuple[str, ...]], dict[str, asyncio.Future]] = {}
+        # id, которые уже запрашиваются: повторно они в пачку не попадают
+        self._inflight: dict[tuple[str, tuple[str, ...]], dict[str, asyncio.Future]] = {}
+        self._scheduled = False
+        # ссылки на отправляемые пачки, чтобы задачи не собрал сборщик мусора
+        self._sending: set[asyncio.Task] = set()
+
+    async def load(self, index: str, obj_id: str, source: list[str]) -> dict | None:
+        """Возвращает объект индекса по id, None - если его нет."""
+        cache = request_docs.get()
+        if cache is not None and (index, obj_id) in cache:
+            return cache[(index, obj_id)]
+        batch_key = (index, tuple(source))
+        future = (
+            self._pending.get(batch_key, {}).get(obj_id)
+            or self._inflight.get(batch_key, {}).get(obj_id)
+        )
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending.setdefault(batch_key, {})[obj_id] = future
+            if not self._scheduled:
+                # пачка уходит, когда все готовые корутины добавят в неё свои id
+                asyncio.get_running_loop().call_soon(self._flush)
+                self._scheduled = True
+        # future общий для всех, кто ждёт этот id: отмена одного его не отменяет,
+        # и каждый ждёт его не дольше своего бюджета времени
+        doc = await deadline.wait(asyncio.shield(future), "elasticsearch")
+        if cache is not None:
+            cache[(index, obj_id)] = doc
+        return doc
+
+    async def load_many(self, index: str, obj_ids: list[str], source: list[str]) -> list[dict | None]:
+        """Возвращает объекты по списку id в том же порядке, ненайденные - None."""
+        return list(await asyncio.gather(*(self.load(index, obj_id, source) for obj_id in obj_ids)))
+
+    def _flush(self) -> None:
+        self._scheduled = False
+        batches, self._pending = self._pending, {}
+        for batch_key, pending in batches.items():
+            self._inflight.setdefault(batch_key, {}).update(pending)
+            # пачка общая для нескольких HTTP-запросов и не ограничена бюджетом одного из них
+            task = asyncio.ensure_future(deadline.without_deadline(partial(self._send, batch_key, pending)))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(
+        self, batch_key: tuple[str, tuple[str, ...]], pending: dict[str, asyncio.Future],
+    ) -> None:
+        try:
+            await self._mget(*batch_key, pending)
+        finally:
+            inflight = self._inflight.get(batch_key, {})
+            for obj_id, future in pending.items():
+                if inflight.get(obj_id) is future:
+                    del inflight[obj_id]
+            if not inflight:
+                self._inflight.pop(batch_key, None)
+
+    async def _mget(self, index: str, source: tuple[str, ...], pending: dict[str, asyncio.Future]) -> None:
+        ES_BATCH_SIZE.labels("mget").observe(len(pending))
+        try:
+            doc = await self.request(
+                f"mget_{index}",
+                self.elastic.mget,
+                hedge=True,
+                index=index,
+                body={"ids": list(pending)},
+                _source=list(source),
+            )
+        except NotFoundError:
+            # нет индекса - нет и объектов
+            doc = {"docs": []}
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        found = {item["_id"]: item["_source"] for item in doc["docs"] if item.get("found")}
+        for obj_id, future in pending.items():
+            if not future.done():
+                future.set_result(found.get(obj_id))
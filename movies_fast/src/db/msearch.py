@@ -0,0 +1,82 @@
+"""Объединение одновременных поисков воркера в один запрос _msearch.
+
+Под нагрузкой сотни корутин воркера одновременно ищут фильмы, фильмы
+персон и страницы жанров, и каждый поиск - отдельный HTTP-запрос
+к Elasticsearch. SearchBatcher собирает поиски, пришедшие в течение
+window секунд (но не больше max_batch), отправляет их одним _msearch
+и раздаёт ответы ждущим корутинам. Ошибка одного поиска в _msearch
+достаётся только его корутине - в виде того же исключения, что и при
+отдельном запросе (NotFoundError для отсутствующего индекса и т.д.).
+"""
+
+import asyncio
+
+from elasticsearch import AsyncElasticsearch, TransportError
+from elasticsearch.exceptions import HTTP_EXCEPTIONS
+
+from core.metrics import ES_BATCH_SIZE
+
+
+class SearchBatcher:
+    """Копит поиски воркера и отправляет их пачками через _msearch."""
+
+    def __init__(self, elastic: AsyncElasticsearch, window: float, max_batch: int):
+        self.elastic = elastic
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: list[tuple[str, dict, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        # ссылки на отправляемые пачки, чтобы задачи не собрал сборщик мусора
+        self._sending: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def search(self, index: str, body: dict) -> dict:
+        """Ставит поиск в очередь и возвращает его ответ, как search()."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((index, body, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: list[tuple[str, dict, asyncio.Future]]) -> None:
+        ES_BATCH_SIZE.labels("msearch").observe(len(batch))
+        body = []
+        for index, query, _ in batch:
+            body.extend([{"index": index}, query])
+        try:
+            docs = await self.elastic.msearch(body=body)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), doc in zip(batch, docs["responses"]):
+            # корутину, ждавшую ответ, могли отменить
+            if future.done():
+                continue
+            if "error" in doc:
+                future.set_exception(self._error(doc))
+            else:
+                future.set_result(doc)
+
+    @staticmethod
+    def _error(doc: dict) -> TransportError:
+        """Исключение, которое вызвал бы тот же поиск отдельным запросом."""
+        status = doc.get("status", 500)
+        error = doc["error"]
+        error_type = error.get("type", "") if isinstance(error, dict) else str(error)
+        return HTTP_EXCEPTIONS.get(status, TransportError)(status, error_type, doc)
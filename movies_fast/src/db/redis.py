@@ -1,60 +1,233 @@
-import json
 import logging
-from uuid import UUID
+import random
+from typing import Any, Awaitable, Callable, TypeVar
+
 from aioredis import Redis
+from aioredis.exceptions import ConnectionError as RedisConError, TimeoutError as RedisTimeoutError
 
+from core import deadline
+from core.deadline import DeadlineExceededError
+from core.metrics import CACHE_PAYLOAD_SIZE, CACHE_REQUESTS, DEADLINE_EXCEEDED, cache_namespace
 from db.abs_storages import BaseCacheStorage
+from db.cache_keys import has_generation
+from db.circuit_breaker import CircuitBreaker
+from db.codecs import CacheSerializer, CodecError
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# поколения хранятся без срока жизни: их сброс сделал бы видимыми старые ключи
+GENERATION_KEY = "cache_generation:{}"
+# результат команды, которая не выполнилась
+FAILED = object()
+# ошибки aioredis - не наследники встроенного ConnectionError, а OSError
+# возникает, если соединение оборвалось внутри клиента
+REDIS_ERRORS = (RedisConError, RedisTimeoutError, OSError)
+
 redis: Redis | None = None
+serializer: CacheSerializer | None = None
+# общий предохранитель всех хранилищ воркера, работающих с Redis
+breaker: CircuitBreaker | None = None
+# доля оставшегося бюджета запроса (см. core.deadline), которую может ждать
+# команда Redis, чтобы при промахе осталось время на запрос к базе,
+# и меньше скольких секунд бюджета запись в кэш пропускается
+deadline_share: float = 1
+write_reserve: float = 0
 
 
 async def get_redis() -> Redis:
     return redis
 
 
+def get_serializer() -> CacheSerializer:
+    return serializer or CacheSerializer()
+
+
+def get_breaker() -> CircuitBreaker | None:
+    return breaker
+
+
 class RedisCacheStorage(BaseCacheStorage):
-    """Реализация кэша объектов приложения Фильмы на Redis."""
+    """Реализация кэша объектов приложения Фильмы на Redis.
+
+    Значения хранятся в бинарном виде (см. db.codecs), поэтому клиент Redis
+    должен быть создан без decode_responses.
+    """
 
     redis: Redis
     expire_timeout: int
+    expire_jitter: float
+    serializer: CacheSerializer
+    breaker: CircuitBreaker | None
 
-    def __init__(self, redis_conn: Redis, expire_timeout: int = 300):
+    def __init__(self,
+                 redis_conn: Redis,
+                 expire_timeout: int = 300,
+                 serializer: CacheSerializer | None = None,
+                 expire_jitter: float = 0,
+                 breaker: CircuitBreaker | None = None,
+                 ):
         self.redis = redis_conn
+        # разомкнутый предохранитель - кэш пропускается без обращений к Redis
+        self.breaker = breaker
         self.expire_timeout = expire_timeout
+        # доля времени жизни, на которую случайно сокращается срок каждого
+        # ключа, чтобы записанные вместе ключи не истекали одновременно
+        self.expire_jitter = expire_jitter
+        self.serializer = serializer or CacheSerializer()
 
-    async def get_object(self, object_id: UUID) -> dict | None:
-        try:
-            data = await self.redis.get(str(object_id))
-        except ConnectionError as e:
-            data = None
-            logger.error(e)
-        if not data:
-            return None
-        return json.loads(data)
+    async def get_object(self, key: str) -> dict | None:
+        data = await self._execute(key, lambda: self.redis.get(key))
+        return self._loads(key, data)
 
-    async def save_object(self, object_id: UUID, body: dict) -> None:
-        try:
-            await self.redis.set(str(object_id),
-                                 json.dumps(body),
-                                 ex=self.expire_timeout,
-                                 )
-        except ConnectionError as e:
-            logger.error(e)
+    async def get_with_ttl(self, key: str) -> tuple[Any | None, float | None]:
+        async def get_with_pttl():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.pttl(key)
+                return await pipe.execute()
+
+        data, pttl = await self._execute(key, get_with_pttl, (None, None))
+        value = self._loads(key, data)
+        if value is None:
+            return None, None
+        # PTTL отрицателен, если у ключа нет срока жизни
+        return value, pttl / 1000 if pttl > 0 else None
+
+    async def save_object(self, key: str, body: dict) -> None:
+        data = self._dumps(key, body)
+        await self._execute(key, lambda: self.redis.set(key, data, ex=self._expire()), write=True)
+
+    async def get_objects(self, keys: list[str]) -> list[dict | None]:
+        if not keys:
+            return []
+        data = await self._execute(keys[0], lambda: self.redis.mget(keys), [None] * len(keys))
+        return [self._loads(key, item) for key, item in zip(keys, data)]
+
+    async def save_objects(
+        self, objs: dict[str, dict], expire: dict[str, int] | None = None,
+    ) -> None:
+        if not objs:
+            return
+        expire = expire or {}
+
+        async def set_all():
+            # MSET не умеет задавать время жизни, поэтому SET с EX на каждый
+            # ключ; транзакция не нужна, конвейер лишь экономит обращения к сети
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, body in objs.items():
+                    pipe.set(key,
+                             self._dumps(key, body),
+                             ex=self._expire(expire.get(key)),
+                             )
+                await pipe.execute()
+
+        await self._execute(next(iter(objs)), set_all, write=True)
+
+    async def delete_objects(self, keys: list[str]) -> None:
+        if not keys:
+            return
+        await self._execute(keys[0], lambda: self.redis.delete(*keys))
+
+    async def get_id_list(self, key: str) -> list[str] | None:
+        return await self.get_list_objects(key)
+
+    async def save_id_list(self, key: str, ids: list[str]) -> None:
+        await self.save_list_objects(key, ids)
 
     async def get_list_objects(self, key: str) -> list[dict] | None:
-        try:
-            data = await self.redis.get(key)
-        except ConnectionError as e:
-            data = None
-            logger.error(e)
-        if not data:
+        data = await self._execute(key, lambda: self.redis.get(key))
+        objs = self._loads(key, data)
+        if objs is None:
             return None
-        return list(json.loads(data))
+        return list(objs)
 
     async def save_list_objects(self, key: str, objs: list[dict]) -> None:
+        data = self._dumps(key, objs)
+        await self._execute(key, lambda: self.redis.set(key, data, ex=self._expire()), write=True)
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        data = await self._execute(key, lambda: self.redis.get(key))
+        result = "hit" if data else "miss"
+        CACHE_REQUESTS.labels("redis", cache_namespace(key), result).inc()
+        return data or None
+
+    async def save_bytes(self, key: str, data: bytes) -> None:
+        CACHE_PAYLOAD_SIZE.labels(cache_namespace(key), "write").observe(len(data))
+        await self._execute(key, lambda: self.redis.set(key, data, ex=self._expire()), write=True)
+
+    async def get_generation(self, namespace: str) -> int | None:
+        key = GENERATION_KEY.format(namespace)
+        generation = await self._execute(key, lambda: self.redis.get(key), FAILED)
+        if generation is FAILED:
+            return None
+        return int(generation or 0)
+
+    async def incr_generation(self, namespace: str) -> int | None:
+        key = GENERATION_KEY.format(namespace)
+        return await self._execute(key, lambda: self.redis.incr(key))
+
+    async def _execute(
+        self, key: str, command: Callable[[], Awaitable[T]], default: T = None, write: bool = False,
+    ) -> T:
+        """Выполняет команду Redis, при сбое или разомкнутом предохранителе - default.
+
+        Кэш - оптимизация: без Redis ручки работают напрямую с базой, поэтому
+        ошибки Redis не пробрасываются. По той же причине команда не ждёт
+        дольше своей доли бюджета запроса, а запись (write) при нехватке
+        времени не выполняется вовсе. Ключи с неизвестным поколением
+        (см. db.cache_keys) в Redis не читаются и не пишутся.
+        """
+        if not has_generation(key):
+            return default
+        if write and not deadline.has_time(write_reserve):
+            DEADLINE_EXCEEDED.labels("cache_write").inc()
+            return default
+        if self.breaker is not None and not self.breaker.allow():
+            return default
         try:
-            await self.redis.set(key, json.dumps(objs), ex=self.expire_timeout)
-        except ConnectionError as e:
-            logger.error(e)
+            result = await deadline.wait(command(), "redis", deadline_share, cancel=False)
+        except DeadlineExceededError:
+            return default
+        except REDIS_ERRORS as e:
+            if self.breaker is not None:
+                self.breaker.failure()
+            self._error(key, e)
+            return default
+        if self.breaker is not None:
+            self.breaker.success()
+        return result
+
+    def _expire(self, expire_timeout: int | None = None) -> int:
+        """Время жизни ключа с учётом случайного разброса."""
+        expire_timeout = expire_timeout or self.expire_timeout
+        if not self.expire_jitter:
+            return expire_timeout
+        return max(1, round(expire_timeout * (1 - random.uniform(0, self.expire_jitter))))
+
+    def _loads(self, key: str, data: bytes | None):
+        """Разбирает значение из кэша, битое значение считается промахом."""
+        namespace = cache_namespace(key)
+        if not data:
+            CACHE_REQUESTS.labels("redis", namespace, "miss").inc()
+            return None
+        CACHE_PAYLOAD_SIZE.labels(namespace, "read").observe(len(data))
+        try:
+            value = self.serializer.loads(data)
+        except CodecError as e:
+            logger.warning("Cache value can't be decoded: %s", e)
+            CACHE_REQUESTS.labels("redis", namespace, "miss").inc()
+            return None
+        CACHE_REQUESTS.labels("redis", namespace, "hit").inc()
+        return value
+
+    def _dumps(self, key: str, value) -> bytes:
+        data = self.serializer.dumps(value)
+        CACHE_PAYLOAD_SIZE.labels(cache_namespace(key), "write").observe(len(data))
+        return data
+
+    @staticmethod
+    def _error(key: str, e: Exception) -> None:
+        CACHE_REQUESTS.labels("redis", cache_namespace(key), "error").inc()
+        logger.error(e)
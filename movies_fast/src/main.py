@@ -1,12 +1,26 @@
+import asyncio
 import logging
+import math
 
 import aioredis
 from api.v1 import films, genres, persons
 from core.config import settings
+from core.deadline import DeadlineExceededError, DeadlineMiddleware
+from core.metrics import MetricsMiddleware, generate_metrics
 from db import elastic, redis
+from db.circuit_breaker import Backoff, CircuitBreaker, CircuitOpenError
+from db.codecs import CacheSerializer
+from db.hedging import Hedger
+from db.mget import MgetLoader, RequestCacheMiddleware
+from db.msearch import SearchBatcher
 from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.responses import ORJSONResponse
+from services.existence_refresh import refresh_existence_filters_periodically
+from services.genre import refresh_genre_catalog, refresh_genre_catalog_periodically
+from services.invalidation import listen_changes
+from services.person_roles import rebuild_person_roles_periodically
+from services.warmup import warm_up, warm_up_periodically
 
 app = FastAPI(
     title=settings.project_name,
@@ -16,27 +30,126 @@ app = FastAPI(
     openapi_url="/api/openapi.json",
     default_response_class=ORJSONResponse,
 )
+app.add_middleware(MetricsMiddleware)
+if settings.es_mget_batching_enabled:
+    app.add_middleware(RequestCacheMiddleware)
+# бюджет отсчитывается до всех остальных middleware
+app.add_middleware(
+    DeadlineMiddleware, default=settings.request_deadline, routes=settings.request_deadlines,
+)
 
 
 @app.on_event("startup")
 async def startup():
+    # значения кэша хранятся в бинарном виде, поэтому ответы Redis не декодируются
     redis.redis = aioredis.from_url(
         f"redis://{settings.redis_host}:{settings.redis_port}",
-        encoding="utf-8",
-        decode_responses=True,
     )
+    redis.serializer = CacheSerializer(
+        settings.cache_codec,
+        settings.cache_compression,
+        settings.cache_compress_min_size,
+    )
+    redis.deadline_share = settings.deadline_redis_share
+    redis.write_reserve = settings.deadline_cache_write_reserve
+    # повторы с задержкой делает ElasticStorage, а не клиент (см. db.circuit_breaker)
     elastic.es = AsyncElasticsearch(
         hosts=[f"http://{settings.elastic_host}:{settings.elastic_port}"],
+        max_retries=0,
+    )
+    elastic.backoff = Backoff(
+        settings.es_retries, settings.es_retry_base_delay, settings.es_retry_max_delay,
     )
+    if settings.circuit_breaker_enabled:
+        breaker_params = (
+            settings.circuit_breaker_failure_threshold,
+            settings.circuit_breaker_recovery_timeout,
+            settings.circuit_breaker_max_recovery_timeout,
+        )
+        redis.breaker = CircuitBreaker("redis", *breaker_params)
+        elastic.breaker = CircuitBreaker("elasticsearch", *breaker_params)
+    if settings.es_hedging_enabled:
+        elastic.hedger = Hedger(
+            settings.es_hedge_percentile,
+            settings.es_hedge_min_delay,
+            settings.es_hedge_max_rate,
+            settings.es_hedge_min_samples,
+        )
+    if settings.es_msearch_enabled:
+        elastic.search_batcher = SearchBatcher(
+            elastic.es, settings.es_msearch_window, settings.es_msearch_max_batch,
+        )
+    if settings.es_mget_batching_enabled:
+        elastic.mget_loader = MgetLoader(elastic.es, elastic.ElasticStorage._request)
+    # подписка на изменения каталога для сброса кэша
+    app.state.changes_listener = asyncio.create_task(listen_changes(redis.redis))
+    app.state.existence_filters = None
+    if settings.existence_filter_enabled:
+        # пока фильтры не загружены, они пропускают все id
+        app.state.existence_filters = asyncio.create_task(refresh_existence_filters_periodically(
+            redis.redis,
+            settings.existence_filter_refresh_interval,
+            settings.existence_filter_rebuild_interval,
+        ))
+    app.state.person_roles = None
+    if settings.person_roles_enabled:
+        # пока индекс ролей не построен, роли ищутся по индексу фильмов
+        app.state.person_roles = asyncio.create_task(rebuild_person_roles_periodically(
+            redis.redis, settings.person_roles_rebuild_interval,
+        ))
+    app.state.genre_catalog = None
+    if settings.genre_catalog_enabled:
+        # пока каталог не загружен, жанры читаются из кэша и базы
+        await refresh_genre_catalog()
+        app.state.genre_catalog = asyncio.create_task(refresh_genre_catalog_periodically(
+            settings.genre_catalog_refresh_interval,
+        ))
+    app.state.cache_warmer = None
+    if settings.cache_warmup_enabled:
+        # воркер не начнёт принимать запросы, пока кэш не прогреется
+        await warm_up(redis.redis, settings.cache_warmup_timeout)
+        app.state.cache_warmer = asyncio.create_task(warm_up_periodically(
+            redis.redis, settings.cache_warmup_interval, settings.cache_warmup_timeout,
+        ))
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    app.state.changes_listener.cancel()
+    if app.state.existence_filters:
+        app.state.existence_filters.cancel()
+    if app.state.person_roles:
+        app.state.person_roles.cancel()
+    if app.state.genre_catalog:
+        app.state.genre_catalog.cancel()
+    if app.state.cache_warmer:
+        app.state.cache_warmer.cancel()
     # aioredis в версии библиотеки 2.х сам закрывает соединения при сборке
     # мусора, т.е. когда redis.redis будет удалена
     await elastic.es.close()
 
 
+@app.exception_handler(CircuitOpenError)
+async def storage_unavailable(request: Request, exc: CircuitOpenError) -> ORJSONResponse:
+    # клиенту не нужно ждать таймаута: хранилище заведомо недоступно
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_exceeded(request: Request, exc: DeadlineExceededError) -> ORJSONResponse:
+    return ORJSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    data, content_type = generate_metrics()
+    return Response(content=data, media_type=content_type)
+
+
 app.include_router(films.router, prefix="/api/v1/films", tags=["films"])
 app.include_router(genres.router, prefix="/api/v1/genres", tags=["genres"])
 app.include_router(persons.router, prefix="/api/v1/persons", tags=["persons"])
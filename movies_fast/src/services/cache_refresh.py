@@ -0,0 +1,169 @@
+"""Загрузка данных в кэш с фоновым обновлением записей.
+
+У записи кэша два срока: мягкий и жёсткий. Жёсткий - время жизни ключа
+в Redis. После мягкого срока запись считается устаревшей: она сразу
+отдаётся вызывающему коду, а в фоне запускается её обновление
+(stale-while-revalidate). Если обновление не удалось (Elasticsearch
+недоступен или не успел ответить), устаревшая запись продолжает отдаваться
+до жёсткого срока (stale-if-error). Если запись уже пропала из кэша, а
+загрузка при промахе не удалась, отдаётся последняя копия, которую этот
+воркер отдавал по ключу (если она не старше жёсткого срока).
+
+Загрузка при промахе общая для всех одновременных запросов по ключу,
+поэтому она выполняется без бюджета времени запроса, который её начал
+(см. core.deadline): каждый запрос ждёт её не дольше своего бюджета.
+
+Чтобы записи, прогретые одновременно, не устаревали одновременно, до
+мягкого срока работает XFetch: при каждом попадании в кэш с вероятностью,
+растущей по мере приближения к мягкому сроку, запускается фоновая
+загрузка. Вероятность зависит от того, сколько длится загрузка (delta),
+и коэффициента beta: запись обновляется досрочно, если
+delta * beta * -ln(rand) >= время до мягкого срока.
+"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+from functools import partial
+from typing import Awaitable, Callable, TypeVar
+
+from core import deadline
+from core.deadline import without_deadline
+from core.metrics import CACHE_REFRESHES
+from db.local_cache import LRUCache
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# вес последнего замера в скользящем среднем времени загрузки
+DELTA_SMOOTHING = 0.2
+
+
+class CacheRefresher:
+    """Загружает данные при промахах кэша и досрочно обновляет их при попаданиях.
+
+    Загрузки по одному ключу объединяются (см. SingleFlight), время загрузки
+    усредняется отдельно для каждого пространства имён ключей. beta=0
+    отключает досрочное обновление. stale_window - разница между жёстким
+    и мягким сроком записи: запись, которой осталось жить меньше, устарела.
+    stale_size и stale_ttl - сколько последних отданных значений и сколько
+    секунд хранить для stale-if-error при промахе (0 - не хранить).
+    Загрузки каждого вида учитываются в метрике cache_refreshes_total.
+    """
+
+    def __init__(
+        self,
+        beta: float = 1.0,
+        stale_window: float = 0,
+        stale_size: int = 0,
+        stale_ttl: float = 0,
+    ):
+        self.beta = beta
+        self.stale_window = stale_window
+        self.single_flight = SingleFlight()
+        # последние отданные значения по ключам кэша для stale-if-error
+        self.last_served = LRUCache(stale_size, stale_ttl, layer="stale") if stale_size and stale_ttl else None
+        self._delta: dict[str, float] = {}
+
+    async def load(self, namespace: str, key: str, loader: Callable[[], Awaitable[T]]) -> T:
+        """Загружает данные при промахе кэша, одновременные промахи ждут одну загрузку.
+
+        При ошибке загрузки (в том числе по бюджету времени) отдаётся последняя
+        копия значения, если она есть.
+        """
+        CACHE_REFRESHES.labels(namespace, "miss").inc()
+        task = self.single_flight.start(
+            key, lambda: without_deadline(lambda: self._measure(namespace, loader)),
+        )
+        try:
+            # отмена ожидания одного запроса не отменяет общую загрузку
+            value = await deadline.wait(asyncio.shield(task), "elasticsearch")
+        except Exception as e:
+            stale = self.last_served.get(key) if self.last_served is not None else None
+            if stale is None:
+                raise
+            CACHE_REFRESHES.labels(namespace, "stale_if_error").inc()
+            logger.warning("Serving stale %s after load error: %s", key, e)
+            return stale
+        self._remember(key, value)
+        return value
+
+    def hit(
+        self,
+        namespace: str,
+        key: str,
+        ttl: float | None,
+        loader: Callable[[], Awaitable[T]],
+        value: T = None,
+    ) -> None:
+        """Учитывает попадание в кэш и при необходимости запускает фоновое обновление.
+
+        ttl - сколько записи осталось жить в кэше (жёсткий срок), value -
+        отданное из кэша значение (копия для stale-if-error).
+        """
+        self._remember(key, value)
+        if self.is_stale(ttl):
+            self.refresh(namespace, key, loader, "stale")
+        elif self.should_refresh(namespace, ttl):
+            self.refresh(namespace, key, loader, "early")
+
+    def forget(self, keys: list[str]) -> None:
+        """Удаляет копии значений, сброшенных из кэша по изменениям каталога."""
+        if self.last_served is not None:
+            for key in keys:
+                self.last_served.delete(key)
+
+    def is_stale(self, ttl: float | None) -> bool:
+        return ttl is not None and ttl <= self.stale_window
+
+    def should_refresh(self, namespace: str, ttl: float | None) -> bool:
+        if self.beta <= 0 or ttl is None:
+            return False
+        delta = self._delta.get(namespace)
+        if delta is None:
+            return False
+        # 1 - random() лежит в (0, 1], логарифм от него определён
+        return delta * self.beta * -math.log(1 - random.random()) >= ttl - self.stale_window
+
+    def refresh(
+        self,
+        namespace: str,
+        key: str,
+        loader: Callable[[], Awaitable[T]],
+        kind: str = "early",
+    ) -> None:
+        """Запускает фоновую загрузку по ключу, если она ещё не идёт."""
+        if key in self.single_flight:
+            return
+        CACHE_REFRESHES.labels(namespace, kind).inc()
+        # фоновое обновление переживает запрос, который его запустил, и не
+        # ограничено его бюджетом времени
+        task = self.single_flight.start(
+            key, lambda: without_deadline(lambda: self._measure(namespace, loader)),
+        )
+        task.add_done_callback(partial(self._on_refreshed, namespace))
+
+    def _remember(self, key: str, value) -> None:
+        if value and self.last_served is not None:
+            self.last_served.set(key, value)
+
+    async def _measure(self, namespace: str, loader: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        result = await loader()
+        elapsed = time.monotonic() - started
+        delta = self._delta.get(namespace)
+        if delta is None:
+            self._delta[namespace] = elapsed
+        else:
+            self._delta[namespace] = delta + DELTA_SMOOTHING * (elapsed - delta)
+        return result
+
+    def _on_refreshed(self, namespace: str, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            # запись в кэше не тронута и отдаётся дальше до жёсткого срока
+            CACHE_REFRESHES.labels(namespace, "error").inc()
+            logger.error("Background cache refresh failed: %s", task.exception())
@@ -0,0 +1,128 @@
+"""Фильтр существующих id для быстрых ответов 404.
+
+Запрос несуществующего фильма, жанра или персоны всегда проходит мимо кэша
+и уходит в Elasticsearch, а отсутствие объекта не кэшируется. Каждый сервис
+держит фильтр Блума id своего индекса (см. db.bloom): если фильтр говорит,
+что id нет, сервис сразу отвечает, что объект не найден, не обращаясь ни
+к кэшу, ни к базе.
+
+Фильтр строится по всем id индекса (scroll) одним воркером и хранится
+в Redis, остальные воркеры периодически перечитывают его оттуда (см.
+services.existence_refresh). Новые id добавляются в фильтр по уведомлениям
+об изменениях каталога (см. services.invalidation), удалённые пропадают
+при следующей полной пересборке. Пока фильтр не загружен, он пропускает все
+id, поэтому сбой Redis или Elasticsearch не приводит к ложным 404.
+"""
+
+import logging
+from typing import AsyncIterator, Callable, Iterable
+
+from core.metrics import EXISTENCE_FILTER_CHECKS
+from db.bloom import BloomFilter, bit_positions
+from db.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+FILTER_KEY = "existence_filter:{}:{}:{}"
+# id, добавленные с начала последней пересборки: пересборка объединяет их
+# со своим результатом, иначе её запись затёрла бы их биты
+ADDED_KEY = "{}:added"
+# результат пересборки до объединения
+BUILD_KEY = "{}:build"
+
+
+class ExistenceFilter:
+    """Фильтр Блума id одного индекса, общий для воркеров через Redis.
+
+    Размер фильтра зависит только от capacity и error_rate, поэтому воркеры
+    с одинаковыми настройками читают и дополняют один и тот же ключ Redis.
+    Долю ложных срабатываний на реальных запросах несуществующих id можно
+    оценить по метрике existence_filter_checks_total (rejected и false_positive).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        id_source: Callable[[], AsyncIterator[str]],
+        capacity: int,
+        error_rate: float,
+    ):
+        self.name = name
+        self.id_source = id_source
+        self.size, self.hash_count = BloomFilter.optimal_params(capacity, error_rate)
+        self.key = FILTER_KEY.format(name, self.size, self.hash_count)
+        self.added_key = ADDED_KEY.format(self.key)
+        self.build_key = BUILD_KEY.format(self.key)
+        self.filter: BloomFilter | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.filter is not None
+
+    def might_contain(self, obj_id) -> bool:
+        """False - объекта с таким id точно нет, True - он может быть."""
+        if self.filter is None:
+            return True
+        if str(obj_id) in self.filter:
+            return True
+        EXISTENCE_FILTER_CHECKS.labels(self.name, "rejected").inc()
+        return False
+
+    def report_missing(self) -> None:
+        """Учитывает id, пропущенный фильтром, но не найденный в базе."""
+        if self.filter is not None:
+            EXISTENCE_FILTER_CHECKS.labels(self.name, "false_positive").inc()
+
+    async def load(self) -> bool:
+        """Перечитывает фильтр из Redis, возвращает, нашёлся ли он."""
+        redis = await get_redis()
+        data = await redis.get(self.key)
+        if data is None:
+            return False
+        self.filter = BloomFilter(self.size, self.hash_count, data)
+        return True
+
+    async def build(self) -> int:
+        """Строит фильтр по всем id индекса, сохраняет в Redis и возвращает число id."""
+        redis = await get_redis()
+        # id, которые появятся во время прохода по индексу, попадут в ADDED_KEY
+        await redis.delete(self.added_key)
+        bloom = BloomFilter(self.size, self.hash_count)
+        count = 0
+        async for obj_id in self.id_source():
+            bloom.add(obj_id)
+            count += 1
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(self.build_key, bytes(bloom.bits))
+            pipe.bitop("OR", self.key, self.build_key, self.added_key)
+            pipe.delete(self.build_key)
+            await pipe.execute()
+        await self.load()
+        logger.info("Existence filter %s built: %s ids", self.name, count)
+        return count
+
+    async def add(self, obj_ids: Iterable[str], shared: bool = True) -> None:
+        """Добавляет новые id в фильтр воркера и при shared=True - в Redis.
+
+        Фильтр в Redis дополняется, даже если воркер ещё не загрузил свою
+        копию: иначе id пропали бы из общего фильтра до следующей пересборки.
+        """
+        positions = set()
+        for obj_id in obj_ids:
+            if self.filter is not None:
+                positions.update(self.filter.add(str(obj_id)))
+            else:
+                positions.update(bit_positions(str(obj_id), self.size, self.hash_count))
+        if shared and positions:
+            redis = await get_redis()
+            keys = [self.added_key]
+            # SETBIT в ещё не построенный фильтр создал бы в Redis неполный
+            # фильтр, который воркеры загрузили бы как готовый; новые id уже
+            # есть в индексе, и сборка их учтёт
+            if self.filter is not None or await redis.exists(self.key):
+                keys.append(self.key)
+            async with redis.pipeline(transaction=False) as pipe:
+                for pos in positions:
+                    for key in keys:
+                        pipe.setbit(key, pos, 1)
+                await pipe.execute()
@@ -0,0 +1,72 @@
+"""Построение и обновление фильтров существующих id (см. services.existence).
+
+Раз в rebuild_interval один воркер, первым занявший ключ REBUILD_KEY,
+заново строит фильтры по индексам Elasticsearch и сохраняет их в Redis
+(если фильтров в Redis ещё нет - тоже только он), остальные воркеры
+каждые interval секунд перечитывают фильтры из Redis - так до них доходят
+и пересборка, и id, добавленные по уведомлениям об изменениях каталога.
+"""
+
+import asyncio
+import logging
+
+from aioredis import Redis
+from aioredis.exceptions import ConnectionError as RedisConError
+from aioredis.exceptions import TimeoutError as RedisTimeoutError
+from elasticsearch import TransportError
+
+from services import film, genre, person
+from services.existence import ExistenceFilter
+
+logger = logging.getLogger(__name__)
+
+REBUILD_KEY = "existence_filter_rebuild"
+
+
+async def get_existence_filters() -> list[ExistenceFilter]:
+    film_service = film.get_film_service(
+        cache_db=await film.get_redis_cache(), storage_db=await film.get_elastic_stor(),
+    )
+    genre_service = genre.get_genre_service(
+        cache_db=await genre.get_redis_cache(), storage_db=await genre.get_elastic_stor(),
+    )
+    person_service = person.get_person_service(
+        cache_db=await person.get_redis_cache(), storage_db=await person.get_elastic_stor(),
+    )
+    return [film_service.id_filter, genre_service.id_filter, person_service.id_filter]
+
+
+async def refresh_existence_filters(redis: Redis, rebuild_interval: float) -> None:
+    """Перечитывает фильтры из Redis или пересобирает их, если пришла очередь."""
+    rebuild = False
+    try:
+        rebuild = await redis.set(REBUILD_KEY, 1, nx=True, ex=int(rebuild_interval))
+        for id_filter in await get_existence_filters():
+            # фильтр, которого ещё нет в Redis, строит только воркер, занявший
+            # REBUILD_KEY, а до этого фильтр воркера пропускает все id
+            if rebuild:
+                await id_filter.build()
+            else:
+                await id_filter.load()
+        return
+    except (RedisConError, RedisTimeoutError, OSError, TransportError) as e:
+        # воркер продолжает работать со старым фильтром
+        logger.error(e)
+    except Exception:
+        logger.exception("Existence filters refresh failed")
+    if not rebuild:
+        return
+    # следующую попытку сделает любой воркер при следующем перечитывании
+    try:
+        await redis.delete(REBUILD_KEY)
+    except (RedisConError, RedisTimeoutError, OSError) as e:
+        logger.error(e)
+
+
+async def refresh_existence_filters_periodically(
+    redis: Redis, interval: float, rebuild_interval: float,
+) -> None:
+    """Обновляет фильтры при старте и затем периодически, пока задачу не отменят."""
+    while True:
+        await refresh_existence_filters(redis, rebuild_interval)
+        await asyncio.sleep(interval)
@@ -1,42 +1,53 @@
-from functools import lru_cache
+from functools import lru_cache, partial
 import logging
 from uuid import UUID
 
 from fastapi import Depends
 
+from core.config import settings
 from db.abs_storages import BaseCacheStorage, BaseDbStorage
-from db.elastic import get_elastic, ElasticStorage
-from db.redis import get_redis, RedisCacheStorage
+from db.cache_keys import CacheKeys
+from db.elastic import get_elastic, get_mget_loader, get_search_batcher, ElasticStorage
+from db.local_cache import LocalCacheStorage
+from db.redis import get_breaker, get_redis, get_serializer, RedisCacheStorage
 from models.film import Film
 from models.genre import Genre
 from models.person import Person
+from services.cache_refresh import CacheRefresher
+from services.existence import ExistenceFilter
 
 
 logger = logging.getLogger(__name__)
 
-FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
+# кэш сбрасывается по уведомлениям об изменениях (services.invalidation),
+# поэтому время жизни записей может быть большим. Это жёсткий срок: после
+# мягкого (settings.film_cache_soft_expire) запись отдаётся, но обновляется в фоне
+FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 60 * 6  # 6 часов
+# пространства имён ключей кэша: отдельные фильмы и страницы поиска фильмов
+FILM_NAMESPACE = "film"
+FILM_SEARCH_NAMESPACE = "film_search"
 
 
 class FilmService:
     def __init__(self, cache_stor: BaseCacheStorage, db_stor: BaseDbStorage):
         self.cache_stor = cache_stor
         self.db_stor = db_stor
+        self.refresher = CacheRefresher(
+            settings.film_cache_refresh_beta,
+            max(0, FILM_CACHE_EXPIRE_IN_SECONDS - settings.film_cache_soft_expire),
+            settings.local_cache_max_size,
+            FILM_CACHE_EXPIRE_IN_SECONDS,
+        )
+        self.film_keys = CacheKeys(cache_stor, FILM_NAMESPACE, settings.cache_generation_ttl)
+        self.search_keys = CacheKeys(cache_stor, FILM_SEARCH_NAMESPACE, settings.cache_generation_ttl)
+        self.id_filter = ExistenceFilter(FILM_NAMESPACE,
+                                         db_stor.get_film_ids,
+                                         settings.existence_filter_capacity,
+                                         settings.existence_filter_error_rate,
+                                         )
 
     @staticmethod
-    def _compile_cache_key(page: int,
-                           page_size: int,
-                           filter_genre: UUID | None,
-                           query: str | None,
-                           sort: str,
-                           ) -> str:
-        return f'page[number]:={page}&' \
-               f'page[size]:={page_size}&' \
-               f'filter[genre]:={filter_genre}&' \
-               f'query:={query}&' \
-               f'sort:={sort}'
-
-    @staticmethod
-    def _prepare_film_result(film: dict) -> Film:
+    def prepare_film_result(film: dict) -> Film:
         genres = []
         for item in film['genre']:
             genres.append(Genre(id=item['id'], name=item['name'], description=''))
@@ -73,14 +84,10 @@ class FilmService:
         )
 
     async def get_by_id(self, film_id: UUID | None) -> Film | None:
-        film = await self.cache_stor.get_object(film_id)
+        film = await self.get_raw_by_id(film_id)
         if not film:
-            film = await self.db_stor.get_film(film_id)
-            if not film:
-                return None
-            await self.cache_stor.save_object(film_id, film)
-        film = self._prepare_film_result(film)
-        return film
+            return None
+        return self.prepare_film_result(film)
 
     async def get_by_query(self,
                            page: int | None = 1,
@@ -88,28 +95,116 @@ class FilmService:
                            filter_genre: UUID | None = None,
                            query: str | None = None,
                            sort: str = '-imdb_rating') -> list[Film] | None:
+        films = await self.get_raw_by_query(page, page_size, filter_genre, query, sort)
+        if not films:
+            return None
+        return [self.prepare_film_result(film) for film in films]
+
+    async def get_raw_by_id(self, film_id: UUID | None) -> dict | None:
+        """Возвращает фильм по id в том виде, в каком он хранится в кэше."""
+        if not self.id_filter.might_contain(film_id):
+            # такого фильма точно нет, ни кэш, ни база не нужны
+            return None
+        cache_key = await self.film_keys.entity(film_id)
+        loader = partial(self._load_film, cache_key, film_id)
+        film, ttl = await self.cache_stor.get_with_ttl(cache_key)
+        if film:
+            self.refresher.hit(FILM_NAMESPACE, cache_key, ttl, loader, film)
+        else:
+            # одновременные промахи по одному фильму ждут один запрос в базу
+            film = await self.refresher.load(FILM_NAMESPACE, cache_key, loader)
+            if not film:
+                self.id_filter.report_missing()
+                return None
+        return film
+
+    async def get_raw_by_query(self,
+                               page: int | None = 1,
+                               page_size: int | None = 10,
+                               filter_genre: UUID | None = None,
+                               query: str | None = None,
+                               sort: str = '-imdb_rating') -> list[dict] | None:
+        """Ищет фильмы и возвращает их в том виде, в каком они хранятся в кэше."""
         if page is None or page < 1:
             page = 1
         if page_size is None or page_size < 1:
             page_size = 10
-        cache_key = self._compile_cache_key(page=page,
-                                            page_size=page_size,
-                                            filter_genre=filter_genre,
-                                            query=query,
-                                            sort=sort,
-                                            )
-        films = await self.cache_stor.get_list_objects(cache_key)
-        if not films:
-            films = await self.db_stor.search_film(query=query,
+        cache_key = await self.search_keys.query(page=page,
+                                                 page_size=page_size,
+                                                 filter_genre=filter_genre,
+                                                 query=query,
+                                                 sort=sort,
+                                                 )
+        # в кэше списка лежат только id фильмов, сами фильмы - под своими
+        # ключами, поэтому список собирается одним запросом к кэшу
+        loader = partial(self._load_films,
+                         cache_key,
+                         query=query,
+                         filter_genre=filter_genre,
+                         offset=page_size * (page - 1),
+                         limit=page_size,
+                         sort=sort,
+                         )
+        film_ids, ttl = await self.cache_stor.get_with_ttl(cache_key)
+        films = await self._get_films_by_ids(film_ids) if film_ids else None
+        if films:
+            self.refresher.hit(FILM_SEARCH_NAMESPACE, cache_key, ttl, loader, films)
+        else:
+            films = await self.refresher.load(FILM_SEARCH_NAMESPACE, cache_key, loader)
+            if not films:
+                return None
+        return films
+
+    async def get_raw_by_cursor(self,
+                                cursor: str,
+                                page_size: int | None = 10,
+                                filter_genre: UUID | None = None,
+                                query: str | None = None,
+                                sort: str = '-imdb_rating',
+                                ) -> tuple[list[dict], str | None] | None:
+        """Ищет страницу фильмов после курсора, возвращает её и курсор следующей.
+
+        Страницы по курсору не кэшируются: обход каталога читает каждую один
+        раз, а курсоры с point in time у каждого обхода свои.
+        """
+        if page_size is None or page_size < 1:
+            page_size = 10
+        return await self.db_stor.search_film_page(cursor,
+                                                   query=query,
                                                    filter_genre=filter_genre,
-                                                   offset=page_size * (page - 1),
                                                    limit=page_size,
                                                    sort=sort,
                                                    )
-            if not films:
-                return None
-            await self.cache_stor.save_list_objects(cache_key, films)
-        return [self._prepare_film_result(film) for film in films]
+
+    async def _load_film(self, cache_key: str, film_id: UUID) -> dict | None:
+        """Загружает фильм из базы и сохраняет его в кэш."""
+        film = await self.db_stor.get_film(film_id)
+        if film:
+            await self.cache_stor.save_object(cache_key, film)
+        return film
+
+    async def _load_films(self, cache_key: str, **search_params) -> list[dict] | None:
+        """Ищет фильмы в базе, сохраняет в кэш фильмы и список их id."""
+        films = await self.db_stor.search_film(**search_params)
+        if films:
+            film_ids = [film["id"] for film in films]
+            film_keys = await self.film_keys.entities(film_ids)
+            await self.cache_stor.save_objects(dict(zip(film_keys, films)))
+            await self.cache_stor.save_id_list(cache_key, film_ids)
+        return films
+
+    async def _get_films_by_ids(self, film_ids: list[str]) -> list[dict]:
+        """Собирает фильмы по списку id: из кэша одним запросом, недостающие - из базы."""
+        film_keys = await self.film_keys.entities(film_ids)
+        films = await self.cache_stor.get_objects(film_keys)
+        missed = [film_id for film_id, film in zip(film_ids, films) if not film]
+        if missed:
+            found = {film["id"]: film for film in await self.db_stor.get_films(missed)}
+            found_keys = await self.film_keys.entities(list(found))
+            await self.cache_stor.save_objects(dict(zip(found_keys, found.values())))
+            films = [film or found.get(film_id) for film_id, film in zip(film_ids, films)]
+        # фильм мог быть удалён из базы, пока жил список
+        return [film for film in films if film]
 
 # Ниже определяется тип хранилища и кэша, с которыми будет работать FilmService.
 # Нужно подготовить и отдать переменные с объектами хранилищ в создаваемый класс.
@@ -118,15 +213,24 @@ class FilmService:
 
 
 # объявляем один объект на модуль
-redis_cache_film: RedisCacheStorage | None = None
+redis_cache_film: LocalCacheStorage | None = None
 elastic_film: ElasticStorage | None = None
 
 
-async def get_redis_cache() -> RedisCacheStorage:
+async def get_redis_cache() -> LocalCacheStorage:
     global redis_cache_film
     if redis_cache_film is None:
         redis = await get_redis()
-        redis_cache_film = RedisCacheStorage(redis, FILM_CACHE_EXPIRE_IN_SECONDS)
+        redis_cache_film = LocalCacheStorage(
+            RedisCacheStorage(redis,
+                              FILM_CACHE_EXPIRE_IN_SECONDS,
+                              get_serializer(),
+                              settings.film_cache_expire_jitter,
+                              get_breaker(),
+                              ),
+            settings.local_cache_max_size,
+            settings.local_cache_ttl,
+        )
     return redis_cache_film
 
 
@@ -134,7 +238,12 @@ async def get_elastic_stor() -> ElasticStorage:
     global elastic_film
     if elastic_film is None:
         elastic_conn = await get_elastic()
-        elastic_film = ElasticStorage(elastic_conn)
+        elastic_film = ElasticStorage(
+            elastic_conn,
+            settings.es_pit_keep_alive,
+            await get_search_batcher(),
+            await get_mget_loader(),
+        )
     return elastic_film
 
 
@@ -1,65 +1,165 @@
+import asyncio
 import logging
-from functools import lru_cache
+from functools import lru_cache, partial
 from uuid import UUID
 
 from fastapi import Depends
 
+from core.config import settings
 from db.abs_storages import BaseCacheStorage, BaseDbStorage
-from db.elastic import get_elastic, ElasticStorage
-from db.redis import get_redis, RedisCacheStorage
+from db.cache_keys import CacheKeys
+from db.elastic import get_elastic, get_mget_loader, get_search_batcher, ElasticStorage
+from db.local_cache import LocalCacheStorage
+from db.redis import get_breaker, get_redis, get_serializer, RedisCacheStorage
 from models.genre import Genre
+from services.cache_refresh import CacheRefresher
+from services.existence import ExistenceFilter
+from services.genre_catalog import GenreCatalog
 
-GENRE_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
+# кэш сбрасывается по уведомлениям об изменениях (services.invalidation),
+# поэтому время жизни записей может быть большим. Это жёсткий срок: после
+# мягкого (settings.genre_cache_soft_expire) запись отдаётся, но обновляется в фоне
+GENRE_CACHE_EXPIRE_IN_SECONDS = 60 * 60 * 6  # 6 часов
+# пространства имён ключей кэша: отдельные жанры и страницы списка жанров
+GENRE_NAMESPACE = "genre"
+GENRE_LIST_NAMESPACE = "genre_list"
 
 
 class GenreService:
     def __init__(self, cache_stor: BaseCacheStorage, db_stor: BaseDbStorage):
         self.cache_stor = cache_stor
         self.db_stor = db_stor
+        self.refresher = CacheRefresher(
+            settings.genre_cache_refresh_beta,
+            max(0, GENRE_CACHE_EXPIRE_IN_SECONDS - settings.genre_cache_soft_expire),
+            settings.local_cache_max_size,
+            GENRE_CACHE_EXPIRE_IN_SECONDS,
+        )
+        self.genre_keys = CacheKeys(cache_stor, GENRE_NAMESPACE, settings.cache_generation_ttl)
+        self.list_keys = CacheKeys(cache_stor, GENRE_LIST_NAMESPACE, settings.cache_generation_ttl)
+        self.id_filter = ExistenceFilter(
+            GENRE_NAMESPACE,
+            db_stor.get_genre_ids,
+            settings.existence_filter_capacity,
+            settings.existence_filter_error_rate,
+        )
+        self.catalog = GenreCatalog()
 
     async def get_by_id(self, genre_id: UUID) -> Genre | None:
         """Возвращает объект жанра по id."""
+        genre = await self.get_raw_by_id(genre_id)
+        if not genre:
+            return None
+        return Genre(**genre)
+
+    async def get_genre_list(
+        self,
+        page: int | None = 1,
+        size: int | None = 10,
+    ) -> list[Genre] | None:
+        """Возвращает список жанров."""
+        genres = await self.get_raw_genre_list(page, size)
+        if not genres:
+            return None
+        return [Genre(**genre) for genre in genres]
+
+    async def get_raw_by_id(self, genre_id: UUID) -> dict | None:
+        """Возвращает жанр по id в том виде, в каком он хранится в кэше."""
+        genre = self.catalog.get(genre_id)
+        if genre:
+            return genre
+        # жанра может не быть в каталоге, если его добавили после загрузки
+        if not self.id_filter.might_contain(genre_id):
+            # такого жанра точно нет, ни кэш, ни база не нужны
+            return None
         # Пытаемся получить данные из кеша
-        genre = await self.cache_stor.get_object(genre_id)
+        cache_key = await self.genre_keys.entity(genre_id)
+        loader = partial(self._load_genre, cache_key, genre_id)
+        genre, ttl = await self.cache_stor.get_with_ttl(cache_key)
         if genre:
             logging.debug("Genre cache hit - %s", genre["name"])
+            self.refresher.hit(GENRE_NAMESPACE, cache_key, ttl, loader, genre)
         if not genre:
-            # нет в кеше - ищем в базе
-            genre = await self.db_stor.get_genre(genre_id)
+            # нет в кеше - ищем в базе, одновременные промахи ждут один запрос
+            genre = await self.refresher.load(GENRE_NAMESPACE, cache_key, loader)
             if not genre:
+                self.id_filter.report_missing()
                 return None
-            await self.cache_stor.save_object(genre_id, genre)
-            logging.debug("Genre saved to cache - %s", genre["name"])
-        return Genre(**genre)
+        return genre
 
-    async def get_genre_list(
+    async def get_raw_genre_list(
         self,
         page: int | None = 1,
         size: int | None = 10,
-    ) -> list[Genre] | None:
-        """Возвращает список жанров."""
+    ) -> list[dict] | None:
+        """Возвращает страницу жанров в том виде, в каком они хранятся в кэше."""
         if page is None or page < 1:
             page = 1
         if size is None or size < 1:
             size = 10
-        cache_key = self._get_cache_key(page, size)
-        # ищем в кеше по ключу
-        genres = await self.cache_stor.get_list_objects(cache_key)
+        if self.catalog.loaded:
+            return self.catalog.page(size * (page - 1), size) or None
+        cache_key = await self.list_keys.query(page=page, size=size)
+        # ищем в кеше по ключу список id, а жанры - под их собственными ключами
+        loader = partial(self._load_genre_list, cache_key, page, size)
+        genre_ids, ttl = await self.cache_stor.get_with_ttl(cache_key)
+        genres = await self._get_genres_by_ids(genre_ids) if genre_ids else None
         if genres:
             logging.debug("Genre list cache hit - %s", cache_key)
+            self.refresher.hit(GENRE_LIST_NAMESPACE, cache_key, ttl, loader, genres)
         if not genres:
             # ищем в базе
-            genres = await self.db_stor.get_list_genre(size * (page - 1), size)
+            genres = await self.refresher.load(GENRE_LIST_NAMESPACE, cache_key, loader)
             if not genres:
                 return None
-            # сохраняем в кэш
-            await self.cache_stor.save_list_objects(cache_key, genres)
+        return genres
+
+    def resolve_genre(self, value: str | None) -> str | None:
+        """Id жанра для фильтра фильмов: фильтр можно задать и названием жанра."""
+        if not value:
+            return value
+        return self.catalog.resolve(value)
+
+    async def refresh_catalog(self) -> None:
+        """Перечитывает каталог жанров из базы, при сбое остаётся прежний."""
+        try:
+            genres = await self.db_stor.get_all_genres()
+        except Exception:
+            logging.exception("Genre catalog refresh failed")
+            return
+        self.catalog.replace(genres)
+        logging.debug("Genre catalog loaded - %s", len(genres))
+
+    async def _load_genre(self, cache_key: str, genre_id: UUID) -> dict | None:
+        """Загружает жанр из базы и сохраняет его в кэш."""
+        genre = await self.db_stor.get_genre(genre_id)
+        if genre:
+            await self.cache_stor.save_object(cache_key, genre)
+            logging.debug("Genre saved to cache - %s", genre["name"])
+        return genre
+
+    async def _load_genre_list(self, cache_key: str, page: int, size: int) -> list[dict] | None:
+        """Загружает страницу жанров из базы и сохраняет её в кэш."""
+        genres = await self.db_stor.get_list_genre(size * (page - 1), size)
+        if genres:
+            genre_ids = [genre["id"] for genre in genres]
+            genre_keys = await self.genre_keys.entities(genre_ids)
+            await self.cache_stor.save_objects(dict(zip(genre_keys, genres)))
+            await self.cache_stor.save_id_list(cache_key, genre_ids)
             logging.debug("Genre list saved to cache - %s", cache_key)
-        return [Genre(**genre) for genre in genres]
+        return genres
 
-    @staticmethod
-    def _get_cache_key(page: int, size: int) -> str:
-        return f"genres_page:{page}_size:{size}"
+    async def _get_genres_by_ids(self, genre_ids: list[str]) -> list[dict]:
+        """Собирает жанры по списку id: из кэша одним запросом, недостающие - из базы."""
+        genre_keys = await self.genre_keys.entities(genre_ids)
+        genres = await self.cache_stor.get_objects(genre_keys)
+        missed = [genre_id for genre_id, genre in zip(genre_ids, genres) if not genre]
+        if missed:
+            found = {genre["id"]: genre for genre in await self.db_stor.get_genres(missed)}
+            found_keys = await self.genre_keys.entities(list(found))
+            await self.cache_stor.save_objects(dict(zip(found_keys, found.values())))
+            genres = [genre or found.get(genre_id) for genre_id, genre in zip(genre_ids, genres)]
+        return [genre for genre in genres if genre]
 
 
 # Ниже определяется тип хранилища и кэша, с которыми будет работать GenreService.
@@ -69,15 +169,24 @@ class GenreService:
 
 
 # объявляем один объект на модуль
-redis_cache_genre: RedisCacheStorage | None = None
+redis_cache_genre: LocalCacheStorage | None = None
 elastic_genre: ElasticStorage | None = None
 
 
-async def get_redis_cache() -> RedisCacheStorage:
+async def get_redis_cache() -> LocalCacheStorage:
     global redis_cache_genre
     if redis_cache_genre is None:
         redis = await get_redis()
-        redis_cache_genre = RedisCacheStorage(redis, GENRE_CACHE_EXPIRE_IN_SECONDS)
+        redis_cache_genre = LocalCacheStorage(
+            RedisCacheStorage(redis,
+                              GENRE_CACHE_EXPIRE_IN_SECONDS,
+                              get_serializer(),
+                              settings.genre_cache_expire_jitter,
+                              get_breaker(),
+                              ),
+            settings.local_cache_max_size,
+            settings.local_cache_ttl,
+        )
     return redis_cache_genre
 
 
@@ -85,7 +194,12 @@ async def get_elastic_stor() -> ElasticStorage:
     global elastic_genre
     if elastic_genre is None:
         elastic_conn = await get_elastic()
-        elastic_genre = ElasticStorage(elastic_conn)
+        elastic_genre = ElasticStorage(
+            elastic_conn,
+            settings.es_pit_keep_alive,
+            await get_search_batcher(),
+            await get_mget_loader(),
+        )
     return elastic_genre
 
 
@@ -95,3 +209,18 @@ def get_genre_service(
     storage_db: BaseDbStorage = Depends(get_elastic_stor),
 ) -> GenreService:
     return GenreService(cache_db, storage_db)
+
+
+async def refresh_genre_catalog() -> None:
+    """Загружает каталог жанров воркера."""
+    genre_service = get_genre_service(
+        cache_db=await get_redis_cache(), storage_db=await get_elastic_stor(),
+    )
+    await genre_service.refresh_catalog()
+
+
+async def refresh_genre_catalog_periodically(interval: float) -> None:
+    """Периодически перечитывает каталог жанров, пока задачу не отменят."""
+    while True:
+        await asyncio.sleep(interval)
+        await refresh_genre_catalog()
@@ -0,0 +1,54 @@
+"""Каталог жанров в памяти воркера.
+
+Жанров немного, и они почти не меняются, поэтому каждый воркер держит
+их все в памяти: словарь id -> жанр и список в порядке базы (страницы
+списка жанров из каталога и из базы совпадают).
+Каталог загружается при старте и затем перечитывается периодически и по
+уведомлениям об изменениях жанров (см. services.invalidation), так что
+ручки жанров и поиск жанра по названию для фильтра фильмов не обращаются
+ни к Redis, ни к Elasticsearch.
+"""
+
+from uuid import UUID
+
+
+class GenreCatalog:
+    """Все жанры каталога: по id, по названию и списком в порядке базы.
+
+    Пустой каталог считается незагруженным: тогда сервис жанров работает
+    через кэш и базу, как без каталога.
+    """
+
+    def __init__(self):
+        self.by_id: dict[str, dict] = {}
+        self.by_name: dict[str, dict] = {}
+        self.ordered: list[dict] = []
+
+    def __len__(self) -> int:
+        return len(self.ordered)
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.ordered)
+
+    def replace(self, genres: list[dict]) -> None:
+        """Заменяет содержимое каталога целиком.
+
+        Новые структуры собираются отдельно и подменяются одним
+        присваиванием, поэтому запросы видят либо старый, либо новый каталог.
+        """
+        ordered = list(genres)
+        by_id = {genre["id"]: genre for genre in ordered}
+        by_name = {genre["name"].casefold(): genre for genre in ordered}
+        self.by_id, self.by_name, self.ordered = by_id, by_name, ordered
+
+    def get(self, genre_id: UUID | str) -> dict | None:
+        return self.by_id.get(str(genre_id))
+
+    def page(self, offset: int, limit: int) -> list[dict]:
+        return self.ordered[offset:offset + limit]
+
+    def resolve(self, value: str) -> str:
+        """Id жанра по id или названию, неизвестное значение возвращается как есть."""
+        genre = self.by_id.get(value) or self.by_name.get(value.casefold())
+        return genre["id"] if genre else value
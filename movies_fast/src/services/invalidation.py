@@ -0,0 +1,199 @@
+"""Сброс кэша по уведомлениям об изменениях каталога.
+
+ETL (или администратор, см. utils/publish_changes.py) публикует в канал
+Redis CHANGES_CHANNEL сообщение с id изменившихся фильмов, жанров и персон:
+
+    {"id": "<uuid сообщения>", "films": [...], "genres": [...], "persons": [...]}
+
+Каждый воркер API подписан на канал и удаляет ключи изменившихся объектов
+из Redis и своего in-process кэша. Зависящие от них списки сбрасываются
+увеличением поколения пространства имён (см. db.cache_keys) - это делает
+только один воркер, получивший сообщение первым. Новые поколения он
+публикует в тот же канал сообщением
+
+    {"generations": {"<namespace>": <поколение>}}
+
+Остальные воркеры переходят на них сразу, а не через generation_ttl:
+перечитывать поколение раньше, чем его увеличат, бесполезно.
+
+Id из сообщения добавляются в фильтры существующих id (см.
+services.existence), иначе новые объекты до пересборки фильтров
+отдавались бы как ненайденные. Персоны хранятся вместе с ролями
+и фильмами, поэтому если изменение фильма меняет состав его участников,
+ETL должен передать и id этих персон. Если включён индекс ролей персон
+(см. services.person_roles), воркер, получивший сообщение первым,
+пересчитывает в нём роли этих персон и текущих участников изменившихся
+фильмов.
+"""
+
+import asyncio
+import logging
+import uuid
+from typing import Iterable
+
+import orjson
+from aioredis import Redis
+
+from core.config import settings
+from db.cache_keys import CacheKeys
+from db.circuit_breaker import backoff_delay
+from services import film, genre, person, person_roles, response_cache
+
+logger = logging.getLogger(__name__)
+
+CHANGES_CHANNEL = "catalog_changes"
+# ключ, по которому воркеры определяют, кто из них сбрасывает поколения
+CHANGES_LOCK_KEY = "catalog_changes_lock:{}"
+CHANGES_LOCK_EXPIRE_IN_SECONDS = 60
+# задержка переподписки после сбоя: растёт от RECONNECT_DELAY до MAX_RECONNECT_DELAY
+RECONNECT_DELAY_IN_SECONDS = 1
+MAX_RECONNECT_DELAY_IN_SECONDS = 30
+
+
+async def publish_changes(
+    redis: Redis,
+    films: Iterable[str] = (),
+    genres: Iterable[str] = (),
+    persons: Iterable[str] = (),
+) -> int:
+    """Публикует изменения каталога, возвращает число получивших воркеров."""
+    message = {
+        "id": str(uuid.uuid4()),
+        "films": [str(film_id) for film_id in films],
+        "genres": [str(genre_id) for genre_id in genres],
+        "persons": [str(person_id) for person_id in persons],
+    }
+    return await redis.publish(CHANGES_CHANNEL, orjson.dumps(message))
+
+
+async def get_services() -> tuple[film.FilmService, genre.GenreService, person.PersonService,
+                                  response_cache.ResponseCacheService]:
+    film_service = film.get_film_service(
+        cache_db=await film.get_redis_cache(), storage_db=await film.get_elastic_stor(),
+    )
+    genre_service = genre.get_genre_service(
+        cache_db=await genre.get_redis_cache(), storage_db=await genre.get_elastic_stor(),
+    )
+    person_service = person.get_person_service(
+        cache_db=await person.get_redis_cache(), storage_db=await person.get_elastic_stor(),
+    )
+    response_service = response_cache.get_response_cache_service(
+        cache_db=await response_cache.get_redis_cache(),
+    )
+    return film_service, genre_service, person_service, response_service
+
+
+async def apply_changes(changes: dict, shared: bool = True) -> dict[str, int]:
+    """Сбрасывает кэш изменившихся объектов и зависящих от них списков.
+
+    shared=False - поколения списков не увеличиваются (их присылает
+    воркер, который их увеличил, см. apply_generations), и новые id не
+    записываются в фильтры в Redis: это делает другой воркер. Возвращает
+    новые поколения пространств имён.
+    """
+    film_service, genre_service, person_service, response_service = await get_services()
+    person_ids = changes.get("persons") or []
+    if shared and settings.person_roles_enabled:
+        # роли пересчитываются до удаления персон из кэша, иначе персона
+        # могла бы снова попасть в кэш со старыми ролями
+        person_ids = await person_roles.update_roles(person_service, person_ids, changes.get("films") or [])
+    # готовые ответы ручек зависят от всех видов объектов сразу
+    lists: list[CacheKeys] = [response_service.keys]
+    if film_ids := changes.get("films"):
+        keys = await film_service.film_keys.entities(film_ids)
+        await film_service.cache_stor.delete_objects(keys)
+        film_service.refresher.forget(keys)
+        await film_service.id_filter.add(film_ids, shared)
+        # в списках фильмов персон есть название и рейтинг фильма
+        lists += [film_service.search_keys, person_service.films_keys]
+    if genre_ids := changes.get("genres"):
+        keys = await genre_service.genre_keys.entities(genre_ids)
+        await genre_service.cache_stor.delete_objects(keys)
+        genre_service.refresher.forget(keys)
+        await genre_service.id_filter.add(genre_ids, shared)
+        if settings.genre_catalog_enabled:
+            # каталог в памяти есть у каждого воркера
+            await genre_service.refresh_catalog()
+        lists += [genre_service.list_keys]
+    if person_ids:
+        keys = await person_service.person_keys.entities(person_ids)
+        await person_service.cache_stor.delete_objects(keys)
+        person_service.refresher.forget(keys)
+        await person_service.id_filter.add(person_ids, shared)
+        lists += [person_service.search_keys, person_service.films_keys]
+    generations = {}
+    if shared:
+        for list_keys in {id(keys): keys for keys in lists}.values():
+            generation = await list_keys.invalidate()
+            if generation is not None:
+                generations[list_keys.namespace] = generation
+    logger.info("Cache invalidated for catalog changes %s", changes.get("id"))
+    return generations
+
+
+async def apply_generations(generations: dict[str, int]) -> None:
+    """Переводит ключи воркера на поколения, увеличенные другим воркером."""
+    film_service, genre_service, person_service, response_service = await get_services()
+    all_keys = [
+        film_service.film_keys, film_service.search_keys,
+        genre_service.genre_keys, genre_service.list_keys,
+        person_service.person_keys, person_service.search_keys, person_service.films_keys,
+        response_service.keys,
+    ]
+    for keys in all_keys:
+        if keys.namespace in generations:
+            keys.set_generation(int(generations[keys.namespace]))
+
+
+async def listen_changes(redis: Redis) -> None:
+    """Слушает канал изменений каталога, пока задачу не отменят.
+
+    При любом сбое подписки воркер переподписывается с растущей задержкой,
+    иначе до перезапуска он перестал бы сбрасывать кэш.
+    """
+    attempt = 0
+    while True:
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(CHANGES_CHANNEL)
+            async for message in pubsub.listen():
+                # подписка работает: следующий сбой снова с наименьшей задержкой
+                attempt = 0
+                await _handle_message(redis, message["data"])
+        except Exception:
+            logger.exception("Catalog changes subscription failed")
+        try:
+            await pubsub.reset()
+        except Exception as e:
+            logger.error(e)
+        # задержка не меньше половины базовой, чтобы не переподписываться в цикле
+        await asyncio.sleep(max(
+            RECONNECT_DELAY_IN_SECONDS / 2,
+            backoff_delay(attempt, RECONNECT_DELAY_IN_SECONDS, MAX_RECONNECT_DELAY_IN_SECONDS),
+        ))
+        attempt += 1
+
+
+async def _handle_message(redis: Redis, data: bytes) -> None:
+    try:
+        changes = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        logger.warning("Malformed catalog changes message: %s", data)
+        return
+    if "generations" in changes:
+        await apply_generations(changes["generations"])
+        return
+    message_id = changes.get("id") or CacheKeys.hash_params(changes)
+    shared = await redis.set(
+        CHANGES_LOCK_KEY.format(message_id),
+        1,
+        nx=True,
+        ex=CHANGES_LOCK_EXPIRE_IN_SECONDS,
+    )
+    try:
+        generations = await apply_changes(changes, shared=bool(shared))
+        if generations:
+            await redis.publish(CHANGES_CHANNEL, orjson.dumps({"generations": generations}))
+    except Exception:
+        # сбой обработки одного сообщения не должен останавливать подписку
+        logger.exception("Failed to apply catalog changes %s", message_id)
@@ -1,58 +1,81 @@
 import logging
-from functools import lru_cache
+from functools import lru_cache, partial
 from uuid import UUID
 
 from fastapi import Depends
 
+from core.config import settings
 from db.abs_storages import BaseCacheStorage, BaseDbStorage
-from db.elastic import get_elastic, ElasticStorage
-from db.redis import get_redis, RedisCacheStorage
+from db.cache_keys import CacheKeys
+from db.elastic import get_elastic, get_mget_loader, get_search_batcher, ElasticStorage
+from db.local_cache import LocalCacheStorage
+from db.redis import get_breaker, get_redis, get_serializer, RedisCacheStorage
+from services.cache_refresh import CacheRefresher
+from services.existence import ExistenceFilter
 
-PERSON_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
+# кэш сбрасывается по уведомлениям об изменениях (services.invalidation),
+# поэтому время жизни записей может быть большим. Это жёсткий срок: после
+# мягкого (settings.person_cache_soft_expire) запись отдаётся, но обновляется в фоне
+PERSON_CACHE_EXPIRE_IN_SECONDS = 60 * 60 * 6  # 6 часов
+# пространства имён ключей кэша: персоны (вместе с ролями и фильмами),
+# результаты поиска персон и списки фильмов персон
+PERSON_NAMESPACE = "person"
+PERSON_SEARCH_NAMESPACE = "person_search"
+PERSON_FILMS_NAMESPACE = "person_films"
 
 
 class PersonService:
     def __init__(self, cache_stor: BaseCacheStorage, db_stor: BaseDbStorage):
         self.cache_stor = cache_stor
         self.db_stor = db_stor
+        self.refresher = CacheRefresher(
+            settings.person_cache_refresh_beta,
+            max(0, PERSON_CACHE_EXPIRE_IN_SECONDS - settings.person_cache_soft_expire),
+            settings.local_cache_max_size,
+            PERSON_CACHE_EXPIRE_IN_SECONDS,
+        )
+        self.person_keys = CacheKeys(cache_stor, PERSON_NAMESPACE, settings.cache_generation_ttl)
+        self.search_keys = CacheKeys(cache_stor, PERSON_SEARCH_NAMESPACE, settings.cache_generation_ttl)
+        self.films_keys = CacheKeys(cache_stor, PERSON_FILMS_NAMESPACE, settings.cache_generation_ttl)
+        self.id_filter = ExistenceFilter(
+            PERSON_NAMESPACE,
+            db_stor.get_person_ids,
+            settings.existence_filter_capacity,
+            settings.existence_filter_error_rate,
+        )
 
     async def get_by_id(self, person_id: UUID) -> dict | None:
         """Возвращает персону по id."""
-        person = await self.cache_stor.get_object(person_id)
+        if not self.id_filter.might_contain(person_id):
+            # такой персоны точно нет, ни кэш, ни база не нужны
+            return None
+        cache_key = await self.person_keys.entity(person_id)
+        loader = partial(self._load_person, cache_key, person_id)
+        person, ttl = await self.cache_stor.get_with_ttl(cache_key)
         if person:
             logging.debug("Person cache hit - %s", person["name"])
+            self.refresher.hit(PERSON_NAMESPACE, cache_key, ttl, loader, person)
         if not person:
-            # нет в кеше - ищем в базе
-            # 1 часть словаря: id и name
-            person = await self.db_stor.get_person(person_id)
+            # нет в кеше - ищем в базе, одновременные промахи ждут один запрос
+            person = await self.refresher.load(PERSON_NAMESPACE, cache_key, loader)
             if not person:
-                return None
-            # вытаскиваем детали по персоне: роли и фильмы (2 часть словаря)
-            person_det = await self._get_person_details(person_id)
-            # объединяем словари
-            person = person | person_det
-            # Сохраняем персону в кеш
-            await self.cache_stor.save_object(person_id, person)
-            logging.debug("Person saved to cache - %s", person["name"])
+                self.id_filter.report_missing()
         return person
 
-    @staticmethod
-    def _get_cache_key(prefix: str, page: int, size: int) -> str:
-        return f"{prefix}_page:{page}_size:{size}"
-
-    async def _get_person_details(self, person_id: UUID) -> dict | None:
-        """Возвращает роли и фильмы запрошенной персоны.
-
-        Используется как при запросе "одиночной" ручки, так и ручки поиска персон.
-        """
-        # проверяем кэш: может отдельная ручка запрашивала детали этой персоны
-        person_det = await self.cache_stor.get_object(person_id)
-        if person_det:
-            logging.debug("Person details cache hit - %s", person_id)
-        # не нашли в кэше - ищем в базе
-        if not person_det:
-            person_det = await self.db_stor.get_person_details(person_id)
-        return person_det
+    async def _load_person(self, cache_key: str, person_id: UUID) -> dict | None:
+        """Собирает персону с деталями из базы и сохраняет её в кэш."""
+        # 1 часть словаря: id и name
+        person = await self.db_stor.get_person(person_id)
+        if not person:
+            return None
+        # вытаскиваем детали по персоне: роли и фильмы (2 часть словаря)
+        person_det = (await self._get_details([str(person_id)])).get(str(person_id))
+        # объединяем словари
+        person = person | (person_det or {"role": [], "film_ids": []})
+        # Сохраняем персону в кеш
+        await self.cache_stor.save_object(cache_key, person)
+        logging.debug("Person saved to cache - %s", person["name"])
+        return person
 
     async def search_person(
         self,
@@ -65,36 +88,91 @@ class PersonService:
             page = 1
         if size is None or size < 1:
             size = 10
-        cache_key = self._get_cache_key(f"persons({query})", page, size)
-        # ищем в кеше по ключу
-        persons = await self.cache_stor.get_list_objects(cache_key)
+        cache_key = await self.search_keys.query(query=query, page=page, size=size)
+        # ищем в кеше по ключу список id, а персоны - под их собственными ключами
+        loader = partial(self._load_search, cache_key, query, page, size)
+        pers_ids, ttl = await self.cache_stor.get_with_ttl(cache_key)
+        persons = await self._get_full_persons(pers_ids) if pers_ids else None
         if persons:
             logging.debug("Person search cache hit - %s", cache_key)
+            self.refresher.hit(PERSON_SEARCH_NAMESPACE, cache_key, ttl, loader, persons)
         if not persons:
             # в кеше не найдено - ищем в базе
-            p_list = await self.db_stor.search_person(
-                query, size * (page - 1), size,
-            )
-            if not p_list:
-                return None
-            # запрашиваем детали по каждой персоне, они могут тянуться
-            # как из кэша, так и из базы
-            persons = []
-            for person in p_list:
-                pers_id = UUID(person["id"])
-                pers_det = await self._get_person_details(pers_id)
+            persons = await self.refresher.load(PERSON_SEARCH_NAMESPACE, cache_key, loader)
+        return persons
+
+    async def _load_search(
+        self, cache_key: str, query: str, page: int, size: int,
+    ) -> list[dict] | None:
+        """Ищет персон в базе, дополняет деталями и сохраняет ответ в кэш."""
+        p_list = await self.db_stor.search_person(
+            query, size * (page - 1), size,
+        )
+        if not p_list:
+            return None
+        pers_ids = [person["id"] for person in p_list]
+        persons = await self._get_full_persons(
+            pers_ids, {person["id"]: person for person in p_list},
+        )
+        # в кэш ответа ручки сохраняются только id персон
+        await self.cache_stor.save_id_list(cache_key, pers_ids)
+        logging.debug("Person search saved to cache - %s", cache_key)
+        return persons
+
+    async def _get_full_persons(
+        self, pers_ids: list[str], found: dict[str, dict] | None = None,
+    ) -> list[dict]:
+        """Собирает персон с деталями по списку id.
+
+        Персоны тянутся пачкой: сначала одним запросом из кэша, а недостающие -
+        одним запросом из базы (found - уже известные id и имена персон)
+        и одним запросом деталей.
+        """
+        pers_keys = await self.person_keys.entities(pers_ids)
+        cached = await self.cache_stor.get_objects(pers_keys)
+        missed = [pers_id for pers_id, person in zip(pers_ids, cached) if not person]
+        if not missed:
+            return cached
+        if found is None:
+            found = {person["id"]: person for person in await self.db_stor.get_persons(missed)}
+        details = await self._get_details(missed)
+        persons = []
+        new_persons = {}
+        for pers_id, pers_key, person in zip(pers_ids, pers_keys, cached):
+            if not person:
+                if pers_id not in found:
+                    # персону удалили из базы, пока жил список
+                    continue
                 # слияние словарей id-name + детали
-                full_pers = person | pers_det
-                # сохраняем в кэш отдельную запись персоны
-                await self.cache_stor.save_object(pers_id, full_pers)
-                logging.debug("Person saved to cache - %s", person["name"])
-                # добавляем в итоговый список
-                persons.append(full_pers)
-            # сохраняем в кэш весь ответ ручки
-            await self.cache_stor.save_list_objects(cache_key, persons)
-            logging.debug("Genre list saved to cache - %s", cache_key)
+                pers_det = details.get(pers_id, {"role": [], "film_ids": []})
+                person = found[pers_id] | pers_det
+                new_persons[pers_key] = person
+            persons.append(person)
+        # сохраняем в кэш отдельные записи новых персон
+        await self.cache_stor.save_objects(new_persons)
+        logging.debug("Persons saved to cache - %s", len(new_persons))
         return persons
 
+    async def affected_persons(self, person_ids: list[str], film_ids: list[str]) -> list[str]:
+        """Персоны из уведомления и текущие участники изменившихся фильмов."""
+        affected = {str(person_id) for person_id in person_ids}
+        for film in await self.db_stor.get_films(film_ids) if film_ids else []:
+            for role_type in ("actors", "writers", "directors"):
+                affected.update(pers["id"] for pers in film[role_type])
+        return sorted(affected)
+
+    async def _get_details(self, pers_ids: list[str]) -> dict[str, dict]:
+        """Роли и фильмы персон: из индекса ролей одним _mget, а тех, кого
+        в нём нет (или если индекс выключен), - поиском по индексу фильмов.
+        """
+        details = {}
+        if settings.person_roles_enabled:
+            details = await self.db_stor.get_person_roles(pers_ids)
+        missed = [pers_id for pers_id in pers_ids if pers_id not in details]
+        if missed:
+            details |= await self.db_stor.get_persons_details(missed)
+        return details
+
     async def get_pers_films(
         self,
         person_id: UUID,
@@ -102,22 +180,41 @@ class PersonService:
         size: int | None = 10,
     ) -> list[dict] | None:
         """Выдаёт список фильмов по запрошенной персоне."""
+        if not self.id_filter.might_contain(person_id):
+            return None
         if page is None or page < 1:
             page = 1
         if size is None or size < 1:
             size = 10
-        cache_key = self._get_cache_key(f"pers_films({str(person_id)})", page, size)
+        cache_key = await self.films_keys.query(person_id=person_id, page=page, size=size)
         # ищем в кеше по ключу
-        films = await self.cache_stor.get_list_objects(cache_key)
+        loader = partial(self._load_pers_films, cache_key, person_id, page, size)
+        films, ttl = await self.cache_stor.get_with_ttl(cache_key)
         if films:
             logging.debug("Person films cache hit - %s", cache_key)
+            self.refresher.hit(PERSON_FILMS_NAMESPACE, cache_key, ttl, loader, films)
         if not films:
-            films = await self.db_stor.get_pers_films(
-                person_id, size * (page - 1), size,
-            )
-            if not films:
-                return None
-            # сохраняем в кэш ответ ручки
+            films = await self.refresher.load(PERSON_FILMS_NAMESPACE, cache_key, loader)
+        return films
+
+    async def get_pers_films_by_cursor(
+        self, person_id: UUID, cursor: str, size: int | None = 10,
+    ) -> tuple[list[dict], str | None] | None:
+        """Страница фильмов персоны после курсора и курсор следующей (без кэша)."""
+        if not self.id_filter.might_contain(person_id):
+            return None
+        if size is None or size < 1:
+            size = 10
+        return await self.db_stor.get_pers_films_page(person_id, cursor, size)
+
+    async def _load_pers_films(
+        self, cache_key: str, person_id: UUID, page: int, size: int,
+    ) -> list[dict] | None:
+        """Загружает фильмы персоны из базы и сохраняет ответ ручки в кэш."""
+        films = await self.db_stor.get_pers_films(
+            person_id, size * (page - 1), size,
+        )
+        if films:
             await self.cache_stor.save_list_objects(cache_key, films)
             logging.debug("Person films saved to cache - %s", cache_key)
         return films
@@ -129,15 +226,24 @@ class PersonService:
 
 
 # объявляем один объект на модуль
-redis_cache_genre: RedisCacheStorage | None = None
+redis_cache_genre: LocalCacheStorage | None = None
 elastic_genre: ElasticStorage | None = None
 
 
-async def get_redis_cache() -> RedisCacheStorage:
+async def get_redis_cache() -> LocalCacheStorage:
     global redis_cache_genre
     if redis_cache_genre is None:
         redis = await get_redis()
-        redis_cache_genre = RedisCacheStorage(redis, PERSON_CACHE_EXPIRE_IN_SECONDS)
+        redis_cache_genre = LocalCacheStorage(
+            RedisCacheStorage(redis,
+                              PERSON_CACHE_EXPIRE_IN_SECONDS,
+                              get_serializer(),
+                              settings.person_cache_expire_jitter,
+                              get_breaker(),
+                              ),
+            settings.local_cache_max_size,
+            settings.local_cache_ttl,
+        )
     return redis_cache_genre
 
 
@@ -145,7 +251,12 @@ async def get_elastic_stor() -> ElasticStorage:
     global elastic_genre
     if elastic_genre is None:
         elastic_conn = await get_elastic()
-        elastic_genre = ElasticStorage(elastic_conn)
+        elastic_genre = ElasticStorage(
+            elastic_conn,
+            settings.es_pit_keep_alive,
+            await get_search_batcher(),
+            await get_mget_loader(),
+        )
     return elastic_genre
 
 
@@ -0,0 +1,124 @@
+"""Индекс ролей персон.
+
+Роли и фильмы персоны можно найти только поиском по индексу фильмов
+с разбором всех участников каждого найденного фильма. Индекс ролей хранит
+готовый документ {"id", "role", "film_ids"} на каждую персону, и ручки
+персон читают детали одним get/mget (см. PersonService._get_details).
+
+Раз в rebuild_interval один воркер, первым занявший ключ REBUILD_KEY,
+строит индекс заново за один проход по индексу фильмов (см.
+ElasticStorage.build_person_roles). Между пересборками роли персон
+пересчитываются по уведомлениям об изменениях каталога (см.
+services.invalidation). Персоны, которых ещё нет в индексе ролей, и все
+персоны, пока индекс не построен, ищутся по индексу фильмов, как раньше.
+
+Пересчёт во время пересборки пишется в старый индекс, и после переключения
+псевдонима он бы потерялся. Поэтому, пока стоит ключ BUILDING_KEY, id
+пересчитанных персон копятся в UPDATED_KEY, и сборка пересчитывает их
+в новом индексе.
+"""
+
+import asyncio
+import logging
+from functools import partial
+
+from aioredis import Redis
+from elasticsearch import TransportError
+
+from db.abs_storages import BaseDbStorage
+from db.redis import REDIS_ERRORS, get_redis
+from services import person
+
+logger = logging.getLogger(__name__)
+
+REBUILD_KEY = "person_roles_rebuild"
+# ключ стоит, пока идёт пересборка, и снимается сам, если воркер упал
+BUILDING_KEY = "person_roles_building"
+BUILD_TIMEOUT_IN_SECONDS = 60 * 60
+# множество id персон, пересчитанных во время пересборки
+UPDATED_KEY = "person_roles_updated"
+# как часто воркер проверяет, не пора ли пересобрать индекс
+REBUILD_CHECK_INTERVAL_IN_SECONDS = 60
+
+
+async def update_roles(person_service: person.PersonService, person_ids: list[str], film_ids: list[str]) -> list[str]:
+    """Пересчитывает в индексе ролей персон и участников изменившихся фильмов.
+
+    Возвращает id всех пересчитанных персон: их записи в кэше тоже устарели.
+    """
+    affected = await person_service.affected_persons(person_ids, film_ids)
+    if not affected:
+        return affected
+    try:
+        # id отмечаются до записи: если пересборка закончится между
+        # проверкой и записью, запись уже попадёт в новый индекс
+        redis = await get_redis()
+        if await redis.exists(BUILDING_KEY):
+            await redis.sadd(UPDATED_KEY, *affected)
+    except REDIS_ERRORS as e:
+        logger.error(e)
+    await person_service.db_stor.update_person_roles(affected)
+    return affected
+
+
+async def pop_updated(redis: Redis) -> list[str]:
+    """Забирает id персон, пересчитанных с начала пересборки."""
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.smembers(UPDATED_KEY)
+        pipe.delete(UPDATED_KEY)
+        person_ids, _ = await pipe.execute()
+    return sorted(person_id.decode() for person_id in person_ids)
+
+
+async def rebuild_person_roles(redis: Redis, rebuild_interval: float) -> None:
+    """Пересобирает индекс ролей персон, если пришла очередь этого воркера."""
+    try:
+        if not await redis.set(REBUILD_KEY, 1, nx=True, ex=int(rebuild_interval)):
+            return
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(UPDATED_KEY)
+            pipe.set(BUILDING_KEY, 1, ex=BUILD_TIMEOUT_IN_SECONDS)
+            await pipe.execute()
+    except REDIS_ERRORS as e:
+        logger.error(e)
+        return
+    try:
+        storage = await person.get_elastic_stor()
+        count = await storage.build_person_roles(partial(pop_updated, redis))
+    except TransportError as e:
+        logger.error(e)
+    except Exception:
+        logger.exception("Person roles index build failed")
+    else:
+        logger.info("Person roles index built: %s persons", count)
+        await finish_rebuild(redis, storage)
+        return
+    # следующую попытку сделает любой воркер при следующей проверке
+    try:
+        await redis.delete(REBUILD_KEY, BUILDING_KEY)
+    except REDIS_ERRORS as e:
+        logger.error(e)
+
+
+async def finish_rebuild(redis: Redis, storage: BaseDbStorage) -> None:
+    """Пересчитывает персон, отмеченных между сборкой и переключением псевдонима.
+
+    Псевдоним уже указывает на новый индекс, и после снятия BUILDING_KEY
+    пересчёт пишется прямо в него.
+    """
+    try:
+        await redis.delete(BUILDING_KEY)
+        await storage.update_person_roles(await pop_updated(redis))
+    except (*REDIS_ERRORS, TransportError) as e:
+        logger.error(e)
+
+
+async def rebuild_person_roles_periodically(redis: Redis, rebuild_interval: float) -> None:
+    """Строит индекс ролей при старте и затем периодически, пока задачу не отменят."""
+    while True:
+        try:
+            await rebuild_person_roles(redis, rebuild_interval)
+        except Exception:
+            # задача живёт всё время работы воркера
+            logger.exception("Person roles rebuild check failed")
+        await asyncio.sleep(REBUILD_CHECK_INTERVAL_IN_SECONDS)
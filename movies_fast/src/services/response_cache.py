@@ -0,0 +1,91 @@
+"""Кэш готовых ответов ручек.
+
+Даже при попадании в кэш данных ручка разбирает значения из Redis, строит
+модели бизнес-логики и модели ответа, а FastAPI ещё раз проверяет их
+и сериализует. Кэш ответов хранит итоговые байты тела ответа вместе
+с ETag под ключом из шаблона маршрута и его параметров (см.
+api.v1.http_cache): попадание стоит одного обращения к кэшу и не требует
+работы pydantic.
+
+Ответы зависят от фильмов, жанров и персон сразу, поэтому любое изменение
+каталога сбрасывает весь кэш ответов (см. services.invalidation).
+"""
+
+import logging
+from functools import lru_cache
+from typing import Any
+
+from fastapi import Depends
+
+from core.config import settings
+from db.abs_storages import BaseCacheStorage
+from db.cache_keys import CacheKeys
+from db.local_cache import LocalCacheStorage
+from db.redis import get_breaker, get_redis, get_serializer, RedisCacheStorage
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_NAMESPACE = "response"
+
+
+class ResponseCacheService:
+    def __init__(self, cache_stor: BaseCacheStorage, enabled: bool = True):
+        self.cache_stor = cache_stor
+        self.enabled = enabled
+        self.keys = CacheKeys(cache_stor, RESPONSE_NAMESPACE, settings.cache_generation_ttl)
+
+    async def get(self, route: str, params: Any) -> tuple[str, bytes] | None:
+        """Возвращает ETag и тело сохранённого ответа, None - если его нет."""
+        if not self.enabled:
+            return None
+        key = await self.keys.query(route=route, params=params)
+        data = await self.cache_stor.get_bytes(key)
+        if not data:
+            return None
+        etag, separator, body = data.partition(b"\n")
+        try:
+            etag = etag.decode("ascii")
+        except UnicodeDecodeError:
+            separator = b""
+        if not separator or not etag:
+            # обрезанное или чужое значение - промах, а не ошибка ручки
+            logger.warning("Malformed cached response under %s", key)
+            await self.cache_stor.delete_objects([key])
+            return None
+        return etag, body
+
+    async def save(self, route: str, params: Any, etag: str, body: bytes) -> None:
+        if not self.enabled:
+            return
+        # ETag не содержит переводов строки, поэтому отделяется от тела первым из них
+        await self.cache_stor.save_bytes(
+            await self.keys.query(route=route, params=params), etag.encode() + b"\n" + body,
+        )
+
+
+# объявляем один объект на модуль
+redis_cache_response: LocalCacheStorage | None = None
+
+
+async def get_redis_cache() -> LocalCacheStorage:
+    global redis_cache_response
+    if redis_cache_response is None:
+        redis = await get_redis()
+        redis_cache_response = LocalCacheStorage(
+            RedisCacheStorage(redis,
+                              settings.response_cache_ttl,
+                              get_serializer(),
+                              settings.response_cache_expire_jitter,
+                              get_breaker(),
+                              ),
+            settings.local_cache_max_size,
+            min(settings.local_cache_ttl, settings.response_cache_ttl),
+        )
+    return redis_cache_response
+
+
+@lru_cache()
+def get_response_cache_service(
+    cache_db: BaseCacheStorage = Depends(get_redis_cache),
+) -> ResponseCacheService:
+    return ResponseCacheService(cache_db, settings.response_cache_enabled)
@@ -0,0 +1,36 @@
+"""Объединение одинаковых одновременных запросов к хранилищу (single-flight)."""
+
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Выполняет не более одного вызова на ключ в каждый момент времени.
+
+    Если по ключу (обычно это ключ кэша) уже идёт вызов, остальные корутины
+    не делают свой запрос, а ждут результат уже запущенного. Исключение
+    получают все ожидающие. Отмена одного из ожидающих не отменяет сам вызов.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    def start(self, key: str, func: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        """Запускает вызов по ключу (если он ещё не идёт) и возвращает его задачу."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return task
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        return await asyncio.shield(self.start(key, func))
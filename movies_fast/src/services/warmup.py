@@ -0,0 +1,82 @@
+"""Прогрев кэша самыми популярными страницами каталога.
+
+После деплоя или очистки Redis первые запросы к самым частым страницам
+уходят в Elasticsearch. Прогрев заранее заполняет кэш через обычные
+сервисы: первую страницу фильмов с сортировкой по умолчанию, список жанров
+и лучшие фильмы каждого жанра. Прогрев выполняется при старте и затем
+периодически; чтобы его не делали все воркеры gunicorn, он защищён
+блокировкой в Redis.
+"""
+
+import asyncio
+import logging
+
+from aioredis import Redis
+from aioredis.exceptions import ConnectionError as RedisConError, LockError
+
+from services import film, genre
+
+logger = logging.getLogger(__name__)
+
+WARMUP_LOCK_KEY = "cache_warmup_lock"
+LOCK_POLL_INTERVAL_IN_SECONDS = 0.5
+# сколько жанров прогревать за один раз
+GENRES_LIMIT = 100
+
+
+async def warm_up_cache() -> None:
+    """Заполняет кэш популярными страницами каталога."""
+    film_service = film.get_film_service(
+        cache_db=await film.get_redis_cache(), storage_db=await film.get_elastic_stor(),
+    )
+    genre_service = genre.get_genre_service(
+        cache_db=await genre.get_redis_cache(), storage_db=await genre.get_elastic_stor(),
+    )
+    # параметры совпадают со значениями по умолчанию в ручках api/v1
+    await film_service.get_by_query(page=1, page_size=10, sort="-imdb_rating")
+    await genre_service.get_genre_list(page=1, size=10)
+    genres = await genre_service.get_genre_list(page=1, size=GENRES_LIMIT) or []
+    await asyncio.gather(*(
+        film_service.get_by_query(
+            page=1, page_size=10, filter_genre=str(item.id), sort="-imdb_rating",
+        )
+        for item in genres
+    ))
+    logger.info("Cache warmed up: %s genres", len(genres))
+
+
+async def warm_up(redis: Redis, timeout: float, wait: bool = True) -> None:
+    """Прогревает кэш, если его сейчас не прогревает другой воркер.
+
+    При wait=True воркер, не получивший блокировку, ждёт, пока прогрев
+    закончит другой воркер, - так ни один воркер не начинает принимать
+    запросы на холодном кэше. Ожидание и сам прогрев ограничены timeout.
+    """
+    lock = redis.lock(WARMUP_LOCK_KEY, timeout=timeout)
+    try:
+        if await lock.acquire(blocking=False):
+            try:
+                await asyncio.wait_for(warm_up_cache(), timeout)
+            finally:
+                await lock.release()
+        elif wait:
+            await asyncio.wait_for(_wait_lock_released(redis), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Cache warm-up has not finished in %s s", timeout)
+    except (RedisConError, LockError) as e:
+        logger.error(e)
+    except Exception:
+        # прогрев - оптимизация, его сбой не должен мешать работе API
+        logger.exception("Cache warm-up failed")
+
+
+async def warm_up_periodically(redis: Redis, interval: float, timeout: float) -> None:
+    """Периодически прогревает кэш, пока задачу не отменят."""
+    while True:
+        await asyncio.sleep(interval)
+        await warm_up(redis, timeout, wait=False)
+
+
+async def _wait_lock_released(redis: Redis) -> None:
+    while await redis.exists(WARMUP_LOCK_KEY):
+        await asyncio.sleep(LOCK_POLL_INTERVAL_IN_SECONDS)
@@ -0,0 +1,26 @@
+"""Публикует изменения каталога, чтобы воркеры API сбросили кэш.
+
+Пример: python utils/publish_changes.py --films <id> <id> --persons <id>
+"""
+
+import argparse
+import asyncio
+
+import aioredis
+
+from core.config import settings
+from services.invalidation import publish_changes
+
+
+async def main(args: argparse.Namespace):
+    redis = aioredis.from_url(f"redis://{settings.redis_host}:{settings.redis_port}")
+    receivers = await publish_changes(redis, args.films, args.genres, args.persons)
+    print(f"Changes delivered to {receivers} worker(s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Publish catalog changes")
+    parser.add_argument("--films", nargs="*", default=[])
+    parser.add_argument("--genres", nargs="*", default=[])
+    parser.add_argument("--persons", nargs="*", default=[])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,67 @@
+"""Сравнение форматов значений кэша на тестовых документах фильмов.
+
+Для каждого формата измеряется среднее время записи и чтения значения
+и размер значения в байтах. Базовая линия - прежняя схема: json.dumps
+при записи и декодирование UTF-8 (decode_responses=True) + json.loads
+при чтении.
+
+Запуск из каталога tests:
+    PYTHONPATH=.:../movies_fast/src python benchmarks/cache_codecs.py
+"""
+
+import json
+import timeit
+
+from db.codecs import CacheSerializer, CodecError
+from functional.testdata.es_film_data import all_films_data, film_by_id, rating_test_data
+
+ROUNDS = 2000
+PAGE_SIZE = 50
+
+
+class LegacyJson:
+    """Сериализация, которая использовалась до бинарных форматов."""
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    def loads(self, data: bytes):
+        return json.loads(data.decode("utf-8"))
+
+
+def get_serializers() -> dict:
+    serializers = {"json (legacy)": LegacyJson()}
+    for codec in ("orjson", "msgpack"):
+        for compression in (None, "zstd", "lz4"):
+            name = f"{codec}+{compression}" if compression else codec
+            try:
+                serializers[name] = CacheSerializer(codec, compression, compress_min_size=0)
+            except CodecError as e:
+                print(f"{name}: skipped ({e})")
+    return serializers
+
+
+def bench(serializer, value) -> tuple[float, float, int]:
+    data = serializer.dumps(value)
+    encode = timeit.timeit(lambda: serializer.dumps(value), number=ROUNDS) / ROUNDS
+    decode = timeit.timeit(lambda: serializer.loads(data), number=ROUNDS) / ROUNDS
+    return encode * 1e6, decode * 1e6, len(data)
+
+
+def main():
+    datasets = {
+        "single film": film_by_id[0],
+        f"page of {PAGE_SIZE} films": all_films_data[:PAGE_SIZE],
+        "rating test films": rating_test_data,
+    }
+    serializers = get_serializers()
+    for title, value in datasets.items():
+        print(f"\n{title}")
+        print(f"{'format':<16}{'encode, us':>12}{'decode, us':>12}{'bytes':>10}")
+        for name, serializer in serializers.items():
+            encode, decode, size = bench(serializer, value)
+            print(f"{name:<16}{encode:>12.2f}{decode:>12.2f}{size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Стоимость сборки ответа со страницей фильмов из документов индекса.
+
+Прежняя схема: документ -> models.film.Film (персоны с ролями) -> модель
+ответа api.v1.schemas.Film (списки по ролям и имён) -> проверка по
+response_model -> jsonable_encoder. Новая схема - один проход
+Film.from_doc без проверки полей и сериализация ответа напрямую orjson
+(api.v1.http_cache.dumps_response). Время делится на число фильмов.
+
+Запуск из каталога tests:
+    PYTHONPATH=.:../movies_fast/src python benchmarks/film_projection.py
+"""
+
+import timeit
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from api.v1 import schemas
+from api.v1.http_cache import dumps_response
+from functional.testdata.es_film_data import all_films_data
+from models.film import Film
+from models.genre import Genre
+from models.person import Person
+
+ROUNDS = 200
+PAGE_SIZE = 100
+
+
+def legacy_service_film(film: dict) -> Film:
+    """Копия FilmService.prepare_film_result."""
+    genres = [Genre(id=item['id'], name=item['name'], description='') for item in film['genre']]
+    persons = []
+    for role, field in (('actor', 'actors'), ('writer', 'writers'), ('director', 'directors')):
+        for item in film[field]:
+            persons.append(Person(id=item['id'], full_name=item['name'], role=role))
+    return Film(
+        id=film['id'],
+        file_path=None,
+        title=film['title'],
+        description=film['description'],
+        creation_date=None,
+        imdb_rating=film['imdb_rating'],
+        type='',
+        genres=genres,
+        persons=persons,
+        created=None,
+        modified=None,
+    )
+
+
+def legacy_api_film(film: Film) -> schemas.Film:
+    """Копия prepare_film_result из api/v1/films.py."""
+    genres = [item.dict(exclude={'description', 'created', 'modified'}) for item in film.genres]
+    persons = {'actor': [], 'writer': [], 'director': []}
+    names = {'actor': [], 'writer': [], 'director': []}
+    for item in film.persons:
+        persons[item.role].append({'id': item.id, 'name': item.full_name})
+        names[item.role].append(item.full_name)
+    return schemas.Film(
+        id=film.id,
+        imdb_rating=film.imdb_rating,
+        genre=genres,
+        title=film.title,
+        description=film.description,
+        director=names['director'],
+        actors_names=names['actor'],
+        writers_names=names['writer'],
+        actors=persons['actor'],
+        writers=persons['writer'],
+        directors=persons['director'],
+    )
+
+
+def legacy_page(films: list[dict]) -> bytes:
+    result = [legacy_api_film(legacy_service_film(film)) for film in films]
+    # проверка по response_model, которую делал FastAPI
+    result = [schemas.Film.validate(item) for item in result]
+    return orjson.dumps(jsonable_encoder(result))
+
+
+def projected_page(films: list[dict]) -> bytes:
+    return dumps_response([schemas.Film.from_doc(film) for film in films])
+
+
+def main():
+    # в тестовых данных 60 фильмов, страница добирается повтором
+    films = (all_films_data * (PAGE_SIZE // len(all_films_data) + 1))[:PAGE_SIZE]
+    assert orjson.loads(legacy_page(films)) == orjson.loads(projected_page(films))
+    print(f"page of {PAGE_SIZE} films")
+    print(f"{'projection':<12}{'us per film':>14}")
+    for name, func in (("legacy", legacy_page), ("from_doc", projected_page)):
+        elapsed = timeit.timeit(lambda: func(films), number=ROUNDS)
+        print(f"{name:<12}{elapsed / ROUNDS / PAGE_SIZE * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
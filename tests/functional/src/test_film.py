@@ -2,6 +2,7 @@ from urllib.parse import urljoin
 
 import pytest
 
+from functional.settings import service_setting
 from functional.testdata.es_film_data import film_by_id, all_films_data, rating_test_data
 
 pytestmark = pytest.mark.asyncio
@@ -25,6 +26,27 @@ async def test_id_film(make_get_request, es_write_data, query_data, expected_ans
     assert body['id'] == expected_answer['id']
 
 
+async def test_id_film_fields(make_get_request, es_write_data):
+    """Фильм запрашивается из индекса без списков имён (проекция _source),
+    ответ всё равно содержит все поля схемы, а имена собраны из списков персон.
+    """
+    film = film_by_id[0]
+    await es_write_data(film_by_id, 'movies')
+
+    status, body = await make_get_request(urljoin('films/', film['id']))
+
+    assert status == 200
+    assert set(body) == {
+        'id', 'imdb_rating', 'genre', 'title', 'description', 'director',
+        'actors_names', 'writers_names', 'actors', 'writers', 'directors',
+    }
+    assert body['genre'] == film['genre']
+    assert body['actors'] == film['actors']
+    assert body['director'] == [person['name'] for person in film['directors']]
+    assert body['actors_names'] == [person['name'] for person in film['actors']]
+    assert body['writers_names'] == [person['name'] for person in film['writers']]
+
+
 @pytest.mark.parametrize(
     'query_data, expected_answer',
     [
@@ -101,3 +123,22 @@ async def test_all_films(make_get_request, es_write_data, query_data, expected_a
     status, body = await make_get_request('films', query_data)
 
     assert status == expected_answer['status']
+
+
+async def test_all_films_cursor(session, es_write_data):
+    """Обход всех фильмов по курсору: у фильмов одинаковый рейтинг, но ни один
+    не пропадает и не повторяется, на последней странице нет курсора.
+    """
+    await es_write_data(all_films_data, 'movies')
+    url = urljoin(urljoin(f'{service_setting.scheme}://{service_setting.host}:{service_setting.port}',
+                          service_setting.api_version), 'films')
+    film_ids = []
+    cursor = '*'
+    while cursor:
+        async with session.get(url, params={'page[cursor]': cursor, 'page[size]': 25}) as response:
+            assert response.status == 200
+            film_ids += [film['id'] for film in await response.json()]
+            cursor = response.headers.get('X-Next-Cursor')
+
+    assert len(film_ids) == len(set(film_ids))
+    assert {film['id'] for film in all_films_data} <= set(film_ids)
@@ -101,6 +101,26 @@ async def test_films_by_pers_id(make_get_request, del_indices, mov_and_pers_idx)
     assert body[1]["id"] in lucas_film_ids
 
 
+async def test_pers_roles_and_films_fields(make_get_request, redis, del_indices, mov_and_pers_idx):
+    """Роли персоны считаются по id участников фильмов (проекция _source),
+    а в списке фильмов персоны только id, название и рейтинг.
+    """
+    await redis.flushdb()
+    pers_id = persons_data[0]["id"]
+    lucas_film_ids = {pers_film_data[0]["id"], pers_film_data[1]["id"]}
+
+    status, body = await make_get_request(urljoin(f"{HANDLE}/", pers_id))
+
+    assert status == HTTPStatus.OK
+    assert set(body["role"]) == {"director", "writer"}
+    assert set(body["film_ids"]) == lucas_film_ids
+
+    status, body = await make_get_request(f"{HANDLE}/{pers_id}/film")
+
+    assert status == HTTPStatus.OK
+    assert all(set(film) == {"id", "title", "imdb_rating"} for film in body)
+
+
 async def test_films_by_notfound_id(make_get_request, del_indices, mov_and_pers_idx):
     """Тест ищет фильмы несуществующей персоны."""
     status, body = await make_get_request(f"{HANDLE}/{ZERO_UUID}/film")
@@ -0,0 +1,163 @@
+"""Юнит-тесты модулей API без Redis и Elasticsearch.
+
+Запуск из каталога tests:
+    PYTHONPATH=.:../movies_fast/src pytest unit
+"""
+
+import pytest
+
+
+class FakeRedis:
+    """Redis в памяти: строки, сроки жизни ключей (без истечения) и конвейеры."""
+
+    def __init__(self):
+        self.data: dict[str, object] = {}
+        self.expire: dict[str, int] = {}
+        self.published: list[tuple[str, bytes]] = []
+
+    async def get(self, key: str):
+        return self.data.get(key)
+
+    async def mget(self, keys: list[str]) -> list:
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key: str, value, ex: int | None = None, nx: bool = False) -> bool | None:
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        self.expire.pop(key, None)
+        if ex is not None:
+            self.expire[key] = ex
+        return True
+
+    async def pttl(self, key: str) -> int:
+        if key not in self.data:
+            return -2
+        return self.expire[key] * 1000 if key in self.expire else -1
+
+    async def exists(self, *keys: str) -> int:
+        return sum(key in self.data for key in keys)
+
+    async def incr(self, key: str) -> int:
+        value = int(self.data.get(key) or 0) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    async def setbit(self, key: str, offset: int, value: int) -> int:
+        # бит 0 - старший бит первого байта, как в Redis
+        bits = bytearray(self.data.get(key) or b"")
+        bits.extend(b"\0" * (offset // 8 + 1 - len(bits)))
+        old = bits[offset >> 3] >> (7 - (offset & 7)) & 1
+        if value:
+            bits[offset >> 3] |= 0x80 >> (offset & 7)
+        else:
+            bits[offset >> 3] &= ~(0x80 >> (offset & 7)) & 0xFF
+        self.data[key] = bytes(bits)
+        return old
+
+    async def bitop(self, operation: str, dest: str, *keys: str) -> int:
+        assert operation == "OR"
+        values = [self.data.get(key) or b"" for key in keys]
+        length = max(map(len, values), default=0)
+        result = bytearray(length)
+        for value in values:
+            for pos, byte in enumerate(value):
+                result[pos] |= byte
+        self.data[dest] = bytes(result)
+        return length
+
+    async def sadd(self, key: str, *values) -> int:
+        members = self.data.setdefault(key, set())
+        added = {value.encode() if isinstance(value, str) else value for value in values} - members
+        members.update(added)
+        return len(added)
+
+    async def smembers(self, key: str) -> set:
+        return set(self.data.get(key) or ())
+
+    async def delete(self, *keys: str) -> int:
+        found = [key for key in keys if key in self.data]
+        for key in found:
+            del self.data[key]
+            self.expire.pop(key, None)
+        return len(found)
+
+    async def publish(self, channel: str, message: bytes) -> int:
+        self.published.append((channel, message))
+        return 1
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+    def lock(self, name: str, timeout: float | None = None) -> "FakeLock":
+        return FakeLock(self, name)
+
+
+class FakePipeline:
+    """Конвейер FakeRedis: команды копятся и выполняются по execute()."""
+
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands: list[tuple[str, tuple, dict]] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands = []
+
+    def __getattr__(self, command: str):
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self) -> list:
+        commands, self.commands = self.commands, []
+        return [await getattr(self.redis, command)(*args, **kwargs) for command, args, kwargs in commands]
+
+
+class FakeLock:
+    """Блокировка FakeRedis: ключ, занятый через SET NX."""
+
+    def __init__(self, redis: FakeRedis, name: str):
+        self.redis = redis
+        self.name = name
+
+    async def acquire(self, blocking: bool = True) -> bool:
+        return bool(await self.redis.set(self.name, b"token", nx=True))
+
+    async def release(self) -> None:
+        await self.redis.delete(self.name)
+
+
+class FakeElastic:
+    """AsyncElasticsearch, который записывает вызовы и отдаёт заготовленные ответы.
+
+    responses - ответ по имени метода; ответ-исключение вызывается.
+    """
+
+    def __init__(self, **responses):
+        self.responses = responses
+        self.calls: list[tuple[str, dict]] = []
+
+    def __getattr__(self, method: str):
+        async def call(**kwargs):
+            self.calls.append((method, kwargs))
+            response = self.responses.get(method, {})
+            if isinstance(response, Exception):
+                raise response
+            return response(**kwargs) if callable(response) else response
+
+        return call
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def fake_elastic():
+    return FakeElastic
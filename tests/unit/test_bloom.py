@@ -0,0 +1,26 @@
+"""Фильтр Блума."""
+
+from db.bloom import BloomFilter
+
+
+def test_no_false_negatives_and_bounded_error_rate():
+    bloom = BloomFilter.for_capacity(1000, 0.01)
+    members = [f"member-{n}" for n in range(1000)]
+    bloom.update(members)
+
+    assert all(member in bloom for member in members)
+    false_positives = sum(f"other-{n}" in bloom for n in range(10_000))
+    assert false_positives < 10_000 * 0.02
+    assert bloom.estimated_error_rate() < 0.02
+
+
+def test_restored_from_shorter_bits():
+    bloom = BloomFilter(64, 3)
+    bloom.add("1")
+    # строка Redis, дополненная SETBIT, обрывается на последнем установленном бите
+    data = bytes(bloom.bits).rstrip(b"\0")
+
+    restored = BloomFilter(64, 3, data)
+
+    assert restored.bits == bloom.bits
+    assert "1" in restored
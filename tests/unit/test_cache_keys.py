@@ -0,0 +1,100 @@
+"""Ключи кэша с пространствами имён и поколениями."""
+
+import uuid
+
+import pytest
+from aioredis.exceptions import ConnectionError as RedisConError
+
+from db.cache_keys import UNKNOWN_GENERATION, CacheKeys, has_generation
+from db.memory import MemoryCacheStorage
+from db.redis import RedisCacheStorage
+
+
+@pytest.mark.asyncio
+async def test_entity_and_query_keys():
+    keys = CacheKeys(MemoryCacheStorage(), "film")
+    film_id = uuid.uuid4()
+
+    assert await keys.entity(film_id) == f"film:v0:{film_id}"
+    assert await keys.entities(["1", "2"]) == ["film:v0:1", "film:v0:2"]
+    query_key = await keys.query(query="star wars", page=1)
+    # порядок параметров не важен, а поисковая строка попадает в ключ только хэшем
+    assert query_key == await keys.query(page=1, query="star wars")
+    assert query_key != await keys.query(query="star wars", page=2)
+    assert query_key.startswith("film:v0:")
+    assert "star" not in query_key
+
+
+@pytest.mark.asyncio
+async def test_invalidate_changes_every_key():
+    cache = MemoryCacheStorage()
+    keys = CacheKeys(cache, "film")
+    other = CacheKeys(MemoryCacheStorage(), "film")
+    old_key = await keys.entity("1")
+
+    assert await keys.invalidate() == 1
+
+    assert await keys.entity("1") == "film:v1:1"
+    assert old_key != await keys.entity("1")
+    # у другого пространства имён поколение своё
+    assert await CacheKeys(cache, "person").entity("1") == "person:v0:1"
+    assert await other.entity("1") == "film:v0:1"
+
+
+@pytest.mark.asyncio
+async def test_other_worker_sees_generation_after_ttl():
+    cache = MemoryCacheStorage()
+    worker = CacheKeys(cache, "film", generation_ttl=60)
+    assert await worker.entity("1") == "film:v0:1"
+
+    await CacheKeys(cache, "film").invalidate()
+
+    # поколение запомнено на generation_ttl секунд
+    assert await worker.entity("1") == "film:v0:1"
+    worker.forget_generation()
+    assert await worker.entity("1") == "film:v1:1"
+
+
+class BrokenRedis:
+    """Redis, любая команда которого завершается ошибкой соединения."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __getattr__(self, command: str):
+        async def call(*args, **kwargs):
+            self.calls += 1
+            raise RedisConError("Connection refused")
+
+        return call
+
+
+@pytest.mark.asyncio
+async def test_unknown_generation_bypasses_redis():
+    redis = BrokenRedis()
+    storage = RedisCacheStorage(redis)
+    keys = CacheKeys(storage, "film")
+
+    key = await keys.entity("1")
+    calls = redis.calls
+    await storage.save_object(key, {"id": "1"})
+
+    assert key == f"film:{UNKNOWN_GENERATION}:1"
+    assert not has_generation(key)
+    assert await storage.get_object(key) is None
+    assert await keys.invalidate() is None
+    # ключи без поколения в Redis не читаются и не пишутся
+    assert redis.calls == calls + 1
+
+
+@pytest.mark.asyncio
+async def test_failed_read_keeps_last_generation(fake_redis):
+    storage = RedisCacheStorage(fake_redis)
+    keys = CacheKeys(storage, "film", generation_ttl=0)
+    await keys.invalidate()
+    assert await keys.entity("1") == "film:v1:1"
+
+    storage.redis = BrokenRedis()
+
+    assert await storage.get_generation("film") is None
+    assert await keys.entity("1") == "film:v1:1"
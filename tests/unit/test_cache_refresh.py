@@ -0,0 +1,155 @@
+"""Фоновое обновление записей кэша, загрузка при промахе и stale-if-error."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+from core.deadline import DeadlineExceededError, request_deadline
+from services import cache_refresh
+from services.cache_refresh import CacheRefresher
+
+
+def refreshes(namespace: str, kind: str) -> float:
+    return REGISTRY.get_sample_value("cache_refreshes_total", {"namespace": namespace, "kind": kind}) or 0
+
+
+class Loader:
+    """Загрузка, которая длится duration секунд и считает вызовы."""
+
+    def __init__(self, duration: float = 0.01):
+        self.duration = duration
+        self.calls = 0
+
+    async def __call__(self) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.duration)
+        return {"calls": self.calls}
+
+
+@pytest.fixture
+def unlucky(monkeypatch):
+    """Случайное число, при котором XFetch обновляет запись почти наверняка."""
+    monkeypatch.setattr(cache_refresh, "random", SimpleNamespace(random=lambda: 1 - 1e-9))
+
+
+@pytest.mark.asyncio
+async def test_refresh_close_to_expiry(unlucky):
+    refresher = CacheRefresher(beta=1)
+    loader = Loader()
+    # время загрузки пространства имён известно после первой загрузки
+    assert await refresher.load("film", "film:v0:1", loader) == {"calls": 1}
+
+    refresher.hit("film", "film:v0:1", 1000, loader)
+    await asyncio.sleep(0.05)
+    assert loader.calls == 1
+
+    refresher.hit("film", "film:v0:1", 0.1, loader)
+    refresher.hit("film", "film:v0:1", 0.1, loader)
+    await asyncio.sleep(0.05)
+    # одновременные попадания запускают одно обновление
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_no_refresh_without_load_time_or_beta(unlucky):
+    loader = Loader()
+    refresher = CacheRefresher(beta=1)
+    refresher.hit("film", "film:v0:1", 0.1, loader)
+
+    disabled = CacheRefresher(beta=0)
+    await disabled.load("film", "film:v0:1", loader)
+    disabled.hit("film", "film:v0:1", 0.1, loader)
+    await asyncio.sleep(0.05)
+
+    assert loader.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_load():
+    refresher = CacheRefresher()
+    loader = Loader()
+
+    results = await asyncio.gather(*(refresher.load("film", "film:v0:1", loader) for _ in range(3)))
+
+    assert results == [{"calls": 1}] * 3
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_refreshed_in_background():
+    # записи живут 100 секунд, из них последние 60 она устаревшая
+    refresher = CacheRefresher(beta=0, stale_window=60)
+    loader = Loader()
+
+    refresher.hit("film", "film:v0:1", 61, loader)
+    await asyncio.sleep(0.05)
+    assert loader.calls == 0
+
+    refresher.hit("film", "film:v0:1", 59, loader)
+    # запись отдаётся сразу, загрузка идёт в фоне
+    assert len(refresher.single_flight) == 1
+    await asyncio.sleep(0.05)
+    assert loader.calls == 1
+    assert len(refresher.single_flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_background_refresh_is_not_raised(caplog):
+    refresher = CacheRefresher(beta=0, stale_window=60)
+
+    async def loader():
+        raise ConnectionError("elasticsearch is down")
+
+    refresher.hit("film", "film:v0:1", 10, loader)
+    await asyncio.sleep(0.01)
+
+    assert "Background cache refresh failed" in caplog.text
+
+
+async def with_deadline(budget: float, coro):
+    request_deadline.set(time.monotonic() + budget)
+    return await coro
+
+
+@pytest.mark.asyncio
+async def test_load_waiters_keep_own_deadline():
+    refresher = CacheRefresher(beta=0)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return {"id": "1"}
+
+    # первый запрос с маленьким бюджетом не обрывает загрузку для второго
+    short, long = await asyncio.gather(
+        with_deadline(0.02, refresher.load("film", "film:v0:1", loader)),
+        with_deadline(1, refresher.load("film", "film:v0:1", loader)),
+        return_exceptions=True,
+    )
+
+    assert isinstance(short, DeadlineExceededError)
+    assert long == {"id": "1"}
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_load_serves_stale_on_error():
+    refresher = CacheRefresher(beta=0, stale_size=10, stale_ttl=60)
+
+    async def loader():
+        raise ConnectionError("elasticsearch is down")
+
+    refresher.hit("film", "film:v0:1", 100, loader, {"id": "1"})
+    served_stale = refreshes("film", "stale_if_error")
+
+    assert await refresher.load("film", "film:v0:1", loader) == {"id": "1"}
+    assert refreshes("film", "stale_if_error") == served_stale + 1
+    with pytest.raises(ConnectionError):
+        await refresher.load("film", "film:v0:2", loader)
+    refresher.forget(["film:v0:1"])
+    with pytest.raises(ConnectionError):
+        await refresher.load("film", "film:v0:1", loader)
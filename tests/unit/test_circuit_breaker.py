@@ -0,0 +1,90 @@
+"""Переходы состояний предохранителя."""
+
+from types import SimpleNamespace
+
+import pytest
+from elasticsearch import RequestError
+
+from db import circuit_breaker, elastic
+from db.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from db.elastic import ElasticStorage
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Часы модуля circuit_breaker, которые идут только вручную; разброс сроков выключен."""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(circuit_breaker, "random", SimpleNamespace(uniform=lambda low, high: high))
+    return clock
+
+
+def test_opens_after_threshold(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=3, recovery_timeout=10, max_recovery_timeout=60)
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == CLOSED
+    # успех сбрасывает счётчик сбоев подряд
+    breaker.success()
+    breaker.failure()
+    breaker.failure()
+    assert breaker.allow()
+
+    breaker.failure()
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.check()
+    assert error.value.retry_after == 10
+
+
+def test_half_open_lets_one_probe_and_success_closes(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=1, recovery_timeout=10, max_recovery_timeout=60)
+    breaker.failure()
+
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    # зависший пробный запрос не блокирует хранилище навсегда
+    clock.now += 10
+    assert breaker.allow()
+
+    breaker.success()
+
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_for_longer(clock):
+    breaker = CircuitBreaker("elasticsearch", failure_threshold=1, recovery_timeout=10, max_recovery_timeout=30)
+    breaker.failure()
+
+    for timeout in (20, 30, 30):
+        clock.now = breaker.open_until
+        assert breaker.allow()
+        breaker.failure()
+        assert breaker.state == OPEN
+        assert breaker.retry_after() == timeout
+
+    clock.now = breaker.open_until
+    assert breaker.allow()
+    breaker.success()
+    breaker.failure()
+    # после успеха срок снова начинается с recovery_timeout
+    assert breaker.retry_after() == 10
+
+
+@pytest.mark.asyncio
+async def test_bad_request_closes_breaker(clock, monkeypatch, fake_elastic):
+    breaker = CircuitBreaker("elasticsearch", failure_threshold=1, recovery_timeout=10, max_recovery_timeout=60)
+    monkeypatch.setattr(elastic, "breaker", breaker)
+    storage = ElasticStorage(fake_elastic(search=RequestError(400, "parsing_exception", {})))
+    breaker.failure()
+    clock.now += 10
+
+    # пробный запрос получил ответ: хранилище доступно, хоть запрос и неверный
+    with pytest.raises(RequestError):
+        await storage._request("film_search", storage.elastic.search, index="movies", body={})
+
+    assert breaker.state == CLOSED
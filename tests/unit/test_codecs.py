@@ -0,0 +1,47 @@
+"""Заголовок формата значений кэша и чтение старых записей в JSON."""
+
+import json
+
+import pytest
+
+from db.codecs import CacheSerializer, CodecError
+
+FILM = {"id": "1", "title": "Star Wars", "imdb_rating": 8.6, "genre": ["Sci-Fi"] * 200}
+
+
+@pytest.mark.parametrize("codec", ["orjson", "msgpack"])
+@pytest.mark.parametrize("compression", [None, "zstd", "lz4"])
+def test_round_trip(codec, compression):
+    serializer = CacheSerializer(codec, compression, compress_min_size=1024)
+    data = serializer.dumps(FILM)
+
+    assert data[0] == serializer.codec.id | (serializer.compressor.id << 2 if compression else 0)
+    assert serializer.loads(data) == FILM
+    # маленькие значения не сжимаются
+    assert serializer.dumps({"id": "1"})[0] == serializer.codec.id
+
+
+def test_reads_values_written_with_other_settings():
+    written = CacheSerializer("msgpack", "zstd", compress_min_size=0).dumps(FILM)
+
+    assert CacheSerializer("orjson").loads(written) == FILM
+
+
+def test_reads_legacy_json():
+    serializer = CacheSerializer("msgpack", "lz4")
+
+    assert serializer.loads(json.dumps(FILM)) == FILM
+    assert serializer.loads(json.dumps(["1", "2"]).encode()) == ["1", "2"]
+
+
+@pytest.mark.parametrize("data", [b"", b"\x01not json", b"\x1f\x00", b"{broken"])
+def test_broken_value_raises_codec_error(data):
+    with pytest.raises(CodecError):
+        CacheSerializer().loads(data)
+
+
+def test_unknown_settings():
+    with pytest.raises(CodecError):
+        CacheSerializer("pickle")
+    with pytest.raises(CodecError):
+        CacheSerializer("orjson", "gzip")
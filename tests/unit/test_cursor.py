@@ -0,0 +1,74 @@
+"""Курсоры постраничной выдачи: кодирование, разбор и ответы Elasticsearch на курсор."""
+
+import pytest
+from elasticsearch import NotFoundError, RequestError
+
+from db.cursor import CURSOR_START, InvalidCursorError, decode_cursor, encode_cursor
+from db.elastic import ElasticStorage
+
+SORT = [{"imdb_rating": {"order": "desc"}}, {"id": {"order": "asc"}}]
+
+
+def test_round_trip():
+    cursor = encode_cursor([8.6, "3d825f60"], pit_id="pit-1")
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == ([8.6, "3d825f60"], "pit-1")
+    assert decode_cursor(encode_cursor(["3d825f60"]), 1) == (["3d825f60"], None)
+
+
+def test_start_cursor():
+    assert decode_cursor(CURSOR_START, 2) == (None, None)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "e30", encode_cursor("8.6"), "eyJhZnRlciI6W10sInBpdCI6MX0"])
+def test_malformed_cursor(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, 2)
+
+
+def test_wrong_length_cursor():
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(encode_cursor([8.6]), 2)
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(encode_cursor([8.6, "3d825f60", 7]), 2)
+    # в поиске с PIT добавляется значение _shard_doc
+    assert decode_cursor(encode_cursor([8.6, "3d825f60", 7], "pit-1"), 2) == ([8.6, "3d825f60", 7], "pit-1")
+
+
+def search_page(storage: ElasticStorage, cursor: str):
+    return storage._search_after("film_search", "movies", {"size": 10, "sort": list(SORT)}, cursor)
+
+
+@pytest.mark.asyncio
+async def test_cursor_rejected_by_elasticsearch(fake_elastic):
+    storage = ElasticStorage(fake_elastic(search=RequestError(400, "search_phase_execution_exception", {})))
+
+    with pytest.raises(InvalidCursorError):
+        await search_page(storage, encode_cursor(["high", "3d825f60"]))
+    # первая страница без курсора - ошибка самого запроса
+    with pytest.raises(RequestError):
+        await search_page(storage, CURSOR_START)
+
+
+@pytest.mark.asyncio
+async def test_expired_pit_cursor(fake_elastic):
+    storage = ElasticStorage(fake_elastic(search=NotFoundError(404, "search_context_missing_exception", {})))
+
+    with pytest.raises(InvalidCursorError):
+        await search_page(storage, encode_cursor([8.6, "3d825f60", 7], "pit-1"))
+    # без PIT 404 значит, что нет индекса
+    with pytest.raises(NotFoundError):
+        await search_page(storage, encode_cursor([8.6, "3d825f60"]))
+
+
+@pytest.mark.asyncio
+async def test_next_cursor_continues_after_last_hit(fake_elastic):
+    hits = [{"_source": {"id": str(n)}, "sort": [8.6, str(n)]} for n in range(10)]
+    storage = ElasticStorage(fake_elastic(search={"hits": {"hits": hits}}))
+
+    page, next_cursor = await search_page(storage, CURSOR_START)
+    await search_page(storage, next_cursor)
+
+    assert page == hits
+    assert storage.elastic.calls[-1][1]["body"]["search_after"] == [8.6, "9"]
@@ -0,0 +1,131 @@
+"""Бюджет времени запроса: ожидание вызовов, фоновые задачи и middleware."""
+
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+import main
+from core import deadline
+from core.deadline import DeadlineExceededError, DeadlineMiddleware, has_time, request_deadline, wait, without_deadline
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Часы модуля deadline, которые идут только вручную."""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(deadline, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def budget(clock):
+    """Задаёт бюджет текущего запроса в секундах."""
+    yield lambda seconds: request_deadline.set(clock.now + seconds)
+    request_deadline.set(None)
+
+
+class Call:
+    """Вызов хранилища, который отвечает через delay секунд."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.started = self.finished = self.cancelled = False
+
+    async def __call__(self) -> str:
+        self.started = True
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        self.finished = True
+        return "result"
+
+
+def test_has_time(clock, budget):
+    assert has_time(10)
+    budget(1)
+    assert has_time(0.5)
+    clock.now += 0.6
+    assert not has_time(0.5)
+
+
+@pytest.mark.asyncio
+async def test_wait_without_budget():
+    assert await wait(Call(0.01)(), "redis") == "result"
+
+
+@pytest.mark.asyncio
+async def test_wait_does_not_start_after_deadline(clock, budget):
+    budget(1)
+    clock.now += 1
+    call = Call(0)
+
+    with pytest.raises(DeadlineExceededError) as error:
+        await wait(call(), "elasticsearch")
+
+    assert error.value.stage == "elasticsearch"
+    assert not call.started
+
+
+@pytest.mark.asyncio
+async def test_wait_timeout_cancels_call(budget):
+    budget(0.05)
+    call = Call(1)
+
+    with pytest.raises(DeadlineExceededError):
+        await wait(call(), "elasticsearch")
+    await asyncio.sleep(0)
+
+    assert call.cancelled
+
+
+@pytest.mark.asyncio
+async def test_wait_timeout_leaves_call_in_background(budget):
+    budget(0.1)
+    call = Call(0.08)
+
+    # доля бюджета для Redis - 0.04 секунды
+    with pytest.raises(DeadlineExceededError):
+        await wait(call(), "redis", share=0.4, cancel=False)
+    await asyncio.sleep(0.1)
+
+    assert call.finished and not call.cancelled
+
+
+@pytest.mark.asyncio
+async def test_without_deadline_resets_budget_only_in_task(clock, budget):
+    budget(1)
+
+    async def background() -> float | None:
+        return request_deadline.get()
+
+    assert await asyncio.create_task(without_deadline(background)) is None
+    assert request_deadline.get() == clock.now + 1
+
+
+@pytest.mark.asyncio
+async def test_middleware_picks_longest_prefix(clock):
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(request_deadline.get())
+
+    middleware = DeadlineMiddleware(app, default=5, routes={"/api": 2, "/api/v1/films/search": 10})
+
+    for path in ("/metrics", "/api/v1/genres", "/api/v1/films/search"):
+        await middleware({"type": "http", "path": path}, None, None)
+
+    assert seen == [clock.now + 5, clock.now + 2, clock.now + 10]
+    assert request_deadline.get() is None
+    assert DeadlineMiddleware(app).budget("/api") is None
+
+
+@pytest.mark.asyncio
+async def test_deadline_exceeded_is_gateway_timeout():
+    response = await main.deadline_exceeded(None, DeadlineExceededError("elasticsearch"))
+
+    assert response.status_code == 504
+    assert orjson.loads(response.body) == {"detail": "Request deadline exceeded waiting for elasticsearch"}
@@ -0,0 +1,85 @@
+"""ElasticStorage запрашивает у Elasticsearch только нужные поля _source."""
+
+import uuid
+
+import pytest
+
+from db.elastic import (
+    FILM_SOURCE,
+    GENRES_INDEX,
+    ID_NAME_SOURCE,
+    MOVIES_INDEX,
+    PERSON_FILMS_SOURCE,
+    PERSON_ROLES_SOURCE,
+    PERSONS_INDEX,
+    ElasticStorage,
+)
+
+EMPTY_SEARCH = {"hits": {"hits": []}}
+
+
+def search_source(call: dict) -> list[str]:
+    """Поля _source поиска: параметром или в теле запроса."""
+    return call.get("_source", call.get("body", {}).get("_source"))
+
+
+def test_film_query_source():
+    query = ElasticStorage._get_film_query(query="star", filter_genre=uuid.uuid4())
+
+    assert query["_source"] == FILM_SOURCE
+    assert not {"director", "actors_names", "writers_names"} & set(FILM_SOURCE)
+
+
+def test_pers_films_query_source():
+    query = ElasticStorage._get_pers_films_query(uuid.uuid4())
+
+    assert query["_source"] == PERSON_FILMS_SOURCE
+
+
+@pytest.mark.asyncio
+async def test_get_by_id_source(fake_elastic):
+    elastic = fake_elastic(get={"_source": {}}, mget={"docs": []})
+    storage = ElasticStorage(elastic)
+
+    await storage.get_film(uuid.uuid4())
+    await storage.get_genre(uuid.uuid4())
+    await storage.get_persons([uuid.uuid4()])
+
+    assert [(method, call["index"], call["_source"]) for method, call in elastic.calls] == [
+        ("get", MOVIES_INDEX, FILM_SOURCE),
+        ("get", GENRES_INDEX, ID_NAME_SOURCE),
+        ("mget", PERSONS_INDEX, ID_NAME_SOURCE),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_search_source(fake_elastic):
+    elastic = fake_elastic(search=EMPTY_SEARCH)
+    storage = ElasticStorage(elastic)
+    person_id = uuid.uuid4()
+
+    await storage.search_film(query="star")
+    await storage.get_list_genre()
+    await storage.search_person("lucas")
+    await storage.get_pers_films(person_id)
+    await storage.get_person_details(person_id)
+
+    assert [search_source(call) for _, call in elastic.calls] == [
+        FILM_SOURCE,
+        ID_NAME_SOURCE,
+        ID_NAME_SOURCE,
+        PERSON_FILMS_SOURCE,
+        PERSON_ROLES_SOURCE,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_persons_details_source(fake_elastic):
+    elastic = fake_elastic(msearch={"responses": [EMPTY_SEARCH, EMPTY_SEARCH]})
+    storage = ElasticStorage(elastic)
+
+    await storage.get_persons_details([uuid.uuid4(), uuid.uuid4()])
+
+    _, call = elastic.calls[0]
+    bodies = call["body"][1::2]
+    assert [body["_source"] for body in bodies] == [PERSON_ROLES_SOURCE, PERSON_ROLES_SOURCE]
@@ -0,0 +1,143 @@
+"""Фильтр существующих id, общий для воркеров через Redis."""
+
+import pytest
+
+from db import redis as db_redis
+from services import existence_refresh
+from services.existence import ExistenceFilter
+
+IDS = [f"film-{n}" for n in range(100)]
+
+
+def make_filter(ids: list[str]) -> ExistenceFilter:
+    async def id_source():
+        for obj_id in ids:
+            yield obj_id
+
+    return ExistenceFilter("film", id_source, capacity=1000, error_rate=0.01)
+
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch, fake_redis):
+    monkeypatch.setattr(db_redis, "redis", fake_redis)
+    return fake_redis
+
+
+@pytest.mark.asyncio
+async def test_unloaded_filter_lets_every_id_through():
+    id_filter = make_filter(IDS)
+
+    assert not await id_filter.load()
+    assert id_filter.might_contain("missing")
+
+
+@pytest.mark.asyncio
+async def test_built_filter_is_shared_through_redis():
+    assert await make_filter(IDS).build() == len(IDS)
+    worker = make_filter([])
+
+    assert await worker.load()
+    assert all(worker.might_contain(obj_id) for obj_id in IDS)
+    rejected = [obj_id for obj_id in (f"missing-{n}" for n in range(100)) if not worker.might_contain(obj_id)]
+    assert len(rejected) > 90
+
+
+@pytest.mark.asyncio
+async def test_added_ids_reach_other_workers():
+    builder = make_filter(IDS)
+    await builder.build()
+    worker = make_filter([])
+    await worker.load()
+
+    await builder.add(["new-film"])
+    # воркер без права записи меняет только свой фильтр
+    await worker.add(["local-film"], shared=False)
+    await worker.load()
+
+    assert worker.might_contain("new-film")
+    other = make_filter([])
+    await other.load()
+    assert not other.might_contain("local-film")
+
+
+@pytest.mark.asyncio
+async def test_ids_added_before_load_reach_other_workers():
+    await make_filter(IDS).build()
+    # воркер получил уведомление раньше, чем загрузил фильтр
+    await make_filter([]).add(["new-film"])
+    worker = make_filter([])
+
+    assert await worker.load()
+    assert worker.might_contain("new-film")
+    assert all(worker.might_contain(obj_id) for obj_id in IDS)
+
+
+@pytest.mark.asyncio
+async def test_ids_added_before_build_do_not_create_filter():
+    # неполный фильтр из одного id дал бы ложные 404 для всех остальных
+    await make_filter([]).add(["new-film"])
+
+    assert not await make_filter([]).load()
+
+
+@pytest.mark.asyncio
+async def test_ids_added_during_rebuild_are_kept():
+    builder = make_filter(IDS)
+    await builder.build()
+    worker = make_filter([])
+    await worker.load()
+
+    async def id_source():
+        for obj_id in IDS:
+            if obj_id == IDS[50]:
+                # уведомление об изменении пришло посреди прохода по индексу
+                await worker.add(["new-film"])
+            yield obj_id
+
+    builder.id_source = id_source
+    await builder.build()
+    other = make_filter([])
+    await other.load()
+
+    assert other.might_contain("new-film")
+
+
+@pytest.mark.asyncio
+async def test_only_lock_holder_builds_filters(monkeypatch, redis):
+    id_filter = make_filter(IDS)
+
+    async def get_existence_filters():
+        return [id_filter]
+
+    monkeypatch.setattr(existence_refresh, "get_existence_filters", get_existence_filters)
+    await redis.set(existence_refresh.REBUILD_KEY, 1)
+
+    await existence_refresh.refresh_existence_filters(redis, 60)
+    assert not id_filter.loaded
+    assert id_filter.key not in redis.data
+
+    await redis.delete(existence_refresh.REBUILD_KEY)
+    await existence_refresh.refresh_existence_filters(redis, 60)
+    assert id_filter.loaded
+    assert redis.expire[existence_refresh.REBUILD_KEY] == 60
+
+
+@pytest.mark.asyncio
+async def test_failed_build_releases_lock(monkeypatch, redis):
+    async def broken_source():
+        raise ConnectionError("elasticsearch is down")
+        yield
+
+    id_filter = make_filter([])
+    id_filter.id_source = broken_source
+
+    async def get_existence_filters():
+        return [id_filter]
+
+    monkeypatch.setattr(existence_refresh, "get_existence_filters", get_existence_filters)
+
+    await existence_refresh.refresh_existence_filters(redis, 60)
+
+    # следующую попытку сделает любой воркер
+    assert existence_refresh.REBUILD_KEY not in redis.data
+    assert not id_filter.loaded
@@ -0,0 +1,83 @@
+"""Кэш страниц поиска фильмов: список id и фильмы под собственными ключами."""
+
+import uuid
+
+import pytest
+
+from db.memory import MemoryCacheStorage
+from services.film import FILM_CACHE_EXPIRE_IN_SECONDS, FilmService
+
+
+def make_film(title: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "title": title,
+        "description": None,
+        "imdb_rating": 7.5,
+        "genre": [],
+        "actors": [],
+        "writers": [],
+        "directors": [],
+    }
+
+
+class FakeDb:
+    """Хранилище фильмов, которое записывает обращения к себе."""
+
+    def __init__(self, films: list[dict]):
+        self.films = {film["id"]: film for film in films}
+        self.calls: list[tuple] = []
+
+    async def get_film(self, film_id) -> dict | None:
+        self.calls.append(("get_film", str(film_id)))
+        return self.films.get(str(film_id))
+
+    async def get_films(self, film_ids: list[str]) -> list[dict]:
+        self.calls.append(("get_films", list(film_ids)))
+        return [self.films[film_id] for film_id in film_ids if film_id in self.films]
+
+    async def search_film(self, **search_params) -> list[dict]:
+        self.calls.append(("search_film", search_params["query"]))
+        return list(self.films.values())
+
+    async def get_film_ids(self):
+        for film_id in self.films:
+            yield film_id
+
+
+@pytest.fixture
+def cache():
+    return MemoryCacheStorage(expire_timeout=FILM_CACHE_EXPIRE_IN_SECONDS)
+
+
+@pytest.mark.asyncio
+async def test_search_page_reuses_film_entries(cache):
+    star, wars = make_film("Star"), make_film("Wars")
+    db = FakeDb([star, wars])
+    service = FilmService(cache, db)
+
+    first = await service.get_by_query(query="star")
+    second = await service.get_by_query(query="star")
+    # фильм страницы поиска лежит под тем же ключом, что и у ручки фильма
+    film = await service.get_by_id(uuid.UUID(star["id"]))
+
+    assert [item.title for item in first] == [item.title for item in second] == ["Star", "Wars"]
+    assert film.title == "Star"
+    assert db.calls == [("search_film", "star")]
+
+
+@pytest.mark.asyncio
+async def test_search_page_loads_only_missing_films(cache):
+    star, wars = make_film("Star"), make_film("Wars")
+    db = FakeDb([star, wars])
+    service = FilmService(cache, db)
+    await service.get_by_query(query="star")
+
+    # запись фильма вытеснена из кэша, список id остался
+    wars_key = next(key for key in list(cache.data._data) if key.endswith(wars["id"]))
+    cache.data.delete(wars_key)
+    films = await service.get_by_query(query="star")
+
+    assert [item.title for item in films] == ["Star", "Wars"]
+    assert db.calls == [("search_film", "star"), ("get_films", [wars["id"]])]
+    assert await cache.get_object(wars_key) == wars
@@ -0,0 +1,87 @@
+"""Дубли медленных запросов: порог, бюджет дублей и отмена проигравшего."""
+
+import asyncio
+
+import pytest
+
+from db.hedging import Hedger
+
+
+class SlowPrimary:
+    """Запрос, у которого основной вызов отвечает через primary_delay секунд, а дубль - сразу."""
+
+    def __init__(self, primary_delay: float):
+        self.primary_delay = primary_delay
+        self.preferences: list[str | None] = []
+        self.cancelled: list[str | None] = []
+
+    async def __call__(self, preference: str | None) -> str:
+        self.preferences.append(preference)
+        try:
+            if preference is None:
+                await asyncio.sleep(self.primary_delay)
+            return "primary" if preference is None else "hedge"
+        except asyncio.CancelledError:
+            self.cancelled.append(preference)
+            raise
+
+
+async def fast(preference: str | None) -> str:
+    return "primary"
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_before_min_samples():
+    hedger = Hedger(percentile=0.95, min_delay=0.01, max_rate=1, min_samples=2)
+    await hedger.run("film_search", fast)
+    call = SlowPrimary(0.05)
+
+    assert hedger.delay("film_search") is None
+    assert await hedger.run("film_search", call) == "primary"
+    assert call.preferences == [None]
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_and_primary_is_cancelled():
+    hedger = Hedger(percentile=0.95, min_delay=0.01, max_rate=1, min_samples=1)
+    await hedger.run("film_search", fast)
+    call = SlowPrimary(1)
+
+    assert hedger.delay("film_search") == pytest.approx(0.01, abs=0.01)
+    assert await asyncio.wait_for(hedger.run("film_search", call), timeout=0.5) == "hedge"
+    await asyncio.sleep(0)
+    assert call.preferences[0] is None
+    assert call.preferences[1].startswith("hedge-")
+    assert call.cancelled == [None]
+
+
+@pytest.mark.asyncio
+async def test_primary_error_falls_back_to_hedge():
+    hedger = Hedger(percentile=0.95, min_delay=0.01, max_rate=1, min_samples=1)
+    await hedger.run("genre_list", fast)
+
+    async def call(preference: str | None) -> str:
+        if preference is None:
+            await asyncio.sleep(0.02)
+            raise ConnectionError("node is down")
+        await asyncio.sleep(0.05)
+        return "hedge"
+
+    assert await hedger.run("genre_list", call) == "hedge"
+
+
+@pytest.mark.asyncio
+async def test_hedges_are_capped_by_rate():
+    hedger = Hedger(percentile=0.95, min_delay=0.01, max_rate=0.25, min_samples=1)
+    await hedger.run("film_search", fast)
+
+    # токенов набралось 0.5 - дубль не отправляется, ждём основной запрос
+    capped = SlowPrimary(0.03)
+    assert await hedger.run("film_search", capped) == "primary"
+    assert capped.preferences == [None]
+
+    await hedger.run("film_search", fast)
+    # на четвёртом запросе набрался целый токен
+    hedged = SlowPrimary(1)
+    assert await asyncio.wait_for(hedger.run("film_search", hedged), timeout=0.5) == "hedge"
+    assert len(hedged.preferences) == 2
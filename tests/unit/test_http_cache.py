@@ -0,0 +1,90 @@
+"""ETag, Cache-Control, ответы 304 и кэш готовых ответов."""
+
+from http import HTTPStatus
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Request, Response
+
+from api.v1.http_cache import cached_response, conditional_response, etag_matches, make_etag, save_response
+from db.memory import MemoryCacheStorage
+from services.response_cache import ResponseCacheService
+
+
+def make_request(if_none_match: str | None = None, film_id: str = "1", query: bytes = b"") -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": f"/api/v1/films/{film_id}",
+        "headers": headers,
+        "query_string": query,
+        "route": SimpleNamespace(path="/api/v1/films/{film_id}"),
+        "path_params": {"film_id": film_id},
+    })
+
+
+def test_etag_depends_only_on_payload():
+    etag = make_etag({"id": "1", "title": "Star Wars"})
+
+    assert etag == make_etag({"id": "1", "title": "Star Wars"})
+    assert etag != make_etag({"id": "1", "title": "Star Trek"})
+    assert etag.startswith('W/"')
+
+
+def test_etag_matches_weakly():
+    etag = make_etag([1, 2])
+    strong = etag.removeprefix("W/")
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(strong, etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_conditional_response_sets_validators():
+    response = Response()
+
+    assert conditional_response(make_request(), response, {"id": "1"}, max_age=60) is None
+    assert response.headers["ETag"] == make_etag({"id": "1"})
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+
+
+def test_conditional_response_not_modified():
+    etag = make_etag({"id": "1"})
+
+    not_modified = conditional_response(make_request(etag), Response(), {"id": "1"}, max_age=60)
+
+    assert not_modified.status_code == HTTPStatus.NOT_MODIFIED
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.body == b""
+
+
+@pytest.mark.asyncio
+async def test_saved_response_is_served_from_cache():
+    service = ResponseCacheService(MemoryCacheStorage())
+    response = Response()
+    conditional_response(make_request(), response, {"id": "1"}, max_age=60)
+
+    saved = await save_response(make_request(), response, service, {"id": "1"})
+    cached = await cached_response(make_request(query=b"size="), service, max_age=60)
+
+    assert saved.body == cached.body == b'{"id":"1"}'
+    assert cached.headers["ETag"] == response.headers["ETag"]
+    assert await cached_response(make_request(film_id="2"), service, max_age=60) is None
+    # пустые параметры запроса не меняют ключ, остальные - меняют
+    assert await cached_response(make_request(query=b"page=2"), service, max_age=60) is None
+
+
+@pytest.mark.asyncio
+async def test_cached_response_not_modified():
+    service = ResponseCacheService(MemoryCacheStorage())
+    response = Response()
+    conditional_response(make_request(), response, {"id": "1"}, max_age=60)
+    await save_response(make_request(), response, service, {"id": "1"})
+
+    cached = await cached_response(make_request(response.headers["ETag"]), service, max_age=60)
+
+    assert cached.status_code == HTTPStatus.NOT_MODIFIED
@@ -0,0 +1,95 @@
+"""Сброс кэша по уведомлениям об изменениях каталога."""
+
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from db import redis as db_redis
+from db.memory import MemoryCacheStorage
+from services import film, genre, invalidation, person, response_cache
+
+
+class FakeDb:
+    """Хранилище без объектов: сброс кэша в базу не обращается."""
+
+    async def get_film_ids(self):
+        return
+        yield
+
+    get_genre_ids = get_person_ids = get_film_ids
+
+
+@pytest.fixture
+def services(monkeypatch, fake_redis):
+    """Сервисы, которые invalidation находит через get_*, с общим кэшем в памяти."""
+    cache = MemoryCacheStorage()
+    db = FakeDb()
+
+    async def get_cache():
+        return cache
+
+    async def get_db():
+        return db
+
+    for module in (film, genre, person):
+        monkeypatch.setattr(module, "get_redis_cache", get_cache)
+        monkeypatch.setattr(module, "get_elastic_stor", get_db)
+    monkeypatch.setattr(response_cache, "get_redis_cache", get_cache)
+    monkeypatch.setattr(db_redis, "redis", fake_redis)
+    return SimpleNamespace(
+        cache=cache,
+        film=film.get_film_service(cache_db=cache, storage_db=db),
+        genre=genre.get_genre_service(cache_db=cache, storage_db=db),
+        person=person.get_person_service(cache_db=cache, storage_db=db),
+    )
+
+
+@pytest.mark.asyncio
+async def test_changed_film_drops_entity_and_lists(services):
+    film_key = await services.film.film_keys.entity("1")
+    other_key = await services.film.film_keys.entity("2")
+    await services.cache.save_objects({film_key: {"id": "1"}, other_key: {"id": "2"}})
+
+    await invalidation.apply_changes({"id": "m1", "films": ["1"]})
+
+    assert await services.cache.get_objects([film_key, other_key]) == [None, {"id": "2"}]
+    # страницы поиска фильмов и фильмы персон зависят от фильма, жанры - нет
+    assert await services.cache.get_generation(services.film.search_keys.namespace) == 1
+    assert await services.cache.get_generation(services.person.films_keys.namespace) == 1
+    assert await services.cache.get_generation(services.genre.list_keys.namespace) == 0
+
+
+@pytest.mark.asyncio
+async def test_only_first_worker_bumps_generations(services, fake_redis):
+    message = orjson.dumps({"id": "m1", "persons": ["p1"]})
+
+    # сообщение получают все воркеры, поколение увеличивает только первый
+    await invalidation._handle_message(fake_redis, message)
+    await invalidation._handle_message(fake_redis, message)
+
+    assert await services.cache.get_generation(services.person.search_keys.namespace) == 1
+    # новые поколения первый воркер рассылает остальным
+    [(channel, published)] = fake_redis.published
+    assert channel == invalidation.CHANGES_CHANNEL
+    assert orjson.loads(published)["generations"][services.person.search_keys.namespace] == 1
+
+
+@pytest.mark.asyncio
+async def test_other_worker_applies_published_generations(services, fake_redis):
+    namespace = services.person.search_keys.namespace
+    assert (await services.person.search_keys.query(query="lucas")).startswith(f"{namespace}:v0:")
+
+    await invalidation._handle_message(fake_redis, orjson.dumps({"generations": {namespace: 3}}))
+    # старое поколение из запоздавшего сообщения не возвращается
+    await invalidation._handle_message(fake_redis, orjson.dumps({"generations": {namespace: 2}}))
+
+    assert (await services.person.search_keys.query(query="lucas")).startswith(f"{namespace}:v3:")
+    assert fake_redis.published == []
+
+
+@pytest.mark.asyncio
+async def test_malformed_message_is_ignored(services, fake_redis):
+    await invalidation._handle_message(fake_redis, b"not json")
+
+    assert fake_redis.data == {}
@@ -0,0 +1,65 @@
+"""LRU-кэш в памяти процесса."""
+
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+from db import local_cache
+from db.local_cache import LRUCache
+
+
+class Clock:
+    """Часы модуля local_cache, которые идут только вручную."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # подменяется только модуль time в local_cache, часы цикла событий не трогаются
+    monkeypatch.setattr(local_cache, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def metric(name: str, layer: str) -> float:
+    return REGISTRY.get_sample_value(name, {"layer": layer}) or 0
+
+
+def test_lru_expires_by_ttl(clock):
+    cache = LRUCache(max_size=10, ttl=30, layer="test_ttl")
+    cache.set("a", 1)
+    cache.set("a", 2)
+    assert metric("cache_size", "test_ttl") == 1
+
+    clock.now += 20
+    assert cache.get("a") == 2
+
+    clock.now += 10
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert metric("cache_size", "test_ttl") == 0
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = LRUCache(max_size=2, ttl=30, layer="test_lru")
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # обращение делает "a" свежее "b"
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert metric("cache_evictions_total", "test_lru") == 1
+    assert metric("cache_size", "test_lru") == 2
+
+    cache.delete("a")
+    cache.clear()
+    assert metric("cache_size", "test_lru") == 0
@@ -0,0 +1,64 @@
+"""Хранилище кэша в памяти процесса и двухуровневый кэш поверх него."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from db import local_cache
+from db.local_cache import LocalCacheStorage
+from db.memory import MemoryCacheStorage
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Часы модуля local_cache, которые идут только вручную."""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(local_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_returns_copies(clock):
+    storage = MemoryCacheStorage(expire_timeout=60)
+    await storage.save_object("1", {"id": "1", "genre": ["Drama"]})
+
+    film = await storage.get_object("1")
+    film["genre"].append("Comedy")
+
+    assert await storage.get_object("1") == {"id": "1", "genre": ["Drama"]}
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_per_key_expire(clock):
+    storage = MemoryCacheStorage(expire_timeout=60)
+    await storage.save_objects({"a": {"id": "a"}, "b": {"id": "b"}}, expire={"a": 5})
+
+    clock.now += 10
+    assert await storage.get_objects(["a", "b"]) == [None, {"id": "b"}]
+
+    clock.now += 50
+    assert await storage.get_objects(["a", "b"]) == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_lists(clock):
+    storage = MemoryCacheStorage()
+    await storage.save_list_objects("films_page:1", [{"id": "1"}, {"id": "2"}])
+
+    assert await storage.get_list_objects("films_page:1") == [{"id": "1"}, {"id": "2"}]
+    assert await storage.get_list_objects("films_page:2") is None
+
+
+@pytest.mark.asyncio
+async def test_local_cache_serves_from_memory(clock):
+    backend = MemoryCacheStorage(expire_timeout=60)
+    storage = LocalCacheStorage(backend, max_size=10, ttl=5)
+    await backend.save_object("1", {"id": "1"})
+
+    assert await storage.get_object("1") == {"id": "1"}
+    # запись осталась в L1, хотя в L2 её уже нет
+    backend.data.clear()
+    assert await storage.get_object("1") == {"id": "1"}
+
+    clock.now += 5
+    assert await storage.get_object("1") is None
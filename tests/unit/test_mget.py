@@ -0,0 +1,65 @@
+"""Загрузка объектов по id пачками через _mget."""
+
+import asyncio
+
+import pytest
+
+from db.mget import MgetLoader, request_docs
+
+
+async def request(query, method, hedge=False, **kwargs):
+    """Вызов Elasticsearch без метрик и повторов ElasticStorage._request."""
+    return await method(**kwargs)
+
+
+def mget_response(ids):
+    def mget(index, body, _source):
+        return {"docs": [
+            {"_id": obj_id, "found": obj_id in ids, "_source": {"id": obj_id}} for obj_id in body["ids"]
+        ]}
+
+    return mget
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_share_one_mget(fake_elastic):
+    elastic = fake_elastic(mget=mget_response({"1", "2"}))
+    loader = MgetLoader(elastic, request)
+
+    first, second, missing, again = await asyncio.gather(
+        loader.load("movies", "1", ["id"]),
+        loader.load("movies", "2", ["id"]),
+        loader.load("movies", "3", ["id"]),
+        loader.load("movies", "1", ["id"]),
+    )
+
+    assert (first, second, missing, again) == ({"id": "1"}, {"id": "2"}, None, {"id": "1"})
+    assert len(elastic.calls) == 1
+    assert elastic.calls[0][1]["body"] == {"ids": ["1", "2", "3"]}
+
+
+@pytest.mark.asyncio
+async def test_batches_split_by_index_and_source(fake_elastic):
+    elastic = fake_elastic(mget=mget_response({"1"}))
+    loader = MgetLoader(elastic, request)
+
+    await asyncio.gather(
+        loader.load("movies", "1", ["id"]),
+        loader.load("movies", "1", ["id", "title"]),
+        loader.load("genres", "1", ["id"]),
+    )
+
+    assert sorted((kwargs["index"], tuple(kwargs["_source"])) for _, kwargs in elastic.calls) == [
+        ("genres", ("id",)), ("movies", ("id",)), ("movies", ("id", "title")),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_request_cache_skips_repeated_mget(fake_elastic):
+    elastic = fake_elastic(mget=mget_response({"1"}))
+    loader = MgetLoader(elastic, request)
+    request_docs.set({})
+
+    assert await loader.load_many("movies", ["1", "2"], ["id"]) == [{"id": "1"}, None]
+    assert await loader.load_many("movies", ["2", "1"], ["id"]) == [None, {"id": "1"}]
+    assert len(elastic.calls) == 1
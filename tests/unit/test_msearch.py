@@ -0,0 +1,59 @@
+"""Пачки поисков через _msearch: ошибки отдельных поисков и размер пачки."""
+
+import asyncio
+
+import pytest
+from elasticsearch import ConnectionError as ESConnectionError, NotFoundError
+
+from db.msearch import SearchBatcher
+
+
+@pytest.mark.asyncio
+async def test_error_goes_only_to_its_search(fake_elastic):
+    elastic = fake_elastic(msearch={"responses": [
+        {"hits": {"hits": []}, "status": 200},
+        {"error": {"type": "index_not_found_exception"}, "status": 404},
+    ]})
+    batcher = SearchBatcher(elastic, window=0.01, max_batch=10)
+
+    found, missing = await asyncio.gather(
+        batcher.search("movies", {"query": {"match_all": {}}}),
+        batcher.search("persons", {"query": {"match_all": {}}}),
+        return_exceptions=True,
+    )
+
+    assert found == {"hits": {"hits": []}, "status": 200}
+    assert isinstance(missing, NotFoundError)
+    assert missing.error == "index_not_found_exception"
+    # оба поиска ушли одним запросом
+    assert len(elastic.calls) == 1
+    assert elastic.calls[0][1]["body"] == [
+        {"index": "movies"}, {"query": {"match_all": {}}},
+        {"index": "persons"}, {"query": {"match_all": {}}},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_sent_without_waiting(fake_elastic):
+    elastic = fake_elastic(msearch=lambda body: {"responses": [{"n": n} for n in range(len(body) // 2)]})
+    # окно больше таймаута: ответ может прийти только из-за max_batch
+    batcher = SearchBatcher(elastic, window=10, max_batch=2)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.search("movies", {}), batcher.search("movies", {})), timeout=1,
+    )
+
+    assert results == [{"n": 0}, {"n": 1}]
+    assert len(batcher) == 0
+
+
+@pytest.mark.asyncio
+async def test_request_error_goes_to_every_search(fake_elastic):
+    elastic = fake_elastic(msearch=ESConnectionError("N/A", "refused", None))
+    batcher = SearchBatcher(elastic, window=0.01, max_batch=10)
+
+    results = await asyncio.gather(
+        batcher.search("movies", {}), batcher.search("genres", {}), return_exceptions=True,
+    )
+
+    assert all(isinstance(result, ESConnectionError) for result in results)
@@ -0,0 +1,48 @@
+"""Детали нескольких персон одним запросом _msearch."""
+
+import uuid
+
+import pytest
+
+from db.elastic import ElasticStorage
+
+
+def film_hit(film_id: str, actors=(), writers=(), directors=()) -> dict:
+    def persons(ids):
+        return [{"id": str(pers_id), "name": "name"} for pers_id in ids]
+
+    return {"_id": film_id, "_source": {
+        "actors": persons(actors), "writers": persons(writers), "directors": persons(directors),
+    }}
+
+
+@pytest.mark.asyncio
+async def test_persons_details_in_one_msearch(fake_elastic):
+    lucas, ford, missing = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    elastic = fake_elastic(msearch={"responses": [
+        {"hits": {"hits": [
+            film_hit("sw", writers=[lucas], directors=[lucas]),
+            film_hit("thx", directors=[lucas]),
+        ]}},
+        {"hits": {"hits": [film_hit("sw", actors=[ford])]}},
+        {"error": {"type": "search_phase_execution_exception"}, "status": 500},
+    ]})
+    storage = ElasticStorage(elastic)
+
+    details = await storage.get_persons_details([lucas, ford, missing])
+
+    assert [method for method, _ in elastic.calls] == ["msearch"]
+    assert len(elastic.calls[0][1]["body"]) == 6
+    assert sorted(details[str(lucas)]["role"]) == ["director", "writer"]
+    assert sorted(details[str(lucas)]["film_ids"]) == ["sw", "thx"]
+    assert details[str(ford)] == {"role": ["actor"], "film_ids": ["sw"]}
+    # ошибка поиска одной персоны не мешает остальным
+    assert str(missing) not in details
+
+
+@pytest.mark.asyncio
+async def test_no_persons_no_request(fake_elastic):
+    elastic = fake_elastic()
+
+    assert await ElasticStorage(elastic).get_persons_details([]) == {}
+    assert elastic.calls == []
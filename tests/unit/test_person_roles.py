@@ -0,0 +1,176 @@
+"""Индекс ролей персон: сборка документов и очередь пересборки между воркерами."""
+
+import asyncio
+
+import pytest
+from aioredis.exceptions import ConnectionError as RedisConError
+
+from db import redis as db_redis
+from db.elastic import PERSON_ROLES_INDEX, ElasticStorage
+from services import person, person_roles
+from services.person_roles import BUILDING_KEY, REBUILD_KEY, UPDATED_KEY, rebuild_person_roles
+
+FILMS = [
+    {"_id": "f1", "_source": {"actors": [{"id": "p1"}, {"id": "p2"}], "writers": [], "directors": [{"id": "p1"}]}},
+    {"_id": "f2", "_source": {"actors": [{"id": "p1"}], "writers": [{"id": "p2"}]}},
+]
+
+
+@pytest.fixture
+def storage(fake_elastic, monkeypatch):
+    """ElasticStorage со scroll по FILMS и записью документов ролей в storage.saved."""
+    storage = ElasticStorage(fake_elastic())
+    storage.elastic.indices = fake_elastic(get_alias={"person_roles_1": {}}, exists_alias=True)
+    storage.queries = []
+    storage.saved = []
+
+    async def scan(index_name, query=None):
+        storage.queries.append(query)
+        for hit in FILMS:
+            yield hit
+
+    async def index_person_roles(index_name, roles):
+        storage.saved.append((index_name, roles))
+        return len(roles)
+
+    async def get_elastic_stor():
+        return storage
+
+    monkeypatch.setattr(storage, "_scan", scan)
+    monkeypatch.setattr(storage, "_index_person_roles", index_person_roles)
+    monkeypatch.setattr(person, "get_elastic_stor", get_elastic_stor)
+    return storage
+
+
+@pytest.fixture
+def redis(monkeypatch, fake_redis):
+    monkeypatch.setattr(db_redis, "redis", fake_redis)
+    return fake_redis
+
+
+@pytest.mark.asyncio
+async def test_build_collects_roles_and_switches_alias(storage):
+    assert await storage.build_person_roles() == 2
+
+    (index_name, roles), = storage.saved
+    assert index_name.startswith(f"{PERSON_ROLES_INDEX}_")
+    assert roles == {
+        "p1": {"role": ["actor", "director"], "film_ids": ["f1", "f2"]},
+        "p2": {"role": ["actor", "writer"], "film_ids": ["f1", "f2"]},
+    }
+    method, kwargs = storage.elastic.indices.calls[-1]
+    assert method == "update_aliases"
+    assert kwargs["body"]["actions"] == [
+        {"add": {"index": index_name, "alias": PERSON_ROLES_INDEX}},
+        {"remove_index": {"index": "person_roles_1"}},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_update_reads_films_of_all_persons_in_one_scroll(storage):
+    assert await storage.update_person_roles(["p2", "p3"]) == 2
+
+    assert len(storage.queries) == 1
+    terms = [clause["nested"]["query"]["terms"] for clause in storage.queries[0]["query"]["bool"]["should"]]
+    assert terms == [{"actors.id": ["p2", "p3"]}, {"writers.id": ["p2", "p3"]}, {"directors.id": ["p2", "p3"]}]
+    assert storage.saved == [(PERSON_ROLES_INDEX, {
+        "p2": {"role": ["actor", "writer"], "film_ids": ["f1", "f2"]},
+        "p3": {"role": [], "film_ids": []},
+    })]
+
+
+@pytest.mark.asyncio
+async def test_failed_build_deletes_new_index(storage):
+    async def updated_ids():
+        raise RedisConError("refused")
+
+    with pytest.raises(RedisConError):
+        await storage.build_person_roles(updated_ids)
+
+    created = storage.elastic.indices.calls[0][1]["index"]
+    assert storage.elastic.indices.calls[-1] == ("delete", {"index": created, "ignore": [404]})
+    assert all(method != "update_aliases" for method, _ in storage.elastic.indices.calls)
+
+
+@pytest.mark.asyncio
+async def test_rebuild_only_by_key_holder(storage, redis):
+    await redis.set(REBUILD_KEY, 1)
+
+    await rebuild_person_roles(redis, 60)
+    assert storage.saved == []
+
+    await redis.delete(REBUILD_KEY)
+    await rebuild_person_roles(redis, 60)
+    assert len(storage.saved) == 1
+    # ключ остаётся до следующей пересборки
+    assert redis.expire[REBUILD_KEY] == 60
+    assert BUILDING_KEY not in redis.data
+
+
+@pytest.mark.asyncio
+async def test_updates_during_rebuild_reach_new_index(storage, redis, monkeypatch):
+    service = person.PersonService(None, storage)
+    build = storage.build_person_roles
+
+    async def build_with_update(updated_ids):
+        # другой воркер пересчитывает персону, пока идёт проход по фильмам
+        await person_roles.update_roles(service, ["p2"], [])
+        return await build(updated_ids)
+
+    monkeypatch.setattr(storage, "build_person_roles", build_with_update)
+
+    await rebuild_person_roles(redis, 60)
+
+    (old_index, _), (new_index, _), (replayed_index, replayed) = storage.saved
+    assert old_index == PERSON_ROLES_INDEX
+    assert replayed_index == new_index != PERSON_ROLES_INDEX
+    assert list(replayed) == ["p2"]
+    # пересчёт после переключения псевдонима пишется в него напрямую
+    await person_roles.update_roles(service, ["p1"], [])
+    assert storage.saved[-1][0] == PERSON_ROLES_INDEX
+    assert UPDATED_KEY not in redis.data
+
+
+@pytest.mark.asyncio
+async def test_failed_rebuild_releases_key(storage, redis, monkeypatch, caplog):
+    async def broken_build(updated_ids):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(storage, "build_person_roles", broken_build)
+
+    await rebuild_person_roles(redis, 60)
+
+    assert REBUILD_KEY not in redis.data
+    assert BUILDING_KEY not in redis.data
+    assert "Person roles index build failed" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_redis_errors_are_logged(storage, caplog):
+    class BrokenRedis:
+        async def set(self, *args, **kwargs):
+            raise RedisConError("refused")
+
+    await rebuild_person_roles(BrokenRedis(), 60)
+
+    assert storage.saved == []
+    assert "refused" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_periodic_rebuild_survives_errors(monkeypatch, caplog):
+    checks = []
+
+    async def broken_rebuild(redis, rebuild_interval):
+        checks.append(rebuild_interval)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(person_roles, "rebuild_person_roles", broken_rebuild)
+    monkeypatch.setattr(person_roles, "REBUILD_CHECK_INTERVAL_IN_SECONDS", 0.01)
+
+    task = asyncio.create_task(person_roles.rebuild_person_roles_periodically(None, 60))
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+    assert len(checks) > 1
+    assert "Person roles rebuild check failed" in caplog.text
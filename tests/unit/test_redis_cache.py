@@ -0,0 +1,55 @@
+"""Запись и чтение объектов кэша в Redis."""
+
+import pytest
+
+from db.redis import RedisCacheStorage
+
+
+@pytest.mark.asyncio
+async def test_save_objects_sets_expire_per_key(fake_redis):
+    storage = RedisCacheStorage(fake_redis, expire_timeout=300)
+
+    await storage.save_objects({"a": {"id": "a"}, "b": {"id": "b"}}, expire={"a": 10})
+
+    assert fake_redis.expire == {"a": 10, "b": 300}
+    assert await storage.get_objects(["a", "c", "b"]) == [{"id": "a"}, None, {"id": "b"}]
+
+
+@pytest.mark.asyncio
+async def test_save_objects_uses_one_pipeline(fake_redis):
+    pipelines = []
+    pipeline = fake_redis.pipeline
+
+    def record_pipeline(transaction=True):
+        pipelines.append(transaction)
+        return pipeline(transaction)
+
+    fake_redis.pipeline = record_pipeline
+    storage = RedisCacheStorage(fake_redis)
+
+    await storage.save_objects({str(n): {"id": n} for n in range(5)})
+    await storage.save_objects({})
+
+    assert pipelines == [False]
+    assert await storage.get_object("3") == {"id": 3}
+
+
+@pytest.mark.asyncio
+async def test_expire_jitter_shortens_ttl(fake_redis):
+    storage = RedisCacheStorage(fake_redis, expire_timeout=1000, expire_jitter=0.1)
+
+    await storage.save_objects({str(n): {"id": n} for n in range(50)})
+
+    assert all(900 <= ttl <= 1000 for ttl in fake_redis.expire.values())
+    assert len(set(fake_redis.expire.values())) > 1
+
+
+@pytest.mark.asyncio
+async def test_get_with_ttl(fake_redis):
+    storage = RedisCacheStorage(fake_redis)
+    await storage.save_object("1", {"id": "1"})
+    await fake_redis.set("persistent", await fake_redis.get("1"))
+
+    assert await storage.get_with_ttl("1") == ({"id": "1"}, 300)
+    assert await storage.get_with_ttl("persistent") == ({"id": "1"}, None)
+    assert await storage.get_with_ttl("missing") == (None, None)
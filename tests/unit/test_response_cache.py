@@ -0,0 +1,39 @@
+"""Кэш готовых ответов ручек."""
+
+import pytest
+
+from db.memory import MemoryCacheStorage
+from services.response_cache import ResponseCacheService
+
+
+@pytest.mark.asyncio
+async def test_saved_response():
+    service = ResponseCacheService(MemoryCacheStorage())
+
+    await service.save("/films/{film_id}", {"film_id": "1"}, '"abc"', b'{"id": "1"}\n')
+
+    assert await service.get("/films/{film_id}", {"film_id": "1"}) == ('"abc"', b'{"id": "1"}\n')
+    assert await service.get("/films/{film_id}", {"film_id": "2"}) is None
+
+
+@pytest.mark.asyncio
+async def test_disabled_cache_stores_nothing():
+    cache = MemoryCacheStorage()
+    service = ResponseCacheService(cache, enabled=False)
+
+    await service.save("/films/{film_id}", {"film_id": "1"}, '"abc"', b"{}")
+
+    assert await service.get("/films/{film_id}", {"film_id": "1"}) is None
+    assert len(cache.data) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data", [b'"abc"', b"\n{}", b"\xff\xfe\n{}"])
+async def test_malformed_response_is_miss(data):
+    cache = MemoryCacheStorage()
+    service = ResponseCacheService(cache)
+    key = await service.keys.query(route="/films", params={})
+    await cache.save_bytes(key, data)
+
+    assert await service.get("/films", {}) is None
+    assert await cache.get_bytes(key) is None
@@ -0,0 +1,43 @@
+"""Сборка ответа по фильму из документа индекса за один проход."""
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from api.v1.http_cache import dumps_response
+from api.v1.schemas import Film
+
+DOC = {
+    "id": "3d825f60-9fff-4dfe-b294-1a45fa1e115d",
+    "imdb_rating": 8,
+    "genre": [{"id": "120a21cf-9097-479e-904a-13dd7198c1dd", "name": "Adventure"}],
+    "title": "Star Wars",
+    "description": None,
+    "actors": [{"id": "26e83050-29ef-4163-a99d-b546cac208f8", "name": "Mark Hamill"}],
+    "writers": [],
+    "directors": [{"id": "a5a8f573-3cee-4ccc-8a2b-91cb9f55250a", "name": "George Lucas"}],
+}
+
+
+def test_from_doc_matches_validated_model():
+    film = Film.from_doc(DOC)
+    expected = Film(
+        **DOC,
+        director=["George Lucas"],
+        actors_names=["Mark Hamill"],
+        writers_names=[],
+    )
+
+    # целый рейтинг без проверки полей тоже становится float
+    assert film.imdb_rating == 8.0
+    assert film.director == ["George Lucas"]
+    assert dumps_response(film) == orjson.dumps(jsonable_encoder(expected))
+
+
+def test_dumps_response_page():
+    films = [Film.from_doc(DOC), Film.from_doc({**DOC, "imdb_rating": None})]
+
+    body = orjson.loads(dumps_response(films))
+
+    assert [item["imdb_rating"] for item in body] == [8.0, None]
+    assert body[0]["actors"] == [{"id": "26e83050-29ef-4163-a99d-b546cac208f8", "name": "Mark Hamill"}]
+    assert body[0]["genre"][0]["id"] == "120a21cf-9097-479e-904a-13dd7198c1dd"
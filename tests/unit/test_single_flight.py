@@ -0,0 +1,60 @@
+"""Объединение одновременных вызовов по ключу."""
+
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def func():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flight.do("key", func) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert calls == 1
+    # после завершения ключ освобождается, следующий вызов - новый
+    assert len(flight) == 0
+    assert await flight.do("key", func) == 2
+
+
+@pytest.mark.asyncio
+async def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+
+    async def func():
+        await asyncio.sleep(0.01)
+        raise ValueError("broken")
+
+    results = await asyncio.gather(
+        flight.do("key", func), flight.do("key", func), return_exceptions=True,
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_call():
+    flight = SingleFlight()
+
+    async def func():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    first = asyncio.ensure_future(flight.do("key", func))
+    second = asyncio.ensure_future(flight.do("key", func))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "done"
+    assert first.cancelled()
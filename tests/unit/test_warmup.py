@@ -0,0 +1,52 @@
+"""Прогрев кэша одним воркером под блокировкой в Redis."""
+
+import asyncio
+
+import pytest
+
+from services import warmup
+
+
+@pytest.fixture
+def warmed(monkeypatch):
+    """Подменяет сам прогрев: тесты проверяют только работу с блокировкой."""
+    calls = []
+
+    async def warm_up_cache():
+        calls.append(1)
+
+    monkeypatch.setattr(warmup, "warm_up_cache", warm_up_cache)
+    monkeypatch.setattr(warmup, "LOCK_POLL_INTERVAL_IN_SECONDS", 0.01)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_lock_holder_warms_up_and_releases(fake_redis, warmed):
+    await warmup.warm_up(fake_redis, timeout=1)
+
+    assert warmed == [1]
+    assert not await fake_redis.exists(warmup.WARMUP_LOCK_KEY)
+
+
+@pytest.mark.asyncio
+async def test_other_worker_waits_for_warm_up(fake_redis, warmed):
+    await fake_redis.set(warmup.WARMUP_LOCK_KEY, b"token")
+
+    task = asyncio.ensure_future(warmup.warm_up(fake_redis, timeout=1))
+    await asyncio.sleep(0.05)
+    assert not task.done()
+    await fake_redis.delete(warmup.WARMUP_LOCK_KEY)
+    await asyncio.wait_for(task, timeout=0.5)
+
+    assert warmed == []
+
+
+@pytest.mark.asyncio
+async def test_waiting_is_bounded_by_timeout(fake_redis, warmed):
+    await fake_redis.set(warmup.WARMUP_LOCK_KEY, b"token")
+
+    await asyncio.wait_for(warmup.warm_up(fake_redis, timeout=0.05), timeout=0.5)
+    # периодический прогрев не ждёт чужой блокировки вовсе
+    await asyncio.wait_for(warmup.warm_up(fake_redis, timeout=10, wait=False), timeout=0.5)
+
+    assert warmed == []